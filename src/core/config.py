@@ -8,10 +8,27 @@ from policy.PolicyFactory import *
 
 
 import logging
+import os
 import sys
 
 
 
+DEFAULT_MIN_SOAP_BUFLEN = 4096
+DEFAULT_MAX_SOAP_BUFLEN = 4194304
+DEFAULT_CACHE_DIR = os.path.expanduser (os.path.join ('~', '.ifoldercache'))
+DEFAULT_CACHE_TTL = 86400
+DEFAULT_READAHEAD = 4
+DEFAULT_CONNECTIONS = 8
+DEFAULT_KEEPALIVE = 30
+DEFAULT_TRANSFERS = 4
+DEFAULT_RETRIES = 3
+DEFAULT_HASH_BUFLEN = 1048576
+DEFAULT_HASHERS = 4
+DEFAULT_DEBOUNCE = 2.0
+DEFAULT_INTERVAL = 60
+
+
+
 LEVELS = {
     'DEBUG' : logging.DEBUG,
     'INFO' : logging.INFO,
@@ -87,6 +104,124 @@ class ConfigManager ():
                 '[ default : %default ]',
             default=soapbuflen)
 
+        self.parser.add_option (
+            '--adaptive',
+            action='store_true',
+            dest='adaptive',
+            help='Grow or shrink the SOAP buffer during each ' \
+                'download/upload, according to the measured ' \
+                'throughput, starting from `SOAPBUFLEN\' bytes ' \
+                '[ default : %default ]',
+            default=False)
+
+        self.parser.add_option (
+            '--minsoapbuflen',
+            action='store',
+            type='int',
+            dest='minsoapbuflen',
+            help='Never shrink the SOAP buffer below ' \
+                '`MINSOAPBUFLEN\' bytes while running with the ' \
+                '`--adaptive\' switch [ default : %default ]',
+            default=DEFAULT_MIN_SOAP_BUFLEN)
+
+        self.parser.add_option (
+            '--maxsoapbuflen',
+            action='store',
+            type='int',
+            dest='maxsoapbuflen',
+            help='Never grow the SOAP buffer above ' \
+                '`MAXSOAPBUFLEN\' bytes while running with the ' \
+                '`--adaptive\' switch [ default : %default ]',
+            default=DEFAULT_MAX_SOAP_BUFLEN)
+
+        self.parser.add_option (
+            '--connections',
+            action='store',
+            type='int',
+            dest='connections',
+            help='Keep up to `CONNECTIONS\' idle connections open ' \
+                'to the iFolder server [ default : %default ]',
+            default=DEFAULT_CONNECTIONS)
+
+        self.parser.add_option (
+            '--keepalive',
+            action='store',
+            type='int',
+            dest='keepalive',
+            help='Close the connections to the iFolder server once ' \
+                'idle for `KEEPALIVE\' seconds, 0 to open a new ' \
+                'connection for each request [ default : %default ]',
+            default=DEFAULT_KEEPALIVE)
+
+        self.parser.add_option (
+            '--readahead',
+            action='store',
+            type='int',
+            dest='readahead',
+            help='Encode up to `READAHEAD\' chunks of a file ahead ' \
+                'of the ones being uploaded, 0 to disable ' \
+                '[ default : %default ]',
+            default=DEFAULT_READAHEAD)
+
+        self.parser.add_option (
+            '--transfers',
+            action='store',
+            type='int',
+            dest='transfers',
+            help='Run up to `TRANSFERS\' downloads/uploads ' \
+                'concurrently [ default : %default ]',
+            default=DEFAULT_TRANSFERS)
+
+        self.parser.add_option (
+            '--retries',
+            action='store',
+            type='int',
+            dest='retries',
+            help='Restart up to `RETRIES\' times a download/upload ' \
+                'interrupted by a connection error ' \
+                '[ default : %default ]',
+            default=DEFAULT_RETRIES)
+
+        self.parser.add_option (
+            '--hashbuflen',
+            action='store',
+            type='int',
+            dest='hashbuflen',
+            help='Read up to `HASHBUFLEN\' bytes at a time ' \
+                'while computing the digest of a file ' \
+                '[ default : %default ]',
+            default=DEFAULT_HASH_BUFLEN)
+
+        self.parser.add_option (
+            '--hashers',
+            action='store',
+            type='int',
+            dest='hashers',
+            help='Compute up to `HASHERS\' file digests ' \
+                'concurrently while looking for local changes ' \
+                '[ default : %default ]',
+            default=DEFAULT_HASHERS)
+
+        self.parser.add_option (
+            '--debounce',
+            action='store',
+            type='float',
+            dest='debounce',
+            help='While running the `watch\' action, commit the ' \
+                'local changes once no more changes are seen for ' \
+                '`DEBOUNCE\' seconds [ default : %default ]',
+            default=DEFAULT_DEBOUNCE)
+
+        self.parser.add_option (
+            '--interval',
+            action='store',
+            type='int',
+            dest='interval',
+            help='While running the `watch\' action, look for ' \
+                'remote changes every `INTERVAL\' seconds ' \
+                '[ default : %default ]',
+            default=DEFAULT_INTERVAL)
+
         self.parser.add_option (
             '--config',
             action='store',
@@ -96,6 +231,34 @@ class ConfigManager ():
                 '`CONFIGFILE\' [ default : %default ]',
             default=configfile)
 
+        self.parser.add_option (
+            '--cachedir',
+            action='store',
+            type='string',
+            dest='cachedir',
+            help='Keep the parsed iFolder WSDL within ' \
+                '`CACHEDIR\' [ default : %default ]',
+            default=DEFAULT_CACHE_DIR)
+
+        self.parser.add_option (
+            '--cachettl',
+            action='store',
+            type='int',
+            dest='cachettl',
+            help='Use the cached iFolder WSDL for up to `CACHETTL\' ' \
+                'seconds before checking whether it changed on the ' \
+                'server [ default : %default ]',
+            default=DEFAULT_CACHE_TTL)
+
+        self.parser.add_option (
+            '--lean',
+            action='store_true',
+            dest='lean',
+            help='Hold the entries listed by the iFolder server as ' \
+                'compact records rather than suds objects, to save ' \
+                'memory on large iFolders [ default : %default ]',
+            default=False)
+
         self.parser.add_option (
             '--pathtodb',
             action='store',
@@ -165,7 +328,8 @@ class ConfigManager ():
         return [
             'checkout',
             'update',
-            'commit'
+            'commit',
+            'watch'
             ]
 
 
@@ -210,6 +374,81 @@ class ConfigManager ():
 
 
 
+    def get_adaptive (self):
+        return self.options.adaptive
+
+
+
+    def get_minsoapbuflen (self):
+        return self.options.minsoapbuflen
+
+
+
+    def get_maxsoapbuflen (self):
+        return self.options.maxsoapbuflen
+
+
+
+    def get_connections (self):
+        return self.options.connections
+
+
+
+    def get_keepalive (self):
+        return self.options.keepalive
+
+
+
+    def get_readahead (self):
+        return self.options.readahead
+
+
+
+    def get_transfers (self):
+        return self.options.transfers
+
+
+
+    def get_retries (self):
+        return self.options.retries
+
+
+
+    def get_hashbuflen (self):
+        return self.options.hashbuflen
+
+
+
+    def get_hashers (self):
+        return self.options.hashers
+
+
+
+    def get_debounce (self):
+        return self.options.debounce
+
+
+
+    def get_interval (self):
+        return self.options.interval
+
+
+
+    def get_cachedir (self):
+        return self.options.cachedir
+
+
+
+    def get_cachettl (self):
+        return self.options.cachettl
+
+
+
+    def get_lean (self):
+        return self.options.lean
+
+
+
     def get_pathtodb (self):
         return self.options.pathtodb
 
@@ -2,6 +2,7 @@
 
 
 
+from contextlib import contextmanager
 from datetime import *
 import logging
 import os
@@ -14,13 +15,114 @@ DBM_LOGGER_NAME = '{0}.pyFolder.DBM'
 
 
 
+## The columns of the entry table, in order.
+
+ENTRY_COLUMNS = [ 'ifolder', 'id', 'mtime', 'digest', 'parent', 'path', \
+                      'localpath', 'size', 'mtime_ns', 'inode' ]
+
+
+
+## An in-memory copy of the entries of an iFolder, indexed by ID, by
+## path, by local path and by parent.
+#
+#  Entries are stored as dictionaries with the same keys as the rows of
+#  the entry table. They are never modified in place, updates replace
+#  them with a new dictionary, so that the entries handed out before an
+#  update keep their values.
+
+class EntryIndex:
+
+
+
+    ## The constructor.
+    #
+    #  @param iFolderID The ID of the iFolder.
+    #  @param iFolderEntryID The ID of the iFolder seen as an entry.
+    #  @param EntryTupleList The rows of the entry table for the iFolder.
+
+    def __init__ (self, iFolderID, iFolderEntryID, EntryTupleList):
+        self.iFolderID = iFolderID
+        self.iFolderEntryID = iFolderEntryID
+        self.ById = {}
+        self.ByPath = {}
+        self.ByLocalPath = {}
+        self.ByParent = {}
+
+        for EntryTuple in EntryTupleList:
+            self.add (dict (zip (EntryTuple.keys (), EntryTuple)))
+
+
+
+    def add (self, Entry):
+        self.remove (Entry['id'])
+        self.ById[Entry['id']] = Entry
+        self.ByPath[Entry['path']] = Entry
+        self.ByLocalPath[Entry['localpath']] = Entry
+        self.ByParent.setdefault (Entry['parent'], {})[Entry['id']] = Entry
+
+
+
+    def remove (self, EntryID):
+        Entry = self.ById.pop (EntryID, None)
+
+        if Entry is None:
+            return
+
+        if self.ByPath.get (Entry['path']) is Entry:
+            del self.ByPath[Entry['path']]
+
+        if self.ByLocalPath.get (Entry['localpath']) is Entry:
+            del self.ByLocalPath[Entry['localpath']]
+
+        Siblings = self.ByParent[Entry['parent']]
+        del Siblings[EntryID]
+
+        if len (Siblings) == 0:
+            del self.ByParent[Entry['parent']]
+
+
+
+    ## Replace the given columns of an entry, if it is indexed.
+    #
+    #  @param EntryID The ID of the entry.
+    #  @param kwargs The columns to replace.
+
+    def update (self, EntryID, **kwargs):
+        Entry = self.ById.get (EntryID)
+
+        if Entry is not None:
+            Entry = dict (Entry)
+            Entry.update (kwargs)
+            self.add (Entry)
+
+
+
+    ## Check whether the given ID belongs to the iFolder or to one of
+    ## its entries.
+
+    def owns (self, EntryID):
+        return EntryID == self.iFolderEntryID or EntryID in self.ById
+
+
+
+    def get_entries (self):
+        return sorted (self.ById.values (), key=lambda x: x['path'])
+
+
+
+    def get_entries_by_parent (self, ParentID):
+        return sorted (self.ByParent.get (ParentID, {}).values (), \
+                           key=lambda x: x['path'])
+
+
+
 class DBM:
 
 
 
     Q_CREATE_TABLE_ENTRY = \
         """
-        CREATE TABLE entry (
+        CREATE TABLE IF NOT EXISTS entry (
            ifolder        TEXT REFERENCES ifolder (id),
            id             TEXT,
            mtime          timestamp,
@@ -36,7 +138,7 @@ class DBM:
 
     Q_CREATE_TABLE_IFOLDER = \
         """
-        CREATE TABLE ifolder (
+        CREATE TABLE IF NOT EXISTS ifolder (
            id             TEXT PRIMARY KEY,
            mtime          timestamp,
            name           TEXT,
@@ -46,9 +148,110 @@ class DBM:
 
 
 
+    Q_CREATE_TABLE_JOURNAL = \
+        """
+        CREATE TABLE IF NOT EXISTS journal (
+           id             INTEGER PRIMARY KEY AUTOINCREMENT,
+           path           TEXT,
+           done           INTEGER DEFAULT 0
+        )
+        """
+
+
+
+    Q_CREATE_INDEX_ENTRY_BY_PARENT = \
+        """
+        CREATE INDEX IF NOT EXISTS entry_by_parent
+        ON entry (parent, path)
+        """
+
+
+
+    Q_CREATE_INDEX_ENTRY_BY_PATH = \
+        """
+        CREATE INDEX IF NOT EXISTS entry_by_path
+        ON entry (ifolder, path)
+        """
+
+
+
+    Q_CREATE_INDEX_ENTRY_BY_LOCALPATH = \
+        """
+        CREATE INDEX IF NOT EXISTS entry_by_localpath
+        ON entry (ifolder, localpath)
+        """
+
+
+
+    Q_ADD_COLUMN_ENTRY_SIZE = \
+        """
+        ALTER TABLE entry ADD COLUMN size INTEGER
+        """
+
+
+
+    Q_ADD_COLUMN_ENTRY_MTIME_NS = \
+        """
+        ALTER TABLE entry ADD COLUMN mtime_ns INTEGER
+        """
+
+
+
+    Q_ADD_COLUMN_ENTRY_INODE = \
+        """
+        ALTER TABLE entry ADD COLUMN inode INTEGER
+        """
+
+
+
+    Q_GET_TABLE = \
+        """
+        SELECT name FROM sqlite_master
+        WHERE type='table' AND name=?
+        """
+
+
+
+    Q_GET_SCHEMA_VERSION = \
+        """
+        PRAGMA user_version
+        """
+
+
+
+    Q_SET_SCHEMA_VERSION = \
+        """
+        PRAGMA user_version={0}
+        """
+
+
+
+    Q_CLEAR_ENTRIES = \
+        """
+        DELETE FROM entry
+        """
+
+
+
+    Q_CLEAR_IFOLDERS = \
+        """
+        DELETE FROM ifolder
+        """
+
+
+
+    Q_CLEAR_JOURNAL = \
+        """
+        DELETE FROM journal
+        """
+
+
+
     Q_ADD_ENTRY = \
         """
-        INSERT INTO entry VALUES (?, ?, ?, ?, ?, ?, ?)
+        INSERT INTO entry
+        (ifolder, id, mtime, digest, parent, path, localpath)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
         """
 
 
@@ -82,6 +285,14 @@ class DBM:
 
 
 
+    Q_UPDATE_STAT_BY_ENTRY = \
+        """
+        UPDATE entry SET size=?, mtime_ns=?, inode=?
+        WHERE ifolder=? AND id=?
+        """
+
+
+
     Q_GET_ENTRY = \
         """
         SELECT * FROM entry AS e 
@@ -181,22 +392,120 @@ class DBM:
 
 
 
+    Q_ADD_JOURNAL_ENTRY = \
+        """
+        INSERT INTO journal (path) VALUES (?)
+        """
+
+
+
+    Q_GET_JOURNAL_ENTRIES = \
+        """
+        SELECT * FROM journal AS j WHERE j.done=0
+        ORDER BY j.id ASC
+        """
+
+
+
+    Q_COMPLETE_JOURNAL_ENTRY = \
+        """
+        UPDATE journal SET done=1
+        WHERE id=?
+        """
+
+
+
+    Q_PURGE_JOURNAL = \
+        """
+        DELETE FROM journal WHERE done=1
+        """
+
+
+
+    ## The statements that upgrade the schema from version N to
+    ## version N + 1, stored as the Nth item of the list.
+    #
+    #  New versions must be appended here, without modifying the
+    #  existing ones, so that older databases can be upgraded in place.
+
+    SCHEMA_UPGRADES = [
+        [
+            Q_CREATE_TABLE_IFOLDER,
+            Q_CREATE_TABLE_ENTRY
+            ],
+        [
+            Q_CREATE_INDEX_ENTRY_BY_PARENT,
+            Q_CREATE_INDEX_ENTRY_BY_PATH,
+            Q_CREATE_INDEX_ENTRY_BY_LOCALPATH
+            ],
+        [
+            Q_ADD_COLUMN_ENTRY_SIZE,
+            Q_ADD_COLUMN_ENTRY_MTIME_NS,
+            Q_ADD_COLUMN_ENTRY_INODE
+            ],
+        [
+            Q_CREATE_TABLE_JOURNAL
+            ]
+        ]
+
+
+
+    SCHEMA_VERSION = len (SCHEMA_UPGRADES)
+
+
+
     def __init__ (self, cm):
 
         self.logger = logging.getLogger (
             DBM_LOGGER_NAME.format (cm.get_username ()))
 
         self.pathtodb = cm.get_pathtodb ()
+        self.depth = 0
+        self.index = None
         self.__connect ()
 
 
 
-    def __create_tables (self):
+    ## Get the version of the schema of the local database.
+    #
+    #  @return 0 if the database is empty, the schema version else.
+
+    def __get_schema_version (self):
+        cu = self.cx.cursor ()
+        cu.execute (DBM.Q_GET_SCHEMA_VERSION)
+        Version = cu.fetchone ()[0]
+
+        if Version == 0:
+            cu.execute (DBM.Q_GET_TABLE, ('entry',))
+
+            # Databases created before the introduction of the
+            # schema versioning.
+
+            if cu.fetchone () is not None:
+                Version = 1
+
+        return Version
+
+
+
+    ## Upgrade the schema of the local database to DBM.SCHEMA_VERSION.
+    #
+    #  @param Version The current version of the schema.
+
+    def __upgrade_schema (self, Version):
         cu = self.cx.cursor ()
-        cu.execute (DBM.Q_CREATE_TABLE_IFOLDER)
-        self.logger.debug ('Created table `ifolder\'')
-        cu.execute (DBM.Q_CREATE_TABLE_ENTRY)
-        self.logger.debug ('Created table `entry\'')
+
+        while Version < DBM.SCHEMA_VERSION:
+
+            for Query in DBM.SCHEMA_UPGRADES[Version]:
+                cu.execute (Query)
+
+            Version = Version + 1
+            cu.execute (DBM.Q_SET_SCHEMA_VERSION.format (Version))
+            self.logger.debug ('Upgraded schema to version {0}'.format (
+                    Version))
+
+        self.cx.commit ()
 
 
 
@@ -206,19 +515,100 @@ class DBM:
                                        sqlite3.PARSE_COLNAMES)
         self.cx.row_factory = sqlite3.Row        
 
+        Version = self.__get_schema_version ()
 
+        if Version > 0 and Version < DBM.SCHEMA_VERSION:
+            self.__upgrade_schema (Version)
+
+
+
+    ## Commit the pending changes, unless a transaction is in progress.
+
+    def __commit (self):
+        if self.depth == 0:
+            self.cx.commit ()
+
+
+
+    ## Group all the changes made within a `with' block in a single
+    ## transaction.
+    #
+    #  Transactions can be nested, only the outermost one commits. The
+    #  pending changes, including the ones made within the nested
+    #  transactions, are committed even if an exception is raised by
+    #  the outermost block, because they mirror operations that have
+    #  already been applied to the local repository or to the remote
+    #  one.
+
+    @contextmanager
+    def transaction (self):
+        self.depth = self.depth + 1
 
-    def create_schema (self):
         try:
-            self.__create_tables ()
-        except sqlite3.OperationalError, oe:
-            self.cx.close ()
-            if os.path.isfile (self.pathtodb):
-                os.remove (self.pathtodb)
-            self.__connect ()
-            self.__create_tables ()
+            yield self
+
         finally:
-            self.cx.commit ()
+            self.depth = self.depth - 1
+
+            if self.depth == 0:
+                self.cx.commit ()
+
+
+
+    ## Serve the queries about the entries of the given iFolder from
+    ## memory, within a `with' block.
+    #
+    #  The entries are loaded with a single query, and the in-memory
+    #  copy is kept up to date by the DBM write methods. Only one iFolder
+    #  at a time can be indexed.
+    #
+    #  @param iFolderID The ID of the iFolder.
+
+    @contextmanager
+    def indexed (self, iFolderID):
+        iFolderTuple = self.get_ifolder (iFolderID)
+        iFolderEntryID = None
+
+        if iFolderTuple is not None:
+            iFolderEntryID = iFolderTuple['entry_id']
+
+        cu = self.cx.cursor ()
+        cu.execute (DBM.Q_GET_ENTRIES_BY_IFOLDER, (iFolderID,))
+        self.index = EntryIndex (iFolderID, iFolderEntryID, cu.fetchall ())
+        self.logger.debug (
+            'Indexed {0} entries of iFolder with ID={1}'.format (
+                len (self.index.ById), iFolderID))
+
+        try:
+            yield self.index
+
+        finally:
+            self.index = None
+
+
+
+    ## Get the in-memory index of the given iFolder, if it is loaded.
+
+    def __get_index (self, iFolderID):
+        if self.index is not None and self.index.iFolderID == iFolderID:
+            return self.index
+
+        return None
+
+
+
+    ## Create (or upgrade) the schema of the local database and remove
+    ## any data previously stored in it.
+
+    def create_schema (self):
+        self.__upgrade_schema (self.__get_schema_version ())
+
+        cu = self.cx.cursor ()
+        cu.execute (DBM.Q_CLEAR_ENTRIES)
+        cu.execute (DBM.Q_CLEAR_IFOLDERS)
+        cu.execute (DBM.Q_CLEAR_JOURNAL)
+        self.cx.commit ()
+        self.index = None
 
 
 
@@ -227,7 +617,7 @@ class DBM:
         cu.execute (DBM.Q_ADD_IFOLDER, (iFolderID, mtime, Name, EntryID))
         self.logger.info ('Added iFolder `{0}\', ID={1}'.format \
                                (Name, iFolderID))
-        self.cx.commit ()
+        self.__commit ()
 
 
 
@@ -235,7 +625,7 @@ class DBM:
         cu = self.cx.cursor ()
         cu.execute (DBM.Q_DELETE_IFOLDER, (iFolderID,))
         self.logger.info ('Deleted iFolder with ID={0}'.format (iFolderID))
-        self.cx.commit ()
+        self.__commit ()
 
 
 
@@ -258,7 +648,7 @@ class DBM:
         cu.execute (DBM.Q_UPDATE_MTIME_BY_IFOLDER, (mtime, iFolderID))
         self.logger.info ('Updated iFolder with ID={0}'.format (iFolderID))
         self.logger.debug ('new_mtime={0}'.format (mtime))
-        self.cx.commit ()
+        self.__commit ()
 
 
 
@@ -276,30 +666,66 @@ class DBM:
                     Path, \
                     LocalPath))
 
+        self.__index_entry ((iFolderID, EntryID, mtime, Digest, ParentID, \
+                                 Path, LocalPath))
+
         self.logger.info ('Added entry `{0}\''.format (Path.encode ('utf-8')))
-        self.cx.commit ()
+        self.__commit ()
 
 
 
     def delete_entry (self, iFolderID, EntryID):
         cu = self.cx.cursor ()
         cu.execute (DBM.Q_DELETE_ENTRY, (iFolderID, EntryID))
+
+        if self.__get_index (iFolderID) is not None:
+            self.index.remove (EntryID)
+
         self.logger.info ('Deleted entry with ID={0}'.format (EntryID))
-        self.cx.commit ()
+        self.__commit ()
 
 
 
     def delete_entries_by_ifolder (self, iFolderID):
         cu = self.cx.cursor ()
         cu.execute (DBM.Q_DELETE_ENTRIES_BY_IFOLDER, (iFolderID,))
-        self.cx.commit ()
+
+        if self.__get_index (iFolderID) is not None:
+            for EntryID in self.index.ById.keys ():
+                self.index.remove (EntryID)
+
+        self.__commit ()
 
 
 
     def delete_entries_by_parent (self, ParentID):
         cu = self.cx.cursor ()
         cu.execute (DBM.Q_DELETE_ENTRIES_BY_PARENT, (ParentID,))
-        self.cx.commit ()
+
+        if self.index is not None:
+            for Entry in self.index.get_entries_by_parent (ParentID):
+                self.index.remove (Entry['id'])
+
+        self.__commit ()
+
+
+
+    ## Delete several entries at once.
+    #
+    #  @param iFolderID The ID of the iFolder the entries belong to.
+    #  @param EntryIDList A list of entry IDs.
+
+    def delete_entries (self, iFolderID, EntryIDList):
+        cu = self.cx.cursor ()
+        cu.executemany (DBM.Q_DELETE_ENTRY, \
+                            [(iFolderID, EntryID) for EntryID in EntryIDList])
+
+        if self.__get_index (iFolderID) is not None:
+            for EntryID in EntryIDList:
+                self.index.remove (EntryID)
+
+        self.logger.info ('Deleted {0} entries'.format (cu.rowcount))
+        self.__commit ()
 
 
 
@@ -308,8 +734,34 @@ class DBM:
         cu = self.cx.cursor ()
         cu.execute (DBM.Q_UPDATE_MTIME_AND_DIGEST_BY_ENTRY, \
                         (mtime, Digest, iFolderID, EntryID))
+
+        if self.__get_index (iFolderID) is not None:
+            self.index.update (EntryID, mtime=mtime, digest=Digest)
+
         self.logger.info ('Updated Entry with ID={0}'.format (EntryID))
-        self.cx.commit ()
+        self.__commit ()
+
+
+
+    ## Record the file attributes the digest of an entry was computed on.
+    #
+    #  @param iFolderID The ID of the iFolder the entry belongs to.
+    #  @param EntryID The ID of the entry.
+    #  @param Size The size of the file in bytes.
+    #  @param Mtime The modification time of the file in nanoseconds.
+    #  @param Inode The inode number of the file.
+
+    def update_stat_by_entry (self, iFolderID, EntryID, Size, Mtime, Inode):
+        cu = self.cx.cursor ()
+        cu.execute (DBM.Q_UPDATE_STAT_BY_ENTRY, \
+                        (Size, Mtime, Inode, iFolderID, EntryID))
+
+        if self.__get_index (iFolderID) is not None:
+            self.index.update (EntryID, size=Size, mtime_ns=Mtime, inode=Inode)
+
+        self.logger.debug ('Updated stat of Entry with ID={0}'.format (
+                EntryID))
+        self.__commit ()
 
 
 
@@ -328,6 +780,9 @@ class DBM:
 
 
     def get_entry (self, iFolderID, EntryID):
+        if self.__get_index (iFolderID) is not None:
+            return self.index.ById.get (EntryID)
+
         cu = self.cx.cursor ()
         cu.execute (DBM.Q_GET_ENTRY, (iFolderID, EntryID))
         return cu.fetchone ()
@@ -335,6 +790,9 @@ class DBM:
 
 
     def get_entries_by_ifolder (self, iFolderID):
+        if self.__get_index (iFolderID) is not None:
+            return self.index.get_entries ()
+
         cu = self.cx.cursor ()
         cu.execute (DBM.Q_GET_ENTRIES_BY_IFOLDER, (iFolderID,))
         EntryTupleList = cu.fetchall ()
@@ -348,6 +806,9 @@ class DBM:
 
 
     def get_entries_by_parent (self, ParentID):
+        if self.index is not None and self.index.owns (ParentID):
+            return self.index.get_entries_by_parent (ParentID)
+
         cu = self.cx.cursor ()
         cu.execute (DBM.Q_GET_ENTRIES_BY_PARENT, (ParentID,))
         return cu.fetchall ()
@@ -355,6 +816,9 @@ class DBM:
 
 
     def get_entry_by_ifolder_and_path (self, iFolderID, Path):
+        if self.__get_index (iFolderID) is not None:
+            return self.index.ByPath.get (Path)
+
         cu = self.cx.cursor ()
         cu.execute (DBM.Q_GET_ENTRY_BY_IFOLDER_AND_PATH, (iFolderID, Path))
         return cu.fetchone ()
@@ -362,6 +826,9 @@ class DBM:
 
 
     def get_entry_by_ifolder_and_localpath (self, iFolderID, LocalPath):
+        if self.__get_index (iFolderID) is not None:
+            return self.index.ByLocalPath.get (LocalPath)
+
         cu = self.cx.cursor ()
 
         cu.execute (\
@@ -373,6 +840,63 @@ class DBM:
 
 
 
+    ## Record some locally changed paths in the journal.
+    #
+    #  @param PathList A list of local paths, without the pyFolder prefix.
+
+    def add_journal_entries (self, PathList):
+        cu = self.cx.cursor ()
+        cu.executemany (DBM.Q_ADD_JOURNAL_ENTRY, [(x,) for x in PathList])
+        self.logger.debug ('Journaled {0} paths'.format (cu.rowcount))
+        self.__commit ()
+
+
+
+    ## Get the journal entries whose changes have not been committed yet,
+    ## in the order they were recorded.
+
+    def get_journal_entries (self):
+        cu = self.cx.cursor ()
+        cu.execute (DBM.Q_GET_JOURNAL_ENTRIES)
+        return cu.fetchall ()
+
+
+
+    ## Mark the changes recorded in the journal as committed.
+    #
+    #  @param JournalIDList A list with the IDs of the committed journal
+    #                       entries.
+
+    def complete_journal_entries (self, JournalIDList):
+        cu = self.cx.cursor ()
+        cu.executemany (
+            DBM.Q_COMPLETE_JOURNAL_ENTRY, [(x,) for x in JournalIDList])
+        self.__commit ()
+
+
+
+    ## Remove the committed entries from the journal.
+
+    def purge_journal (self):
+        cu = self.cx.cursor ()
+        cu.execute (DBM.Q_PURGE_JOURNAL)
+        self.logger.debug ('Purged {0} journal entries'.format (cu.rowcount))
+        self.__commit ()
+
+
+
+    ## Add a new entry to the in-memory index, if its iFolder is indexed.
+    #
+    #  @param EntryTuple A tuple with the parameters of DBM.add_entry.
+
+    def __index_entry (self, EntryTuple):
+        if self.__get_index (EntryTuple[0]) is not None:
+            Entry = dict.fromkeys (ENTRY_COLUMNS)
+            Entry.update (zip (ENTRY_COLUMNS, EntryTuple))
+            self.index.add (Entry)
+
+
+
     def __del__ (self):
         self.cx.commit ()
         self.cx.close ()
@@ -10,6 +10,9 @@ import logging
 from suds.client import Client
 from suds.transport.https import HttpAuthenticated
 from suds import WebFault
+from transport import ConnectionPool, KeepAliveTransport
+from unmarshal import FastUnmarshaller
+from wsdlcache import WSDLCache
 
 
 
@@ -21,13 +24,36 @@ class iFolderWS:
 
 
 
-    def __init__ (self, cm):
+    ## The constructor.
+    #
+    #  @param cm A core.config.ConfigManager instance.
+    #  @param client A suds.client.Client instance to use, or None to
+    #                create a new one.
+
+    def __init__ (self, cm, client=None):
         self.cm = cm
-        self.__setup_suds_client ()
+
+        if client is None:
+            self.__setup_suds_client ()
+
+        else:
+            self.client = client
+
+        self.unmarshaller = FastUnmarshaller (
+            self.client, Lean=self.cm.get_lean ())
         self.__setup_logger ()
 
 
 
+    ## Get a new iFolderWS instance, sharing the parsed WSDL with this one.
+    #
+    #  @return An iFolderWS instance with its own transport.
+
+    def clone (self):
+        return iFolderWS (self.cm, self.client.clone ())
+
+
+
     def __setup_logger (self):
         self.logger = logging.getLogger (
             IFOLDERWS_LOGGER_NAME.format (self.cm.get_username ()))
@@ -42,10 +68,28 @@ class iFolderWS:
         usernameBase64 = base64.b64encode (self.cm.get_username ())
         passwordBase64 = base64.b64encode (self.cm.get_password ())
 
-        transport = HttpAuthenticated (username=usernameBase64,
-                                       password=passwordBase64)
+        if self.cm.get_keepalive () > 0:
+            pool = ConnectionPool (
+                self.cm.get_connections (), self.cm.get_keepalive ())
+
+            transport = KeepAliveTransport (pool=pool,
+                                            username=usernameBase64,
+                                            password=passwordBase64)
+
+        else:
+            transport = HttpAuthenticated (username=usernameBase64,
+                                           password=passwordBase64)
 
-        self.client = Client (self.cm.get_ifolderws (), transport=transport)
+        credentials = base64.b64encode (
+            ':'.join ([usernameBase64, passwordBase64]))
+
+        cache = WSDLCache (self.cm)
+        cache.revalidate (self.cm.get_ifolderws (), {
+                'Authorization' : 'Basic {0}'.format (credentials)
+                })
+
+        self.client = Client (self.cm.get_ifolderws (), transport=transport,
+                              cache=cache, cachingpolicy=1)
 
 
 
@@ -76,7 +120,7 @@ class iFolderWS:
     def get_all_ifolders (self):
 
         try:
-            iFolderSet = self.client.service.GetiFolders (0, 0)
+            iFolderSet = self.unmarshaller.invoke ('GetiFolders', 0, 0)
 
             if iFolderSet.Total > 0:
                 return iFolderSet.Items.iFolder
@@ -92,8 +136,8 @@ class iFolderWS:
     def get_ifolder_as_entry (self, iFolderID):
 
         try:
-            iFolderEntrySet = self.client.service.GetEntries (
-                iFolderID, iFolderID, 0, 1)
+            iFolderEntrySet = self.unmarshaller.invoke (
+                'GetEntries', iFolderID, iFolderID, 0, 1)
 
             if iFolderEntrySet.Total > 0:
                 for iFolderEntry in iFolderEntrySet.Items.iFolderEntry:
@@ -110,8 +154,8 @@ class iFolderWS:
     def get_latest_change (self, iFolderID, EntryID):
 
         try:
-            ChangeEntrySet = self.client.service.GetChanges (
-                iFolderID, EntryID, 0, 1)
+            ChangeEntrySet = self.unmarshaller.invoke (
+                'GetChanges', iFolderID, EntryID, 0, 1)
 
             if ChangeEntrySet.Total > 0:
                 for Change in ChangeEntrySet.Items.ChangeEntry:
@@ -125,10 +169,28 @@ class iFolderWS:
 
 
 
+    def get_changes (self, iFolderID, EntryID, Index, Max):
+
+        try:
+            ChangeEntrySet = self.unmarshaller.invoke (
+                'GetChanges', iFolderID, EntryID, Index, Max)
+
+            if ChangeEntrySet.Total > Index:
+                return ChangeEntrySet.Items.ChangeEntry
+
+            return None
+
+        except WebFault, wf:
+            self.logger.error (wf)
+            raise
+
+
+
     def get_entry_by_path (self, iFolderID, Path):
 
         try:
-            return self.client.service.GetEntryByPath (iFolderID, Path)
+            return self.unmarshaller.invoke (
+                'GetEntryByPath', iFolderID, Path)
 
         except WebFault, wf:
             self.logger.error (wf)
@@ -140,7 +202,8 @@ class iFolderWS:
                              Index, Max):
 
         try:
-            iFolderEntrySet = self.client.service.GetEntriesByName (
+            iFolderEntrySet = self.unmarshaller.invoke (
+                'GetEntriesByName',
                 iFolderID,
                 ParentID,
                 Operation,
@@ -163,7 +226,8 @@ class iFolderWS:
 
         try:
             Operation = self.get_search_operation ()
-            iFolderEntrySet = self.client.service.GetEntriesByName (
+            iFolderEntrySet = self.unmarshaller.invoke (
+                'GetEntriesByName',
                 iFolderID, iFolderID, Operation.Contains, '.', 0, 0)
 
             if iFolderEntrySet.Total > 0:
@@ -177,10 +241,29 @@ class iFolderWS:
 
 
 
+    def get_children (self, iFolderID, Index, Max):
+
+        try:
+            Operation = self.get_search_operation ()
+            iFolderEntrySet = self.unmarshaller.invoke (
+                'GetEntriesByName',
+                iFolderID, iFolderID, Operation.Contains, '.', Index, Max)
+
+            if iFolderEntrySet.Total > Index:
+                return iFolderEntrySet.Items.iFolderEntry
+
+            return None
+
+        except WebFault, wf:
+            self.logger.error (wf)
+            raise
+
+
+
     def get_ifolder (self, iFolderID):
 
         try:
-            return self.client.service.GetiFolder (iFolderID)
+            return self.unmarshaller.invoke ('GetiFolder', iFolderID)
 
         except WebFault, wf:
             self.logger.error (wf)
@@ -191,7 +274,8 @@ class iFolderWS:
     def get_entry (self, iFolderID, EntryID):
 
         try:
-            return self.client.service.GetEntry (iFolderID, EntryID)
+            return self.unmarshaller.invoke (
+                'GetEntry', iFolderID, EntryID)
 
         except WebFault, wf:
             self.logger.error (wf)
@@ -210,11 +294,38 @@ class iFolderWS:
 
 
 
-    def read_file (self, Handle):
+    def read_file (self, Handle, Length=None):
+
+        if Length is None:
+            Length = self.cm.get_soapbuflen ()
+
+        try:
+            return self.unmarshaller.invoke ('ReadFile', Handle, Length)
+
+        except WebFault, wf:
+            self.logger.error (wf)
+            raise
+
+
+
+    ## Read a chunk of an open remote file, and decode it into a local
+    ## file as it arrives, without holding the whole reply in memory.
+    #
+    #  @param Handle The handle returned by open_file_read.
+    #  @param File The local file to write the chunk to.
+    #  @param Length The maximum length of the chunk, in bytes.
+    #
+    #  @return The number of bytes written, or None at the end of the
+    #          remote file.
+
+    def read_file_into (self, Handle, File, Length=None):
+
+        if Length is None:
+            Length = self.cm.get_soapbuflen ()
 
         try:
-            return self.client.service.ReadFile (
-                Handle, self.cm.get_soapbuflen ())
+            return self.unmarshaller.decode_into (
+                'ReadFile', File, Handle, Length)
 
         except WebFault, wf:
             self.logger.error (wf)
@@ -237,7 +348,7 @@ class iFolderWS:
     def write_file (self, Handle, Data):
 
         try:
-            self.client.service.WriteFile (Handle, Data)
+            self.unmarshaller.invoke ('WriteFile', Handle, Data)
 
         except WebFault, wf:
             self.logger.error (wf)
@@ -2,19 +2,15 @@ from NullNotifier import *
 
 
 
-try:
-    from WindowsNotifier import *
-except:
-    pass
-
-
-
 class NotifierFactory:
 
 
 
     ## Creates a new instance of a Notifier subclass.
     #
+    #  The platform specific notifiers are imported only on their own
+    #  platform, since they pull in large modules such as win32con.
+    #
     #  @param platform A string containing the host operating
     #                  system platform name.
 
@@ -22,6 +18,13 @@ class NotifierFactory:
     def create (platform, pyFolder):
 
         if platform == 'win32':
-            return WindowsNotifier (pyFolder)
+
+            try:
+
+                from WindowsNotifier import WindowsNotifier
+                return WindowsNotifier (pyFolder)
+
+            except ImportError:
+                pass
 
         return NullNotifier (pyFolder)
@@ -24,35 +24,46 @@ class DefaultPolicy (Policy):
 
 
     def add_file (self, iFolderID, EntryID, Path):
-        try:
+        if self.pyFolder.file_has_local_changes (iFolderID, EntryID, Path):
+            self.pyFolder.handle_name_conflict (Path)
 
-            if self.pyFolder.file_has_local_changes (iFolderID, EntryID, Path):
-                self.pyFolder.handle_name_conflict (Path)
+        self.pyFolder.enqueue_fetch (
+            iFolderID, EntryID, Path,
+            lambda Error: self.__handle_fetch_error (iFolderID, Path, Error))
 
-            self.pyFolder.fetch (iFolderID, EntryID, Path)
-            return True
+        return True
 
-        except WebFault, wf:
-            ex = self.pyFolder.get_original_exception (wf)
+
+
+    ## Handle an error raised while downloading a file.
+    #
+    #  @param iFolderID The ID of the remote iFolder the 
+    #                   file belongs to.
+    #  @param Path The path to the file (without the pyFolder
+    #              prefix added).
+    #  @param Error The raised exception.
+
+    def __handle_fetch_error (self, iFolderID, Path, Error):
+        if isinstance (Error, WebFault):
+            ex = self.pyFolder.get_original_exception (Error)
 
             if ex == 'iFolder.WebService.EntryDoesNotExistException':
-                return False
+                return
 
             elif ex == 'System.IO.IOException':
                 self.pyFolder.ignore_in_use (Path)
-                return False
+                return
 
-            else:
-                raise
-
-        except IOError:
+        elif isinstance (Error, IOError):
 
             # BUG #0000 - Closed.
             # It happened when, at the update time, parth of path
             # to Path had been deleted locally.
 
             self.pyFolder.handle_ioerror (iFolderID, Path)
-            return False
+            return
+
+        raise
 
 
 
@@ -62,31 +73,14 @@ class DefaultPolicy (Policy):
 
 
     def modify_file (self, iFolderID, EntryID, Path):
-        try:
-
-            if self.pyFolder.file_has_local_changes (iFolderID, EntryID, Path):
-                self.pyFolder.handle_name_conflict (Path)
-
-            self.pyFolder.fetch (iFolderID, EntryID, Path)
-            return True
-
-        except WebFault, wf:
-            ex = self.pyFolder.get_original_exception (wf)
-
-            if ex == 'iFolder.WebService.EntryDoesNotExistException':
-                return False
-
-            elif ex == 'System.IO.IOException':
-                self.pyFolder.ignore_in_use (Path)
-                return False
-
-            else:
-                raise
+        if self.pyFolder.file_has_local_changes (iFolderID, EntryID, Path):
+            self.pyFolder.handle_name_conflict (Path)
 
-        except IOError:
+        self.pyFolder.enqueue_fetch (
+            iFolderID, EntryID, Path,
+            lambda Error: self.__handle_fetch_error (iFolderID, Path, Error))
 
-            self.pyFolder.handle_ioerror (iFolderID, Path)
-            return False
+        return True
 
 
 
@@ -208,21 +202,33 @@ class DefaultPolicy (Policy):
 
 
     def modify_remote_file (self, iFolderID, EntryID, Path):
-        try:
+        self.pyFolder.enqueue_remote_file_write (
+            iFolderID, EntryID, Path,
+            lambda Error: self.__handle_upload_error (iFolderID, Path, Error))
 
-            self.pyFolder.remote_file_write (iFolderID, EntryID, Path)
-            return True
+        return True
 
-        except WebFault, wf:
-            ex = self.pyFolder.get_original_exception (wf)
+
+
+    ## Handle an error raised while uploading a file.
+    #
+    #  @param iFolderID The ID of the remote iFolder the 
+    #                   file-entry belongs to.
+    #  @param Path The path to the file (without the pyFolder
+    #              prefix added).
+    #  @param Error The raised exception.
+
+    def __handle_upload_error (self, iFolderID, Path, Error):
+        if isinstance (Error, WebFault):
+            ex = self.pyFolder.get_original_exception (Error)
 
             if ex == 'System.IO.IOException':
                 self.pyFolder.ignore_in_use (Path)
-                return False
+                return
 
             elif ex == 'Simias.Storage.AccessException':
                 self.pyFolder.ignore_no_rights (Path)
-                return False
+                return
 
             elif ex == 'iFolder.WebService.EntryDoesNotExistException':
 
@@ -232,16 +238,9 @@ class DefaultPolicy (Policy):
                 # deleted by anybody else.
 
                 self.pyFolder.rollback (iFolderID, Path)
-                return False
-
-            elif ex == 'iFolder.WebService.MemberDoesNotExistException':
-                raise
+                return
 
-            elif ex == 'iFolder.WebService.iFolderDoesNotExistException':
-                raise
-
-            else:
-                raise
+        raise
 
 
 
@@ -3,7 +3,6 @@
 
 
 from Policy import *
-from DefaultPolicy import *
 
 
 
@@ -11,8 +10,16 @@ class PolicyFactory:
 
 
 
+    ## Creates a new instance of a Policy subclass.
+    #
+    #  The policy module is imported only once it is needed.
+    #
+    #  @param policy The name of the policy, as in get_factories.
+
     @staticmethod
     def create (policy, pyFolder):
+        from DefaultPolicy import DefaultPolicy
+
         return DefaultPolicy (pyFolder)
     
 
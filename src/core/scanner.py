@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+
+
+import bisect
+import os
+import stat
+
+
+
+## The attributes of a scanned file system entry.
+
+class ScanEntry:
+
+
+
+    ## The constructor.
+    #
+    #  @param Path The full path to the entry.
+    #  @param Stat The result of os.stat on Path.
+    #  @param IsLink True whether Path is a symbolic link.
+
+    def __init__ (self, Path, Stat, IsLink):
+        self.Path = Path
+        self.IsDir = stat.S_ISDIR (Stat.st_mode)
+        self.IsFile = stat.S_ISREG (Stat.st_mode)
+        self.IsLink = IsLink
+        self.Size = Stat.st_size
+        self.Mtime = getattr (Stat, 'st_mtime_ns', None)
+        self.Inode = Stat.st_ino
+
+        if self.Mtime is None:
+            self.Mtime = int (Stat.st_mtime * 1000000000)
+
+
+
+## An in-memory image of one or more local directory trees.
+#
+#  Each tree is read once, with one stat per entry, and then served from
+#  memory. Whoever modifies the file system while a Snapshot is in use
+#  must report the modified paths through Snapshot.update.
+
+class Snapshot:
+
+
+
+    def __init__ (self):
+        self.Entries = {}
+        self.Children = {}
+        self.Roots = set ()
+
+
+
+    ## Read the given directory tree, unless it has already been read.
+    #
+    #  @param Root The full path to the directory tree.
+
+    def scan (self, Root):
+        if self.covers (Root):
+            return
+
+        self.Roots.add (Root)
+        self.__add (Root)
+
+
+
+    ## Get the attributes of the given path.
+    #
+    #  @param Path A full path, within a scanned tree.
+    #
+    #  @return A ScanEntry instance, or None if Path does not exist.
+
+    def get (self, Path):
+        return self.Entries.get (Path)
+
+
+
+    ## Walk a scanned directory tree, top-down.
+    #
+    #  Symbolic links to directories are listed but not followed.
+    #
+    #  @param Root The full path to the directory to walk.
+    #
+    #  @return A generator of (Root, Dirs, Files) tuples, as os.walk.
+
+    def walk (self, Root):
+        if Root not in self.Children:
+            return
+
+        Dirs = []
+        Files = []
+
+        for Name in self.Children[Root]:
+            Entry = self.Entries[os.path.join (Root, Name)]
+
+            if Entry.IsDir:
+                Dirs.append (Name)
+
+            else:
+                Files.append (Name)
+
+        yield Root, Dirs, Files
+
+        for Dir in Dirs:
+            for Item in self.walk (os.path.join (Root, Dir)):
+                yield Item
+
+
+
+    ## Read again the given path, after it has been created, modified
+    ## or removed.
+    #
+    #  @param Path A full path. Paths outside of the scanned trees are
+    #              ignored.
+
+    def update (self, Path):
+        Parent, Name = os.path.split (Path)
+
+        if Path in self.Roots:
+            self.__forget (Path)
+            self.__add (Path)
+
+        elif Parent in self.Children:
+            self.__forget (Path)
+            Names = self.Children[Parent]
+
+            if Name in Names:
+                Names.remove (Name)
+
+            if self.__add (Path):
+                bisect.insort (Names, Name)
+
+        elif self.covers (Parent):
+            self.update (Parent)
+
+
+
+    ## Check whether the given path lies within a scanned tree.
+    #
+    #  @param Path A full path.
+
+    def covers (self, Path):
+        for Root in self.Roots:
+
+            if Path == Root or Path.startswith (os.path.join (Root, '')):
+                return True
+
+        return False
+
+
+
+    ## Read the given path and, if it is a directory, its descendants.
+    #
+    #  @return True whether Path exists.
+
+    def __add (self, Path):
+        try:
+            Stat = os.lstat (Path)
+            IsLink = stat.S_ISLNK (Stat.st_mode)
+
+            if IsLink:
+                Stat = os.stat (Path)
+
+        except OSError:
+            return False
+
+        Entry = ScanEntry (Path, Stat, IsLink)
+        self.Entries[Path] = Entry
+
+        if Entry.IsDir and not Entry.IsLink:
+
+            try:
+                Names = sorted (os.listdir (Path))
+
+            except OSError:
+                Names = []
+
+            self.Children[Path] = []
+
+            for Name in Names:
+
+                if self.__add (os.path.join (Path, Name)):
+                    self.Children[Path].append (Name)
+
+        return True
+
+
+
+    def __forget (self, Path):
+        self.Entries.pop (Path, None)
+
+        for Name in self.Children.pop (Path, []):
+            self.__forget (os.path.join (Path, Name))
+
+
+
+## Reduce a list of paths to the ones that are not below any other
+## path of the list.
+#
+#  @param PathList A list of paths.
+#
+#  @return A sorted list of paths.
+
+def prune (PathList):
+    Pruned = set ()
+
+    for Path in sorted (set ([os.path.normpath (x) for x in PathList])):
+        Head = os.path.dirname (Path)
+
+        while Head not in Pruned and Head != os.path.dirname (Head):
+            Head = os.path.dirname (Head)
+
+        if Head not in Pruned:
+            Pruned.add (Path)
+
+    return sorted (Pruned)
+
+
+
+## Compare two lists of (Path, Value) tuples, both sorted by Path, in a
+## single pass.
+#
+#  @param Old The list of the previously known items.
+#  @param New The list of the current items.
+#
+#  @return A tuple (Added, Deleted, Kept). Added is the list of the items
+#          of New whose path is not in Old, Deleted is the list of the
+#          items of Old whose path is not in New, and Kept is a list of
+#          (Path, OldValue, NewValue) tuples, for the paths in both lists.
+
+def diff (Old, New):
+    Added = []
+    Deleted = []
+    Kept = []
+    i = 0
+    j = 0
+
+    while i < len (Old) and j < len (New):
+
+        if Old[i][0] == New[j][0]:
+            Kept.append ((Old[i][0], Old[i][1], New[j][1]))
+            i = i + 1
+            j = j + 1
+
+        elif Old[i][0] < New[j][0]:
+            Deleted.append (Old[i])
+            i = i + 1
+
+        else:
+            Added.append (New[j])
+            j = j + 1
+
+    Deleted.extend (Old[i:])
+    Added.extend (New[j:])
+
+    return Added, Deleted, Kept
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+
+
+from suds import sax, tostr
+import datetime
+import re
+
+
+
+# The marks put in place of the arguments while a template is built.
+# They are delimited by a private use character, which suds marshals as
+# is, and which the envelopes of the iFolder Web Service don't contain.
+
+TEMPLATE_DELIMITER = u'\ue000'
+TEMPLATE_MARK = TEMPLATE_DELIMITER + u'{0}' + TEMPLATE_DELIMITER
+TEMPLATE_MARK_RE = re.compile (
+    TEMPLATE_DELIMITER + u'([0-9]+)' + TEMPLATE_DELIMITER)
+TEMPLATE_ARG_TYPES = (basestring, bool, int, long, float, datetime.date)
+
+
+
+## The SOAP envelope of a method, marshalled once by suds with a mark
+## in place of each argument, and split at the marks.
+
+class Template:
+
+
+
+    ## The constructor.
+    #
+    #  @param method The suds method the envelope invokes.
+    #
+    #  @throw ValueError If the envelope doesn't contain each of the
+    #                    arguments exactly once, as its text.
+
+    def __init__ (self, method):
+        Binding = method.binding.input
+
+        self.Types = [
+            Type.resolve () for Name, Type in Binding.param_defs (method)]
+        self.Verified = False
+
+        Marks = [TEMPLATE_MARK.format (i) for i in range (len (self.Types))]
+        Envelope = Binding.get_message (method, Marks, {}).plain ()
+        Parts = TEMPLATE_MARK_RE.split (Envelope)
+
+        if Parts[1::2] != [str (i) for i in range (len (self.Types))]:
+            raise ValueError (method.name)
+
+        self.Parts = [Part.encode ('utf-8') for Part in Parts[::2]]
+
+
+
+    ## Fill in the template.
+    #
+    #  @param args The arguments of the method.
+    #
+    #  @return The envelope, as an UTF-8 encoded string, or None whether
+    #          any of the arguments can't be filled in.
+
+    def fill (self, args):
+        if len (args) != len (self.Types):
+            return None
+
+        Envelope = [self.Parts[0]]
+
+        for Type, Value, Part in zip (self.Types, args, self.Parts[1:]):
+            if not isinstance (Value, TEMPLATE_ARG_TYPES):
+                return None
+
+            Value = sax.encoder.encode (tostr (Type.translate (Value, False)))
+
+            if isinstance (Value, unicode):
+                Value = Value.encode ('utf-8')
+
+            Envelope.append (Value)
+            Envelope.append (Part)
+
+        return ''.join (Envelope)
+
+
+
+## A cache of the Template of each method of a suds client.
+#
+#  The XML shape of a request never changes, so that marshalling it
+#  through the suds schema and element tree on each call is wasted
+#  work. The first envelope filled in from a template is checked against
+#  the one suds builds, and the methods whose templates don't match, or
+#  can't be built, are left to suds.
+
+class TemplateCache:
+
+
+
+    ## The constructor.
+    #
+    #  @param client The suds.client.Client instance whose methods are
+    #                invoked.
+
+    def __init__ (self, client):
+        self.client = client
+        self.Templates = {}
+
+
+
+    ## Get the SOAP envelope invoking the given method.
+    #
+    #  @param method The suds method to invoke.
+    #  @param args The arguments of the method.
+    #
+    #  @return The envelope, as an UTF-8 encoded string.
+
+    def render (self, method, args):
+        Template = self.__get_template (method)
+        Envelope = None
+
+        if Template is not None:
+            Envelope = Template.fill (args)
+
+        if Envelope is not None and Template.Verified:
+            return Envelope
+
+        Expected = method.binding.input.get_message (
+            method, args, {}).plain ().encode ('utf-8')
+
+        if Envelope is not None:
+
+            if Envelope == Expected:
+                Template.Verified = True
+
+            else:
+                self.Templates[method.name] = None
+
+        return Expected
+
+
+
+    def __get_template (self, method):
+        if method.name not in self.Templates:
+            options = self.client.options
+
+            if len (options.plugins) > 0 or options.wsse is not None:
+                self.Templates[method.name] = None
+
+            else:
+
+                try:
+
+                    self.Templates[method.name] = Template (method)
+
+                except ValueError:
+                    self.Templates[method.name] = None
+
+        return self.Templates[method.name]
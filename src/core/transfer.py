@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+
+
+
+from suds.transport import TransportError
+import httplib
+import logging
+import Queue
+import socket
+import sys
+import threading
+import urllib2
+
+
+
+TRANSFER_LOGGER_NAME = '{0}.pyFolder.TransferPool'
+TARGET_CHUNK_TIME = 1.0
+PIPELINE_POLL_INTERVAL = 0.5
+
+
+
+## The errors caused by a dropped or refused connection, after which a
+## transfer is worth retrying.
+
+TRANSIENT_ERRORS = (
+    socket.error,
+    httplib.HTTPException,
+    urllib2.URLError,
+    TransportError
+    )
+
+
+
+## Choose the size of the chunks a file is transferred in.
+#
+#  Unless ConfigManager.get_adaptive is set, the size is fixed to
+#  ConfigManager.get_soapbuflen. Otherwise the round trip time of each
+#  chunk is measured, and the size of the next chunk is chosen so that
+#  it takes about TARGET_CHUNK_TIME seconds at the measured throughput.
+#  The size at most doubles or halves per chunk, and never leaves the
+#  ConfigManager.get_minsoapbuflen, ConfigManager.get_maxsoapbuflen
+#  bounds. Fast links end up using a few large chunks, where the time
+#  spent in each round trip is negligible.
+
+class ChunkSizer:
+
+
+
+    ## The constructor.
+    #
+    #  @param cm A core.config.ConfigManager instance.
+
+    def __init__ (self, cm):
+        self.Size = cm.get_soapbuflen ()
+        self.Adaptive = cm.get_adaptive ()
+        self.Minimum = cm.get_minsoapbuflen ()
+        self.Maximum = cm.get_maxsoapbuflen ()
+
+        if self.Adaptive:
+            self.Size = self.__clamp (self.Size)
+
+
+
+    def __clamp (self, Size):
+        return max (self.Minimum, min (self.Maximum, int (Size)))
+
+
+
+    ## Account for a transferred chunk.
+    #
+    #  Chunks shorter than the current size, such as the last chunk of a
+    #  file, tell nothing about the link and are ignored.
+    #
+    #  @param Length The number of bytes transferred.
+    #  @param Elapsed The number of seconds the transfer took.
+
+    def record (self, Length, Elapsed):
+        if not self.Adaptive or Length < self.Size:
+            return
+
+        if Elapsed <= 0:
+            Size = self.Size * 2
+
+        else:
+            Size = Length * TARGET_CHUNK_TIME / Elapsed
+            Size = max (self.Size / 2, min (self.Size * 2, Size))
+
+        self.Size = self.__clamp (Size)
+
+
+
+## Iterate over the given iterable on a helper thread, running up to
+## Depth items ahead of the caller.
+#
+#  This lets the helper thread wait for the network while the caller
+#  writes to disk, or the other way around. Exceptions raised by the
+#  iterable are raised again to the caller. If the caller closes the
+#  generator early, the helper thread is stopped and waited for, so
+#  that whatever the iterable uses is free again.
+#
+#  @param Iterable The iterable to consume.
+#  @param Depth The maximum number of items waiting for the caller. If
+#               it is 0, Iterable is consumed in the calling thread.
+#
+#  @return A generator of the items of Iterable.
+
+def pipelined (Iterable, Depth):
+    if Depth <= 0:
+        for Item in Iterable:
+            yield Item
+
+        return
+
+    Items = Queue.Queue (Depth)
+    Stopped = threading.Event ()
+
+    def put (Item, Error=None):
+        while not Stopped.is_set ():
+
+            try:
+
+                Items.put ((Item, Error), timeout=PIPELINE_POLL_INTERVAL)
+                return True
+
+            except Queue.Full:
+                pass
+
+        return False
+
+    def produce ():
+        try:
+
+            for Item in Iterable:
+                if not put (Item):
+                    return
+
+        except:
+            put (None, sys.exc_info ())
+            return
+
+        put (None, StopIteration)
+
+    Thread = threading.Thread (target=produce)
+    Thread.daemon = True
+    Thread.start ()
+
+    try:
+
+        while True:
+            Item, Error = Items.get ()
+
+            if Error is StopIteration:
+                break
+
+            if Error is not None:
+                raise Error[0], Error[1], Error[2]
+
+            yield Item
+
+    finally:
+        Stopped.set ()
+        Thread.join ()
+
+
+
+## A file transfer waiting to be completed.
+
+class Transfer:
+
+
+
+    ## The constructor.
+    #
+    #  @param Key A string identifying the transferred file.
+    #  @param Function The callable that performs the transfer. It is
+    #                  invoked with an iFolderWS instance as first
+    #                  argument, followed by args.
+    #  @param args The arguments list to pass to Function.
+    #  @param OnError A callable invoked with the raised exception if
+    #                 the transfer fails, or None.
+
+    def __init__ (self, Key, Function, args, OnError):
+        self.Key = Key
+        self.Function = Function
+        self.args = args
+        self.OnError = OnError
+        self.Callbacks = []
+
+
+
+## Run the file transfers on a pool of worker threads.
+#
+#  Each worker owns its own core.ifolderws.iFolderWS instance. The
+#  outcome of the transfers is handled by TransferPool.join, in the
+#  calling thread, so that the callbacks can safely access the local
+#  database. With a single worker, the transfers are run as soon as
+#  they are submitted, in the calling thread.
+
+class TransferPool:
+
+
+
+    ## The constructor.
+    #
+    #  @param cm A core.config.ConfigManager instance.
+    #  @param ifolderws The core.ifolderws.iFolderWS instance to clone
+    #                   for each worker.
+    #  @param Workers The number of concurrent transfers.
+    #  @param Retries How many times a transfer interrupted by a
+    #                 connection error is restarted.
+
+    def __init__ (self, cm, ifolderws, Workers, Retries=0):
+        self.logger = logging.getLogger (
+            TRANSFER_LOGGER_NAME.format (cm.get_username ()))
+
+        self.ifolderws = ifolderws
+        self.Workers = Workers
+        self.Retries = Retries
+        self.Threads = []
+        self.Jobs = Queue.Queue ()
+        self.Results = Queue.Queue ()
+        self.Pending = {}
+        self.Failed = set ()
+        self.Outstanding = 0
+        self.Failures = 0
+
+
+
+    def __start (self):
+        for i in range (self.Workers):
+            Thread = threading.Thread (
+                target=self.__work, args=(self.ifolderws.clone (),))
+
+            Thread.daemon = True
+            Thread.start ()
+            self.Threads.append (Thread)
+
+        self.logger.debug ('Started {0} transfer workers'.format (
+                self.Workers))
+
+
+
+    def __work (self, ifolderws):
+        while True:
+            Job = self.Jobs.get ()
+
+            if Job is None:
+                break
+
+            try:
+
+                self.__run (Job, ifolderws)
+                self.Results.put ((Job, None))
+
+            except Exception:
+                self.Results.put ((Job, sys.exc_info ()))
+
+
+
+    ## Run a transfer, restarting it from scratch if the connection is
+    ## lost, up to TransferPool.Retries times.
+    #
+    #  The iFolder Web Service has no way to reopen a file at a given
+    #  offset, so an interrupted transfer can't be resumed.
+
+    def __run (self, Job, ifolderws):
+        Attempt = 0
+
+        while True:
+
+            try:
+
+                return Job.Function (ifolderws, *Job.args)
+
+            except TRANSIENT_ERRORS, e:
+                Attempt = Attempt + 1
+
+                if Attempt > self.Retries:
+                    raise
+
+                self.logger.warning (
+                    'Transfer of `{0}\' interrupted ({1}), ' \
+                        'retrying'.format (Job.Key.encode ('utf-8'), e))
+
+
+
+    ## Handle a failed transfer.
+    #
+    #  The error handler is invoked while the exception is being
+    #  handled, so that it can raise it again with a bare raise
+    #  statement, keeping the original traceback.
+    #
+    #  @param Job The failed Transfer instance.
+    #  @param ExcInfo The tuple returned by sys.exc_info when the
+    #                 transfer failed.
+
+    def __fail (self, Job, ExcInfo):
+        self.Failures = self.Failures + 1
+        self.Failed.add (Job.Key)
+
+        try:
+
+            raise ExcInfo[0], ExcInfo[1], ExcInfo[2]
+
+        except Exception, e:
+            if Job.OnError is None:
+                raise
+
+            Job.OnError (e)
+
+
+
+    ## Schedule a new transfer.
+    #
+    #  @param Key A string identifying the transferred file.
+    #  @param Function The callable that performs the transfer.
+    #  @param args The arguments list to pass to Function.
+    #  @param OnError A callable invoked with the raised exception if
+    #                 the transfer fails. It can raise the exception
+    #                 again with a bare raise statement.
+
+    def submit (self, Key, Function, args, OnError=None):
+        Job = Transfer (Key, Function, args, OnError)
+
+        if self.Workers <= 1:
+            self.Failed.discard (Key)
+
+            try:
+                self.__run (Job, self.ifolderws)
+
+            except Exception:
+                self.__fail (Job, sys.exc_info ())
+
+            return
+
+        if len (self.Threads) == 0:
+            self.__start ()
+
+        self.Pending[Key] = Job
+        self.Outstanding = self.Outstanding + 1
+        self.Jobs.put (Job)
+
+
+
+    ## Invoke the given callable once the transfer identified by Key
+    ## succeeds.
+    #
+    #  Callback is invoked immediately if there is no pending transfer
+    #  for Key, and never if it failed.
+    #
+    #  @param Key A string identifying the transferred file.
+    #  @param Callback The callable to invoke.
+    #  @param args The arguments list to pass to Callback.
+
+    def then (self, Key, Callback, *args):
+        if Key in self.Failed:
+            return
+
+        if Key in self.Pending:
+            self.Pending[Key].Callbacks.append ((Callback, args))
+            return
+
+        Callback (*args)
+
+
+
+    ## Wait for all the pending transfers and handle their outcome.
+    #
+    #  If an error handler raises an exception, the remaining transfers
+    #  are still handled before the exception is propagated.
+
+    def join (self):
+        Raised = None
+
+        while self.Outstanding > 0:
+            Job, ExcInfo = self.Results.get ()
+            self.Outstanding = self.Outstanding - 1
+
+            if self.Pending.get (Job.Key) is Job:
+                del self.Pending[Job.Key]
+
+            try:
+
+                if ExcInfo is None:
+                    for Callback, args in Job.Callbacks:
+                        Callback (*args)
+
+                else:
+                    self.__fail (Job, ExcInfo)
+
+            except Exception:
+                if Raised is None:
+                    Raised = sys.exc_info ()
+
+        self.Failed.clear ()
+
+        if Raised is not None:
+            raise Raised[0], Raised[1], Raised[2]
+
+
+
+    ## Stop the worker threads.
+
+    def stop (self):
+        for Thread in self.Threads:
+            self.Jobs.put (None)
+
+        self.Threads = []
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+
+
+
+from StringIO import StringIO
+from suds.transport import Reply, TransportError
+from suds.transport.http import HttpAuthenticated
+from urlparse import urlparse
+import base64
+import errno
+import httplib
+import socket
+import threading
+import time
+import urllib
+import urllib2
+
+
+
+STREAM_BLOCK_SIZE = 65536
+
+
+
+## A pool of persistent HTTP connections, shared by the transports of
+## all the iFolderWS instances.
+#
+#  Up to Size idle connections are kept open for each host, and closed
+#  once they have been idle for IdleTimeout seconds.
+
+class ConnectionPool:
+
+
+
+    ## The constructor.
+    #
+    #  @param Size The maximum number of idle connections kept per host.
+    #  @param IdleTimeout The number of seconds after which an idle
+    #                     connection is not reused.
+
+    def __init__ (self, Size, IdleTimeout):
+        self.Size = Size
+        self.IdleTimeout = IdleTimeout
+        self.Idle = {}
+        self.Lock = threading.Lock ()
+
+
+
+    ## Get a connection to the given host.
+    #
+    #  @param Scheme Either `http' or `https'.
+    #  @param Host The host, with an optional port.
+    #  @param Timeout The socket timeout, in seconds.
+    #
+    #  @return A tuple (Connection, Reused), where Reused is True whether
+    #          the connection has already been used.
+
+    def get (self, Scheme, Host, Timeout):
+        Key = (Scheme, Host)
+        Now = time.time ()
+
+        with self.Lock:
+            Idle = self.Idle.get (Key, [])
+
+            while len (Idle) > 0:
+                Connection, Since = Idle.pop ()
+
+                if Now - Since < self.IdleTimeout:
+                    return Connection, True
+
+                Connection.close ()
+
+        if Scheme == 'https':
+            return httplib.HTTPSConnection (Host, timeout=Timeout), False
+
+        return httplib.HTTPConnection (Host, timeout=Timeout), False
+
+
+
+    ## Give back a connection, once its response has been read.
+
+    def put (self, Scheme, Host, Connection):
+        with self.Lock:
+            Idle = self.Idle.setdefault ((Scheme, Host), [])
+
+            if len (Idle) < self.Size:
+                Idle.append ((Connection, time.time ()))
+                return
+
+        Connection.close ()
+
+
+
+    ## Close all of the idle connections.
+
+    def close (self):
+        with self.Lock:
+            for Idle in self.Idle.values ():
+                for Connection, Since in Idle:
+                    Connection.close ()
+
+            self.Idle = {}
+
+
+
+## A suds transport sending the SOAP requests over persistent
+## connections, taken from a ConnectionPool.
+#
+#  The credentials are sent along with each request, rather than after
+#  the server asked for them, which saves another round trip per call.
+#  Requests through a proxy fall back to the urllib2 implementation.
+
+class KeepAliveTransport (HttpAuthenticated):
+
+
+
+    ## The constructor.
+    #
+    #  @param pool The ConnectionPool to take the connections from.
+    #  @param kwargs The suds transport options.
+
+    def __init__ (self, pool=None, **kwargs):
+        HttpAuthenticated.__init__ (self, **kwargs)
+        self.pool = pool
+
+
+
+    def addcredentials (self, request):
+        credentials = self.credentials ()
+
+        if None not in credentials:
+            request.headers['Authorization'] = \
+                'Basic {0}'.format (base64.b64encode (':'.join (credentials)))
+
+
+
+    def send (self, request):
+        if self.pool is None or len (self.options.proxy) > 0:
+            return HttpAuthenticated.send (self, request)
+
+        Response, Body = self.__send (request, None)
+
+        if Response.status in (202, 204):
+            return None
+
+        return Reply (200, Response.msg.dict, Body)
+
+
+
+    ## Send a request, and hand its reply over to the given callable
+    ## block by block as it arrives, rather than reading it whole.
+    #
+    #  @param request A suds.transport.Request instance.
+    #  @param Consumer A callable, invoked with each block of the reply.
+    #
+    #  @throw TransportError If the server replied with an error status,
+    #                        in which case the reply is not streamed.
+
+    def stream (self, request, Consumer):
+        if self.pool is None or len (self.options.proxy) > 0:
+            Result = HttpAuthenticated.send (self, request)
+
+            if Result is not None:
+                Consumer (Result.message)
+
+        else:
+            self.__send (request, Consumer)
+
+
+
+    ## Send a request over a pooled connection, along with the
+    ## credentials and the cookies.
+    #
+    #  @return A tuple (Response, Body).
+
+    def __send (self, request, Consumer):
+        self.addcredentials (request)
+
+        u2request = urllib2.Request (
+            request.url, request.message, request.headers)
+
+        self.addcookies (u2request)
+        Headers = dict (request.headers)
+
+        if u2request.has_header ('Cookie'):
+            Headers['Cookie'] = u2request.get_header ('Cookie')
+
+        Url = urlparse (request.url)
+        Path = Url.path or '/'
+
+        if Url.query:
+            Path = '{0}?{1}'.format (Path, Url.query)
+
+        Response, Body = self.__post (
+            Url.scheme, Url.netloc, Path, request.message, Headers, Consumer)
+
+        self.getcookies (
+            urllib.addinfourl (StringIO (Body), Response.msg, request.url),
+            u2request)
+
+        if Response.status >= 300:
+            raise TransportError (
+                Response.reason, Response.status, StringIO (Body))
+
+        return Response, Body
+
+
+
+    ## Send a request over a pooled connection.
+    #
+    #  A connection that has been idle may have been closed by the
+    #  server in the meantime, in which case the request is sent again
+    #  over a new connection. That's the case only whether the request
+    #  couldn't be sent, or the connection was closed before any byte of
+    #  the reply was received, since the server may have run the request
+    #  otherwise. Timeouts are never retried.
+    #
+    #  @return A tuple (Response, Body), where Body is empty whether the
+    #          reply has been streamed to the Consumer.
+
+    def __post (self, Scheme, Host, Path, Message, Headers, Consumer):
+        while True:
+            Connection, Reused = self.pool.get (
+                Scheme, Host, self.options.timeout)
+
+            try:
+
+                Connection.request ('POST', Path, Message, Headers)
+
+            except socket.timeout:
+                Connection.close ()
+                raise
+
+            except (socket.error, httplib.HTTPException):
+                Connection.close ()
+
+                if Reused:
+                    continue
+
+                raise
+
+            except:
+                Connection.close ()
+                raise
+
+            try:
+
+                Response = Connection.getresponse ()
+
+            except (socket.error, httplib.HTTPException), e:
+                Connection.close ()
+
+                if Reused and self.__closed_by_server (e):
+                    continue
+
+                raise
+
+            except:
+                Connection.close ()
+                raise
+
+            try:
+
+                if Consumer is None or Response.status != 200:
+                    Body = Response.read ()
+
+                else:
+                    Body = ''
+                    Block = Response.read (STREAM_BLOCK_SIZE)
+
+                    while len (Block) > 0:
+                        Consumer (Block)
+                        Block = Response.read (STREAM_BLOCK_SIZE)
+
+            except:
+                Connection.close ()
+                raise
+
+            if Response.will_close:
+                Connection.close ()
+
+            else:
+                self.pool.put (Scheme, Host, Connection)
+
+            return Response, Body
+
+
+
+    ## Whether the given error, raised while waiting for the reply,
+    ## means that the server closed the connection without sending any
+    ## byte back.
+
+    def __closed_by_server (self, Error):
+        if isinstance (Error, httplib.BadStatusLine):
+            return not str (Error.line).startswith ('HTTP/')
+
+        if isinstance (Error, socket.timeout):
+            return False
+
+        return isinstance (Error, socket.error) and \
+            Error.errno == errno.ECONNRESET
+
+
+
+    def __deepcopy__ (self, memo={}):
+        clone = HttpAuthenticated.__deepcopy__ (self, memo)
+        clone.pool = self.pool
+        return clone
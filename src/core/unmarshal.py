@@ -0,0 +1,614 @@
+# -*- coding: utf-8 -*-
+
+
+
+from suds.client import SoapClient
+from suds.sax.text import Text
+from suds.sudsobject import Factory
+from suds.transport import Request, TransportError
+from template import TemplateCache
+from xml.parsers import expat
+import binascii
+import string
+
+
+
+ENVELOPE_NS = 'http://schemas.xmlsoap.org/soap/envelope/'
+XSI_NS = 'http://www.w3.org/2001/XMLSchema-instance'
+RESERVED_NAMES = { 'class' : 'cls', 'def' : 'dfn' }
+PARSER_BUFFER_SIZE = 65536
+BASE64_ALPHABET = string.ascii_letters + string.digits + '+/='
+BASE64_JUNK = ''.join (
+    [x for x in map (chr, range (256)) if x not in BASE64_ALPHABET])
+
+
+
+## Raised whenever a reply can't be handled by the FastUnmarshaller,
+## which then hands it over to suds.
+
+class Unsupported (Exception):
+    pass
+
+
+
+## The precompiled unmarshalling rules for the elements of a given
+## schema type.
+#
+#  These are the same rules suds.umx.typed.Typed resolves for each node
+#  of each reply, computed once per type instead.
+
+class Plan:
+
+
+
+    ## The constructor.
+    #
+    #  @param Type The schema object describing the element.
+
+    def __init__ (self, Type):
+        Resolved = Type.resolve ()
+
+        self.Real = Resolved.resolve ()
+        self.Name = self.Real.name
+        self.Unbounded = Type.unbounded ()
+        self.Nillable = Type.nillable or \
+            (Resolved.builtin () and Resolved.nillable)
+        self.translate = self.Real.resolve ().translate
+        self.Children = {}
+        self.Record = None
+
+
+
+    ## Get the Plan of the child element with the given name.
+
+    def child (self, Name):
+        Child = self.Children.get (Name)
+
+        if Child is None:
+            Type, Ancestry = self.Real.get_child (Name)
+
+            if Type is None:
+                raise Unsupported (Name)
+
+            Child = Plan (Type)
+            self.Children[Name] = Child
+
+        return Child
+
+
+
+    ## Get the Record class holding the child elements.
+
+    def record (self):
+        if self.Record is None:
+            Slots = []
+
+            for Child, Ancestry in self.Real.children ():
+                if Child.any ():
+                    raise Unsupported (self.Name)
+
+                Slots.append (RESERVED_NAMES.get (Child.name, Child.name))
+
+            self.Record = type (
+                str (self.Name or 'Record'), (Record,),
+                { '__slots__' : tuple (Slots) })
+
+        return self.Record
+
+
+
+## A compact stand-in for the suds objects, used by the FastUnmarshaller
+## in lean mode.
+#
+#  Each schema type gets a Record subclass, whose slots are the names of
+#  its child elements. Records have neither a __dict__ nor the suds
+#  metadata, so that a reply listing hundreds of thousands of entries
+#  takes a fraction of the memory. As with the suds objects, the child
+#  elements missing from the reply are missing attributes.
+
+class Record (object):
+    __slots__ = ()
+
+
+
+    def __contains__ (self, Name):
+        return hasattr (self, Name)
+
+
+
+    def __iter__ (self):
+        for Name in self.__slots__:
+            if hasattr (self, Name):
+                yield Name, getattr (self, Name)
+
+
+
+    def __repr__ (self):
+        return '({0}){{ {1} }}'.format (
+            self.__class__.__name__,
+            ', '.join (['{0} = {1!r}'.format (Name, Value)
+                        for Name, Value in self]))
+
+
+
+## An element being unmarshalled.
+
+class Frame:
+
+
+
+    def __init__ (self, Plan, Name):
+        self.Plan = Plan
+        self.Name = Name
+        self.Data = None
+        self.Text = []
+        self.Nil = False
+
+
+
+## Decode a base64 encoded element of a reply into a file, as the
+## reply is fed block by block.
+#
+#  Only the few characters that don't make up a whole base64 quantum
+#  are held between two blocks. The reply itself is kept only up to the
+#  start of the element, so that it can still be handed over to suds
+#  whether it turns out to be a fault.
+
+class Base64Stream:
+
+
+
+    ## The constructor.
+    #
+    #  @param File The file to write the decoded data to.
+    #  @param Depth The depth of the element within the envelope, which
+    #               is at depth 1.
+
+    def __init__ (self, File, Depth):
+        self.File = File
+        self.ElementDepth = Depth
+        self.Depth = 0
+        self.InBody = False
+        self.InElement = False
+        self.Found = False
+        self.Nil = False
+        self.Length = 0
+        self.Pending = ''
+        self.Blocks = []
+
+        self.Parser = expat.ParserCreate (namespace_separator=' ')
+        self.Parser.returns_unicode = False
+        self.Parser.buffer_text = True
+        self.Parser.buffer_size = PARSER_BUFFER_SIZE
+        self.Parser.StartElementHandler = self.__start
+        self.Parser.EndElementHandler = self.__end
+        self.Parser.CharacterDataHandler = self.__characters
+
+
+
+    ## Feed a block of the reply.
+
+    def feed (self, Block):
+        if self.Blocks is not None:
+            self.Blocks.append (Block)
+
+        self.Parser.Parse (Block, False)
+
+
+
+    ## Signal the end of the reply.
+    #
+    #  @return The reply, whether the element has not been found in it,
+    #          None otherwise.
+
+    def close (self):
+        if self.Blocks is not None and len (self.Blocks) == 0:
+            return ''
+
+        self.Parser.Parse ('', True)
+
+        if self.Blocks is not None:
+            return ''.join (self.Blocks)
+
+        return None
+
+
+
+    def __start (self, Name, Attributes):
+        Namespace, Space, Name = Name.rpartition (' ')
+        self.Depth = self.Depth + 1
+
+        if self.Depth == 2:
+            self.InBody = Name == 'Body' and Namespace == ENVELOPE_NS
+
+        if not self.InBody or self.Found or self.Blocks is None:
+            return
+
+        if self.Depth == 3 and Name == 'Fault' and \
+                Namespace == ENVELOPE_NS:
+            self.Found = True
+            return
+
+        if self.Depth == self.ElementDepth:
+            self.Found = True
+            self.InElement = True
+            self.Nil = Attributes.get (XSI_NS + ' nil', '') == 'true'
+            self.Blocks = None
+
+
+
+    ## Decode the whole quanta received so far.
+    #
+    #  The characters out of the base64 alphabet are skipped. The data
+    #  from the quantum holding the first padding character on is held
+    #  until the end of the element, and then decoded at once, so that
+    #  the result is always the same as binascii.a2b_base64 on the
+    #  whole element.
+
+    def __characters (self, Data):
+        if not self.InElement:
+            return
+
+        Data = self.Pending + Data.translate (None, BASE64_JUNK)
+        Whole = len (Data) - len (Data) % 4
+        Padding = Data.find ('=', 0, Whole)
+
+        if Padding >= 0:
+            Whole = Padding - Padding % 4
+
+        self.Pending = Data[Whole:]
+        self.__write (Data[:Whole])
+
+
+
+    def __end (self, Name):
+        if self.InElement and self.Depth == self.ElementDepth:
+            self.InElement = False
+            self.__write (self.Pending)
+            self.Pending = ''
+
+        self.Depth = self.Depth - 1
+
+
+
+    def __write (self, Data):
+        if len (Data) > 0:
+            Data = binascii.a2b_base64 (Data)
+            self.File.write (Data)
+            self.Length = self.Length + len (Data)
+
+
+
+## Unmarshal the replies of the given suds client straight from the
+## expat events, without building the intermediate suds.sax.element
+## tree nor resolving the schema type of each node.
+#
+#  The results are the same suds objects the client would return. The
+#  replies using features the iFolder Web Service doesn't use, such as
+#  attributes, xsi:type or multiple parts, are handed over to suds. The
+#  requests are filled in from a TemplateCache. In lean mode, the
+#  results are made of Record instances and plain unicode strings.
+
+class FastUnmarshaller:
+
+
+
+    ## The constructor.
+    #
+    #  @param client The suds.client.Client instance to use.
+    #  @param Lean Whether to return Record instances rather than suds
+    #              objects.
+
+    def __init__ (self, client, Lean=False):
+        self.client = client
+        self.Lean = Lean
+        self.templates = TemplateCache (client)
+        self.Plans = {}
+
+
+
+    ## Invoke a SOAP method.
+    #
+    #  @param Name The name of the method.
+    #  @param args The arguments of the method.
+    #
+    #  @return The unmarshalled reply.
+
+    def invoke (self, Name, *args):
+        Method = getattr (self.client.service, Name).method
+        Reply = self.__send (Method, args, None)
+
+        if Reply is None or len (Reply) == 0:
+            return None
+
+        try:
+
+            return self.unmarshal (Method, Reply)
+
+        except Unsupported:
+            Root, Result = Method.binding.output.get_reply (Method, Reply)
+            return Result
+
+
+
+    ## Invoke a SOAP method returning base64 encoded data, and decode
+    ## it into the given file.
+    #
+    #  Whether the transport can stream the reply, the data is decoded
+    #  as it arrives from the socket rather than once the whole reply
+    #  has been read and unmarshalled.
+    #
+    #  @param Name The name of the method.
+    #  @param File The file to write the decoded data to.
+    #  @param args The arguments of the method.
+    #
+    #  @return The number of bytes written, or None whether the method
+    #          returned no data.
+
+    def decode_into (self, Name, File, *args):
+        Method = getattr (self.client.service, Name).method
+        Transport = self.client.options.transport
+
+        try:
+
+            Root, Wrapped = self.__get_plan (Method)
+
+        except Unsupported:
+            Root, Wrapped = None, None
+
+        if Root is None or not hasattr (Transport, 'stream'):
+            return self.__write (File, self.invoke (Name, *args))
+
+        Stream = Base64Stream (File, 3 + Wrapped)
+        self.__send (Method, args, Stream.feed)
+        Reply = Stream.close ()
+
+        if Reply is not None:
+
+            if len (Reply) == 0:
+                return None
+
+            Root, Result = Method.binding.output.get_reply (Method, Reply)
+            return self.__write (File, Result)
+
+        if Stream.Nil or (Stream.Length == 0 and Root.Nillable):
+            return None
+
+        return Stream.Length
+
+
+
+    ## Send the request invoking a SOAP method.
+    #
+    #  @param Consumer A callable the reply is streamed to, or None to
+    #                  read it whole.
+    #
+    #  @return The raw reply, or None whether there is none or it has
+    #          been streamed.
+    #
+    #  @throw suds.WebFault If the server replied with a fault.
+
+    def __send (self, method, args, Consumer):
+        Client = SoapClient (self.client, method)
+        Transport = self.client.options.transport
+
+        Message = Request (
+            Client.location (), self.templates.render (method, args))
+        Message.headers = Client.headers ()
+
+        try:
+
+            if Consumer is None:
+                Reply = Transport.send (Message)
+
+                if Reply is not None:
+                    return Reply.message
+
+            else:
+                Transport.stream (Message, Consumer)
+
+        except TransportError, e:
+            if e.httpcode not in (202, 204):
+                Client.failed (method.binding.input, e)
+
+        return None
+
+
+
+    def __write (self, File, Base64Data):
+        if Base64Data is None:
+            return None
+
+        Data = binascii.a2b_base64 (Base64Data)
+        File.write (Data)
+
+        return len (Data)
+
+
+
+    ## Unmarshal the reply of the given method.
+    #
+    #  @param method The suds method the reply comes from.
+    #  @param Reply The reply, as an XML string.
+    #
+    #  @return The unmarshalled reply.
+    #
+    #  @throw Unsupported If the reply can't be unmarshalled.
+
+    def unmarshal (self, method, Reply):
+        Root, Wrapped = self.__get_plan (method)
+
+        self.Stack = []
+        self.Depth = 0
+        self.InBody = False
+        self.Result = None
+        self.Wrapped = Wrapped
+        self.RootPlan = Root
+        self.Done = False
+
+        Parser = expat.ParserCreate (namespace_separator=' ')
+        Parser.buffer_text = True
+        Parser.StartElementHandler = self.__start
+        Parser.EndElementHandler = self.__end
+        Parser.CharacterDataHandler = self.__characters
+
+        try:
+
+            Parser.Parse (Reply, True)
+
+        except expat.ExpatError, e:
+            raise Unsupported (e)
+
+        return self.Result
+
+
+
+    def __get_plan (self, method):
+        if method.name not in self.Plans:
+            ReturnedTypes = method.binding.output.returned_types (method)
+
+            if len (self.client.options.plugins) > 0 or \
+                    len (ReturnedTypes) != 1 or \
+                    ReturnedTypes[0].unbounded ():
+                self.Plans[method.name] = None
+
+            else:
+                self.Plans[method.name] = (
+                    Plan (ReturnedTypes[0].resolve (nobuiltin=True)),
+                    method.soap.output.body.wrapped)
+
+        if self.Plans[method.name] is None:
+            raise Unsupported (method.name)
+
+        return self.Plans[method.name]
+
+
+
+    ## Handle the start of an element.
+    #
+    #  The elements outside of the returned one, that is the envelope,
+    #  the body and the wrapper element if any, are only counted.
+
+    def __start (self, Name, Attributes):
+        Namespace, Space, Name = Name.rpartition (' ')
+        self.Depth = self.Depth + 1
+
+        if len (self.Stack) == 0:
+
+            if self.Depth == 2:
+                self.InBody = Name == 'Body' and Namespace == ENVELOPE_NS
+
+            if self.Depth < 3 or not self.InBody:
+                return
+
+            if self.Depth == 3 and Name == 'Fault' and \
+                    Namespace == ENVELOPE_NS:
+                raise Unsupported (Name)
+
+            if self.Done or self.Depth != 3 + self.Wrapped:
+                return
+
+            Node = Frame (self.RootPlan, Name)
+
+        else:
+            Node = Frame (self.Stack[-1].Plan.child (Name), Name)
+
+        for Attribute, Value in Attributes.iteritems ():
+            if Attribute != XSI_NS + ' nil':
+                raise Unsupported (Attribute)
+
+            Node.Nil = Value.lower () == 'true'
+
+        self.Stack.append (Node)
+
+
+
+    def __characters (self, Data):
+        if len (self.Stack) > 0:
+            self.Stack[-1].Text.append (Data)
+
+
+
+    ## Handle the end of an element, following the rules of
+    ## suds.umx.core.Core.postprocess.
+
+    def __end (self, Name):
+        self.Depth = self.Depth - 1
+
+        if len (self.Stack) == 0:
+            return
+
+        Node = self.Stack.pop ()
+        Content = u''.join (Node.Text)
+
+        if Node.Data is not None:
+
+            if len (Content.strip ()) > 0:
+                raise Unsupported (Node.Name)
+
+            Value = Node.Data
+
+        elif Node.Nil:
+            Value = None
+
+        elif len (Content) == 0:
+            Value = self.__text ('')
+
+            if Node.Plan.Nillable:
+                Value = None
+
+        else:
+            Value = Node.Plan.translate (Text (Content))
+
+            if isinstance (Value, basestring):
+                Value = self.__text (Value)
+
+        if len (self.Stack) == 0:
+            self.Result = Value
+            self.Done = True
+            return
+
+        self.__append (self.Stack[-1], Node, Value)
+
+
+
+    def __text (self, Value):
+        if self.Lean:
+            return unicode (Value)
+
+        return Text (Value)
+
+
+
+    ## Append an unmarshalled child element to its parent, following
+    ## the rules of suds.umx.core.Core.append_children.
+
+    def __append (self, Parent, Node, Value):
+        if Parent.Data is None and self.Lean:
+            Parent.Data = Parent.Plan.record () ()
+
+        elif Parent.Data is None:
+            Parent.Data = Factory.object (Parent.Plan.Name or Parent.Name)
+            Parent.Data.__metadata__.sxtype = Parent.Plan.Real
+
+        Key = RESERVED_NAMES.get (Node.Name, Node.Name)
+
+        if Key in Parent.Data:
+            Current = getattr (Parent.Data, Key)
+
+            if isinstance (Current, list):
+                Current.append (Value)
+
+            else:
+                setattr (Parent.Data, Key, [Current, Value])
+
+        elif Node.Plan.Unbounded:
+
+            if Value is None:
+                setattr (Parent.Data, Key, [])
+
+            else:
+                setattr (Parent.Data, Key, [Value])
+
+        else:
+            setattr (Parent.Data, Key, Value)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | \
+    IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | \
+    IN_ONLYDIR
+
+EVENT_FORMAT = 'iIII'
+EVENT_SIZE = struct.calcsize (EVENT_FORMAT)
+READ_BUFLEN = 65536
+
+
+
+## Watch local directory trees for changes, through the Linux inotify
+## interface.
+#
+#  The constructor raises OSError if inotify is not available on the
+#  host operating system.
+
+class Watcher:
+
+
+
+    def __init__ (self):
+        if not sys.platform.startswith ('linux'):
+            raise OSError (errno.ENOSYS, 'inotify is not available')
+
+        self.libc = ctypes.CDLL (ctypes.util.find_library ('c'), \
+                                     use_errno=True)
+
+        self.fd = self.libc.inotify_init ()
+
+        if self.fd < 0:
+            Errno = ctypes.get_errno ()
+            raise OSError (Errno, os.strerror (Errno))
+
+        self.encoding = sys.getfilesystemencoding ()
+        self.Paths = {}
+        self.Roots = set ()
+
+
+
+    ## Watch the given directory tree, including the directories which
+    ## will be created within it.
+    #
+    #  @param Root The full path to the directory tree.
+
+    def add (self, Root):
+        self.Roots.add (Root)
+        self.__add_tree (Root)
+
+
+
+    def __add_tree (self, Root):
+        for Path, Dirs, Files in os.walk (Root):
+            self.__add_watch (Path)
+
+
+
+    ## Stop watching a directory tree which has been moved away.
+
+    def __remove_tree (self, Root):
+        Prefix = os.path.join (Root, '')
+
+        for Wd, Path in self.Paths.items ():
+
+            if Path == Root or Path.startswith (Prefix):
+                self.libc.inotify_rm_watch (self.fd, Wd)
+                del self.Paths[Wd]
+
+
+
+    def __add_watch (self, Path):
+        EncodedPath = Path
+
+        if isinstance (Path, unicode):
+            EncodedPath = Path.encode (self.encoding)
+
+        Wd = self.libc.inotify_add_watch (self.fd, EncodedPath, WATCH_MASK)
+
+        if Wd >= 0:
+            self.Paths[Wd] = Path
+
+
+
+    ## Wait for changes.
+    #
+    #  @param Timeout The maximum number of seconds to wait, or None to
+    #                 wait forever.
+    #
+    #  @return The set of the full paths changed in the meantime, empty
+    #          if the timeout expired. If the kernel dropped some events,
+    #          the whole watched trees are returned.
+
+    def read (self, Timeout=None):
+        Changed = set ()
+
+        try:
+            Readable, Writable, Errors = select.select (
+                [self.fd], [], [], Timeout)
+
+        except select.error, e:
+            if e.args[0] == errno.EINTR:
+                return Changed
+
+            raise
+
+        if len (Readable) == 0:
+            return Changed
+
+        Buffer = os.read (self.fd, READ_BUFLEN)
+        Offset = 0
+        Overflow = False
+
+        while Offset + EVENT_SIZE <= len (Buffer):
+            Wd, Mask, Cookie, Length = struct.unpack_from (
+                EVENT_FORMAT, Buffer, Offset)
+
+            Name = Buffer[Offset + EVENT_SIZE:Offset + EVENT_SIZE + Length]
+            Name = Name.rstrip ('\0')
+            Offset = Offset + EVENT_SIZE + Length
+
+            if Mask & IN_Q_OVERFLOW:
+                Overflow = True
+                continue
+
+            Parent = self.Paths.get (Wd)
+
+            if Parent is None:
+                continue
+
+            if Mask & IN_IGNORED:
+                del self.Paths[Wd]
+                continue
+
+            Path = Parent
+
+            if len (Name) > 0:
+
+                if isinstance (Parent, unicode):
+                    Name = Name.decode (self.encoding)
+
+                Path = os.path.join (Parent, Name)
+
+            if Mask & IN_ISDIR and Mask & IN_MOVED_FROM:
+                self.__remove_tree (Path)
+
+            if Mask & IN_ISDIR and Mask & (IN_CREATE | IN_MOVED_TO):
+                self.__add_tree (Path)
+
+            Changed.add (Path)
+
+        if Overflow:
+            Changed.update (self.Roots)
+
+        return Changed
+
+
+
+    def close (self):
+        os.close (self.fd)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+
+
+from suds.cache import ObjectCache
+from suds.options import Options
+from suds.reader import Reader
+import hashlib
+import httplib
+import json
+import logging
+import os
+import socket
+import time
+import urllib2
+
+
+
+WSDLCACHE_LOGGER_NAME = '{0}.pyFolder.WSDLCache'
+STAMP_FILE_NAME = 'pyfolder-{0}.stamp'
+VALIDATOR_HEADERS = [ 'etag', 'last-modified' ]
+
+
+
+## A persistent cache of the suds client model, that is the parsed WSDL
+## along with the schema built from it.
+#
+#  The model is pickled by suds, provided the client runs with the
+#  cachingpolicy option set to 1. Each cached WSDL is stamped with the
+#  ETag and Last-Modified headers the server sent for it. Within TTL
+#  seconds from the last check the model is loaded as is, without any
+#  network access. Afterwards, the headers are fetched again, and the
+#  model is rebuilt only if they changed.
+
+class WSDLCache (ObjectCache):
+
+
+
+    ## The constructor.
+    #
+    #  @param cm A core.config.ConfigManager instance.
+
+    def __init__ (self, cm):
+        ObjectCache.__init__ (self, location=cm.get_cachedir ())
+
+        self.TTL = cm.get_cachettl ()
+        self.logger = logging.getLogger (
+            WSDLCACHE_LOGGER_NAME.format (cm.get_username ()))
+
+
+
+    ## Make sure that the model cached for the given WSDL is still
+    ## current, and drop it otherwise.
+    #
+    #  @param Url The URL of the WSDL.
+    #  @param Headers A dictionary of HTTP headers to send along with the
+    #                 request, such as the credentials.
+
+    def revalidate (self, Url, Headers):
+        StampPath = os.path.join (
+            self.location,
+            STAMP_FILE_NAME.format (hashlib.md5 (Url).hexdigest ()))
+
+        Stamp = self.__load_stamp (StampPath)
+
+        if Stamp is not None and time.time () - Stamp['checked'] < self.TTL:
+            return
+
+        try:
+
+            Validators = self.__get_validators (Url, Headers)
+
+        except (urllib2.URLError, httplib.HTTPException, socket.error), e:
+            self.logger.warning (
+                'Could not check whether the WSDL changed ({0})'.format (e))
+            return
+
+        if Stamp is None or len (Validators) == 0 or \
+                Stamp['validators'] != Validators:
+            self.logger.debug ('Dropping the cached WSDL model')
+            self.purge (Reader (Options ()).mangle (Url, 'wsdl'))
+
+        self.__save_stamp (StampPath, {
+                'validators' : Validators,
+                'checked' : time.time ()
+                })
+
+
+
+    ## Get the validator headers of the given WSDL, through a HEAD
+    ## request.
+    #
+    #  @return A dictionary.
+
+    def __get_validators (self, Url, Headers):
+        Request = urllib2.Request (Url, headers=Headers)
+        Request.get_method = lambda : 'HEAD'
+
+        Response = urllib2.urlopen (Request)
+        Response.close ()
+
+        Validators = {}
+
+        for Name in VALIDATOR_HEADERS:
+            Value = Response.info ().getheader (Name)
+
+            if Value is not None:
+                Validators[Name] = Value
+
+        return Validators
+
+
+
+    ## The cache is shared by the clones of the suds client, which
+    ## deep-copy their options. It holds a logger, whose handlers can't
+    ## be copied.
+
+    def __deepcopy__ (self, memo={}):
+        return self
+
+
+
+    def __load_stamp (self, Path):
+        try:
+
+            with open (Path, 'r') as File:
+                return json.load (File)
+
+        except (IOError, ValueError):
+            return None
+
+
+
+    def __save_stamp (self, Path, Stamp):
+        try:
+
+            self.mktmp ()
+
+            with open (Path, 'w') as File:
+                json.dump (Stamp, File)
+
+        except IOError, e:
+            self.logger.warning (e)
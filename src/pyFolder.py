@@ -15,8 +15,12 @@ from core.dbm import DBM
 from core.config import ConfigManager
 from core.policy.PolicyFactory import *
 from core.ifolderws import iFolderWS
+from core.scanner import Snapshot, diff, prune
+from core.transfer import ChunkSizer, TransferPool, pipelined
+from core.transfer import TRANSIENT_ERRORS
 from core.notify.NotifierFactory import *
 from core.log.NullHandler import *
+from contextlib import closing
 from suds import WebFault
 
 
@@ -24,12 +28,15 @@ from suds import WebFault
 import base64
 import datetime
 import hashlib
+import io
 import logging
 import os
 import re
 import shutil
 import sqlite3
+import stat
 import sys
+import threading
 import time
 
 
@@ -38,7 +45,11 @@ DEFAULT_SOAP_BUFLEN = 32768
 DEFAULT_CONFIG_FILE = os.path.expanduser (os.path.join ('~', '.ifolderrc'))
 DEFAULT_SQLITE_FILE = os.path.expanduser (os.path.join ('~', '.ifolderdb'))
 SIMIAS_SYNC_INTERVAL = 5
+CHANGES_PAGE_SIZE = 256
+CHILDREN_PAGE_SIZE = 256
 CONFLICTED_SUFFIX = ' ({0}\'s conflicted copy {1} {2})'
+PARTIAL_DOWNLOAD_NAME = '.{0}.pyfolder-part'
+PARTIAL_DOWNLOAD_RE = re.compile (r'^\..*\.pyfolder-part$')
 CONFLICTED_SUFFIX_RE = re.compile (
     r' \((.*)\'s conflicted copy ' \
         '(\d{4}-\d{2}-\d{2}) (\d{2}\.\d{2}\.\d{2}.\d{6})\)')
@@ -50,7 +61,7 @@ LOGGER_FORMAT_STRING = \
     '%(module)s.%(funcName)s - ' \
     '%(message)s'
 PYFOLDER_LOGGER_NAME = '{0}.pyFolder'
-LOG_ONCE_ONLY = [ 'write_file', 'read_file' ]
+LOG_ONCE_ONLY = [ 'write_file', 'read_file', 'read_file_into' ]
 WRITE_FILE_PRINTABLE_ARGS_LIMIT = 20
 LAST_CALLED = None
 
@@ -63,6 +74,31 @@ RUN_AS_COMMAND = 2
 
 
 
+## Decorator for the synchronization actions, which read each local
+## iFolder tree at most once per run through a core.scanner.Snapshot.
+
+def scanning (Action):
+
+    def Wrapper (self, *args):
+        self.snapshot = Snapshot ()
+        self.local_changes = {}
+
+        try:
+
+            return Action (self, *args)
+
+        finally:
+
+            self.snapshot = None
+            self.local_changes = {}
+
+    Wrapper.__name__ = Action.__name__
+    Wrapper.__doc__ = Action.__doc__
+
+    return Wrapper
+
+
+
 class pyFolder:
 
 
@@ -75,9 +111,14 @@ class pyFolder:
     def __init__ (self, cm, runmode=RUN_AS_COMMAND):
         self.cm = cm
         self.runmode = runmode
+        self.hashbuffer = threading.local ()
+        self.digests = {}
+        self.snapshot = None
+        self.local_changes = {}
 
         self.__setup_logger ()
         self.__setup_ifolderws ()
+        self.__setup_transfers ()
         self.__setup_dbm ()
         self.__setup_policy ()
         self.__setup_notifier ()
@@ -90,6 +131,8 @@ class pyFolder:
     ## Shutdown the pyFolder client.
 
     def finalize (self):
+        self.transfers.stop ()
+        self.transfers = None
         self.dbm = None
         self.notifier = None
         self.policy = None
@@ -145,6 +188,15 @@ class pyFolder:
 
 
 
+    ## Helper method. 
+
+    def __setup_transfers (self):
+        self.transfers = TransferPool (
+            self.cm, self.ifolderws, self.cm.get_transfers (),
+            self.cm.get_retries ())
+
+
+
     ## Helper method. 
 
     def __setup_dbm (self):
@@ -434,26 +486,122 @@ class pyFolder:
     #  @param LocalPath The local path on which the remote file will be saved.
 
     def fetch (self, iFolderID, EntryID, LocalPath):
+        self.__fetch (self.ifolderws, iFolderID, EntryID, LocalPath)
+        self.__rescan (self.add_prefix (LocalPath))
+
+
+
+    ## Schedule the download of a remote file on the transfer pool.
+    #
+    #  @param iFolderID The ID of the iFolder to which the file belongs.
+    #  @param EntryID The ID of the file seen as an iFolderEntry.
+    #  @param LocalPath The local path on which the remote file will be saved.
+    #  @param OnError A callable invoked with the raised exception, if the
+    #                 download fails.
+    #
+    #  @sa pyFolder.after_transfer
+
+    def enqueue_fetch (self, iFolderID, EntryID, LocalPath, OnError):
+        self.transfers.submit (
+            os.path.normpath (LocalPath), self.__fetch,
+            (iFolderID, EntryID, LocalPath), OnError)
+        self.after_transfer (
+            LocalPath, self.__rescan, self.add_prefix (LocalPath))
+
+
+
+    ## Helper method, download a remote file using the given client.
+    #
+    #  The file is downloaded to a partial file in the same directory,
+    #  which replaces the local file only once the download completes.
+    #  The partial file is unbuffered, so that each chunk is decoded
+    #  into it as it arrives from the server, without further copies.
+
+    def __fetch (self, ifolderws, iFolderID, EntryID, LocalPath):
         LocalPath = self.add_prefix (LocalPath)
+        Head, Tail = os.path.split (LocalPath)
+        PartialPath = os.path.join (Head, PARTIAL_DOWNLOAD_NAME.format (Tail))
 
         Handle = self.__invoke (
-            self.ifolderws.open_file_read,
+            ifolderws.open_file_read,
             iFolderID,
             EntryID)
 
         if Handle is not None:
-            with open (LocalPath, 'wb') as File:
 
-                while True:
-                    Base64Data = self.__invoke (
-                        self.ifolderws.read_file,
-                        Handle)
+            try:
+
+                with io.open (PartialPath, 'wb', buffering=0) as File:
+
+                    try:
+                        self.__read_chunks (ifolderws, Handle, File)
+
+                    finally:
+                        self.__close_file (ifolderws, Handle)
+
+                if os.path.exists (LocalPath):
+                    shutil.copymode (LocalPath, PartialPath)
+
+                # os.rename can't replace an existing file on Windows.
+
+                if sys.platform == 'win32' and os.path.exists (LocalPath):
+                    os.remove (LocalPath)
+
+                os.rename (PartialPath, LocalPath)
+
+            except:
+
+                if os.path.exists (PartialPath):
+                    os.remove (PartialPath)
+
+                raise
+
+
+
+    ## Helper method, receive the chunks of a remote file.
+    #
+    #  @param File The file to write the decoded chunks to.
 
-                    if Base64Data is None:
-                        break
+    def __read_chunks (self, ifolderws, Handle, File):
+        Sizer = ChunkSizer (self.cm)
 
-                    File.write (base64.b64decode (Base64Data))
-            self.__invoke (self.ifolderws.close_file, Handle)
+        while True:
+            Start = time.time ()
+            Length = self.__invoke (
+                ifolderws.read_file_into,
+                Handle,
+                File,
+                Sizer.Size)
+
+            if Length is None:
+                break
+
+            Sizer.record (Length, time.time () - Start)
+
+
+
+    ## Check whether the given path is a partial download.
+    #
+    #  @param Path A local path.
+
+    def is_partial_download (self, Path):
+        return PARTIAL_DOWNLOAD_RE.match (os.path.split (Path)[1]) is not None
+
+
+
+    ## Invoke the given callable once the pending transfer of a file
+    ## succeeds.
+    #
+    #  The callable is invoked immediately if there is no pending transfer
+    #  for the given path, and never if the transfer failed.
+    #
+    #  @param Path The path to the transferred file, without the pyFolder
+    #              prefix added.
+    #  @param Callback The callable to invoke.
+    #  @param args The arguments list to pass to Callback.
+
+    def after_transfer (self, Path, Callback, *args):
+        self.transfers.then (os.path.normpath (Path), Callback, *args)
 
 
 
@@ -469,6 +617,8 @@ class pyFolder:
         with open (LocalPath, 'wb') as File:
             pass
 
+        self.__rescan (LocalPath)
+
         self.logger.info ('Created local file `{0}\''.format (
                 Path.encode ('utf-8')))
 
@@ -490,6 +640,8 @@ class pyFolder:
         with open (LocalPath, 'wb') as File:
             File.write (Data)
 
+        self.__rescan (LocalPath)
+
         self.logger.info ('Written local file `{0}\''.format (
                 Path.encode ('utf-8')))
 
@@ -518,20 +670,93 @@ class pyFolder:
     #                   uploaded.
 
     def remote_file_write (self, iFolderID, EntryID, LocalPath):
+        self.__remote_file_write (
+            self.ifolderws, iFolderID, EntryID, LocalPath)
+
+
+
+    ## Schedule the upload of a local file on the transfer pool.
+    #
+    #  @param iFolderID the ID of the iFolder the remote file belongs to.
+    #  @param EntryID the ID of the remote file seen as an iFolderEntry.
+    #  @param LocalPath The path to the local file that is going to be 
+    #                   uploaded.
+    #  @param OnError A callable invoked with the raised exception, if the
+    #                 upload fails.
+    #
+    #  @sa pyFolder.after_transfer
+
+    def enqueue_remote_file_write (self, iFolderID, EntryID, LocalPath, \
+                                       OnError):
+        self.transfers.submit (
+            os.path.normpath (LocalPath), self.__remote_file_write,
+            (iFolderID, EntryID, LocalPath), OnError)
+
+
+
+    ## Helper method, upload a local file using the given client.
+    #
+    #  The remote file is closed once the upload fails, as well. Closing
+    #  it after a successful upload is what stores the new content, so
+    #  that its errors are raised in that case, and only logged
+    #  otherwise.
+
+    def __remote_file_write (self, ifolderws, iFolderID, EntryID, LocalPath):
         Size = self.getsize (LocalPath)
-        Handle = self.__invoke (self.ifolderws.open_file_write, \
+        Handle = self.__invoke (ifolderws.open_file_write, \
                                     iFolderID, EntryID, Size)
         if Handle is not None:
-            with open (self.add_prefix (LocalPath), 'rb') as File:
-                while True:
-                    Data = File.read (self.cm.get_soapbuflen ())
+            Sizer = ChunkSizer (self.cm)
+
+            try:
+
+                with open (self.add_prefix (LocalPath), 'rb') as File:
+                    Chunks = pipelined (
+                        self.__encode_chunks (File, Sizer),
+                        self.cm.get_readahead ())
+
+                    with closing (Chunks):
+                        for Length, Base64Data in Chunks:
+                            Start = time.time ()
+                            self.__invoke (
+                                ifolderws.write_file, Handle, Base64Data)
+                            Sizer.record (Length, time.time () - Start)
+
+            except:
+                self.__close_file (ifolderws, Handle)
+                raise
+
+            self.__invoke (ifolderws.close_file, Handle)
+
+
+
+    ## Helper method, close a remote file after a transfer, logging
+    ## rather than raising the errors, so that they don't hide the one
+    ## that interrupted the transfer.
+
+    def __close_file (self, ifolderws, Handle):
+        try:
+
+            self.__invoke (ifolderws.close_file, Handle)
+
+        except (WebFault, ) + TRANSIENT_ERRORS, e:
+            self.logger.warning (
+                'Could not close the remote file ({0})'.format (e))
+
+
 
-                    if len (Data) == 0:
-                        break
+    ## Helper method, read and encode the chunks of a local file.
+    #
+    #  @return A generator of (Length, Base64Data) tuples.
+
+    def __encode_chunks (self, File, Sizer):
+        while True:
+            Data = File.read (Sizer.Size)
+
+            if len (Data) == 0:
+                break
 
-                    self.__invoke (self.ifolderws.write_file, \
-                                       Handle, base64.b64encode (Data))
-            self.__invoke (self.ifolderws.close_file, Handle)
+            yield len (Data), base64.b64encode (Data)
 
 
 
@@ -551,14 +776,12 @@ class pyFolder:
         for iFolderTuple in iFolderTupleList:
             Name = iFolderTuple['name']
 
-            for Root, Dirs, Files in os.walk (self.add_prefix (Name)):
-
-                if os.path.isdir (Root):
+            for Root, Dirs, Files in self.walk (Name):
 
-                    if ExcludeiFolders and Root == self.add_prefix (Name):
-                        continue
+                if ExcludeiFolders and Root == self.add_prefix (Name):
+                    continue
 
-                    Tree.append (self.remove_prefix (Root))
+                Tree.append (self.remove_prefix (Root))
 
         return Tree
 
@@ -577,12 +800,14 @@ class pyFolder:
         for iFolderTuple in iFolderTupleList:
             Name = iFolderTuple['name']
 
-            for Root, Dirs, Files in os.walk (self.add_prefix (Name)):
+            Entries = self.__get_snapshot (Name)
+
+            for Root, Dirs, Files in Entries.walk (self.add_prefix (Name)):
 
                 for File in Files:
                     FilePath = os.path.join (Root, File)
 
-                    if os.path.isfile (FilePath):
+                    if Entries.get (FilePath).IsFile:
                         Tree.append (self.remove_prefix (FilePath))
 
         return Tree
@@ -597,7 +822,7 @@ class pyFolder:
         for iFolderTuple in iFolderTupleList:
             Name = iFolderTuple['name']
 
-            for Root, Dirs, Files in os.walk (self.add_prefix (Name)):
+            for Root, Dirs, Files in self.walk (Name):
 
                 for File in Files:
                     FilePath = self.remove_prefix (os.path.join (Root, File))
@@ -642,16 +867,47 @@ class pyFolder:
     #                   added locally.
 
     def __add_entries (self, iFolderID):
-        EntryList = self.__invoke (self.ifolderws.get_children_by_ifolder, \
-                                       iFolderID)
-        if EntryList is not None:
-            for Entry in EntryList:
-                ParentID = Entry.ParentID
+        for Entry in self.__get_children (iFolderID):
+            ParentID = Entry.ParentID
 
-                Change = self.__invoke (self.ifolderws.get_latest_change, \
-                                            iFolderID, Entry.ID)
-                if Change is not None:
-                    self.__add_entry_locally (iFolderID, ParentID, Change)
+            Change = self.__invoke (self.ifolderws.get_latest_change, \
+                                        iFolderID, Entry.ID)
+            if Change is not None:
+                self.__add_entry_locally (iFolderID, ParentID, Change)
+
+
+
+    ## Helper method, iterate over all the entries of an iFolder.
+    #
+    #  The entries are fetched in pages of CHILDREN_PAGE_SIZE items, and
+    #  yielded as each page arrives, so that only one page at a time is
+    #  held in memory, and the first entries are handled right away. An
+    #  entry added or removed on the server meanwhile may shift the
+    #  pages, so that the callers must not rely on seeing each entry
+    #  exactly once.
+    #
+    #  @param iFolderID The ID of the iFolder whose entries are listed.
+    #
+    #  @return A generator of iFolderEntry instances.
+
+    def __get_children (self, iFolderID):
+        Index = 0
+
+        while True:
+            Page = self.__invoke (
+                self.ifolderws.get_children, iFolderID, Index,
+                CHILDREN_PAGE_SIZE)
+
+            if Page is None:
+                return
+
+            for Entry in Page:
+                yield Entry
+
+            if len (Page) < CHILDREN_PAGE_SIZE:
+                return
+
+            Index = Index + len (Page)
 
 
 
@@ -682,7 +938,8 @@ class pyFolder:
                 Updated = self.policy.add_directory (iFolderID, EntryID, Name)
 
             if Updated:
-                self.add_entry_to_dbm (\
+                self.after_transfer (
+                    Name, self.add_entry_to_dbm,
                     None, iFolderID, EntryID, Time, ParentID, Name)
 
         return Updated
@@ -752,6 +1009,7 @@ class pyFolder:
 
     ## Build an initial local copy of the user's remote iFolders.
 
+    @scanning
     def checkout (self):
         self.dbm.create_schema ()
 
@@ -768,8 +1026,10 @@ class pyFolder:
                     iFolderID = iFolder.ID
                     Name = iFolder.Name
 
-                    self.__add_ifolder (iFolder.ID)
-                    self.__add_entries (iFolder.ID)
+                    with self.dbm.transaction ():
+                        self.__add_ifolder (iFolder.ID)
+                        self.__add_entries (iFolder.ID)
+                        self.transfers.join ()
 
             except WebFault, wf:
                 ex = self.get_original_exception (wf)
@@ -835,17 +1095,59 @@ class pyFolder:
     #  @return True whether new entries (files or directories) were found.
 
     def directory_has_new_entries (self, iFolderID, LocalPath):
-        Changed = False
+        NewParents, Dirty = self.__get_local_changes (iFolderID)
 
-        for Root, Dirs, Files in os.walk (self.add_prefix (LocalPath)):
+        return os.path.normpath (LocalPath) in NewParents
 
-            Changed = self.directory_has_new_directories (\
-                Root, Dirs, iFolderID) or Changed
 
-            Changed = self.directory_has_new_files (\
-                Root, Files, iFolderID) or Changed
 
-        return Changed
+    ## Find the directories of an iFolder with local changes below them.
+    #
+    #  The whole iFolder is examined at once, through
+    #  pyFolder.__diff_ifolder, and every change is propagated to all
+    #  the ancestors of the changed entry. During a synchronization run
+    #  the result is kept until pyFolder modifies the local repository.
+    #
+    #  @param iFolderID The ID of the iFolder.
+    #
+    #  @return A tuple (NewParents, Dirty). NewParents is the set of the
+    #          local paths of the directories containing new entries, at
+    #          any depth. Dirty is the set of the IDs of the modified
+    #          files and of the directories containing them, the iFolder
+    #          itself included.
+
+    def __get_local_changes (self, iFolderID):
+        if iFolderID in self.local_changes:
+            return self.local_changes[iFolderID]
+
+        iFolderTuple = self.dbm.get_ifolder (iFolderID)
+        AddedList, Deleted, Modified = self.__diff_ifolder (
+            iFolderID, iFolderTuple['name'])
+
+        NewParents = set ()
+        Dirty = set (Modified)
+
+        if len (Modified) > 0:
+            Dirty.add (iFolderTuple['entry_id'])
+
+        for Path, ScanEntry in AddedList:
+
+            if not ScanEntry.IsDir and not ScanEntry.IsFile:
+                continue
+
+            if not self.__is_new_local_entry (iFolderID, Path):
+                continue
+
+            Head = os.path.dirname (Path)
+
+            while Head != '' and Head not in NewParents:
+                NewParents.add (Head)
+                Head = os.path.dirname (Head)
+
+        if self.snapshot is not None:
+            self.local_changes[iFolderID] = NewParents, Dirty
+
+        return NewParents, Dirty
 
 
 
@@ -871,27 +1173,21 @@ class pyFolder:
 
 
 
-    ## Check whether the given iFolder has any remote changes.
+    ## Get the timestamp of the last modification made to the remote
+    ## iFolder.
     #
     #  @param iFolderID The ID of the iFolder to check.
-    #  @param mtime The timestamp of the last modification made to the iFolder
-    #               currently stored in the local database.
     #               
-    #  @return True whether the iFolder's remote LastModified
-    #          attribute is newer than the mtime local one.
+    #  @return The iFolder's remote LastModified attribute, or None
+    #          if the iFolder could not be retrieved.
 
-    def __ifolder_has_changes (self, iFolderID, mtime):
+    def __get_remote_mtime (self, iFolderID):
         iFolder = self.__invoke (self.ifolderws.get_ifolder, iFolderID)
 
         if iFolder is not None:
+            return iFolder.LastModified
 
-            if iFolder.LastModified > mtime:
-                return True
-
-            else:
-                return False
-
-        return True
+        return None
 
 
 
@@ -920,16 +1216,90 @@ class pyFolder:
 
 
 
-    ## Synchronize the local mtime for the given iFolder with the remote one.
+    ## Get the remote changes made to the given iFolder since the given time.
+    #
+    #  The iFolder change log is read in pages of CHANGES_PAGE_SIZE
+    #  items, from the newest change backwards, until a change older
+    #  than mtime is found.
+    #
+    #  @param iFolderID The ID of the iFolder to check.
+    #  @param mtime The timestamp of the last remote change already
+    #               applied locally.
+    #
+    #  @return A list with the latest ChangeEntry of each changed entry,
+    #          or None if the change log does not reach back to mtime.
+    #          The entries are sorted by their oldest change since mtime,
+    #          and then by the depth of their path, so that a directory
+    #          is applied before its children even though it has been
+    #          modified after them.
     #
-    #  @param iFolderID The ID of the iFolder whose mtime needs to be updated.
+    #  @sa The iFolder Web Service description.
 
-    def __update_ifolder_in_dbm (self, iFolderID):
-        iFolder = self.__invoke (self.ifolderws.get_ifolder, iFolderID)
+    def __get_changes_since (self, iFolderID, mtime):
+        ChangeList = []
+        Oldest = {}
+        Index = 0
 
-        if iFolder is not None:
-            mtime = iFolder.LastModified
-            self.dbm.update_mtime_by_ifolder (iFolderID, mtime)
+        while True:
+            Page = self.__invoke (
+                self.ifolderws.get_changes, iFolderID, iFolderID,
+                Index, CHANGES_PAGE_SIZE)
+
+            if Page is None:
+                return None
+
+            for Change in Page:
+
+                if Change.Time < mtime:
+                    ChangeList.reverse ()
+                    ChangeList.sort (key=lambda Change : (
+                            Oldest[Change.ID], Change.Name.count ('/')))
+                    return ChangeList
+
+                if Change.ID not in Oldest:
+                    ChangeList.append (Change)
+
+                Oldest[Change.ID] = Change.Time
+
+            if len (Page) < CHANGES_PAGE_SIZE:
+                return None
+
+            Index = Index + len (Page)
+
+
+
+    ## Find the ID of the parent of a remotely added entry.
+    #
+    #  The local database is looked up first, the Web Service is
+    #  invoked only if the parent is not known locally.
+    #
+    #  @param iFolderID The ID of the iFolder the entry belongs to.
+    #  @param Change A ChangeEntry instance.
+    #
+    #  @return The ID of the parent entry or None if the entry does
+    #          not exist anymore.
+
+    def __find_remote_parent (self, iFolderID, Change):
+        ParentID = self.__find_parent (
+            iFolderID, os.path.normpath (Change.Name))
+
+        if ParentID is not None:
+            return ParentID
+
+        try:
+            Entry = self.__invoke (
+                self.ifolderws.get_entry, iFolderID, Change.ID)
+
+            if Entry is not None:
+                return Entry.ParentID
+
+        except WebFault, wf:
+            ex = self.get_original_exception (wf)
+
+            if ex != 'iFolder.WebService.EntryDoesNotExistException':
+                raise
+
+        return None
 
 
 
@@ -955,7 +1325,8 @@ class pyFolder:
             Updated = self.policy.add_file (iFolderID, EntryID, Name)
 
         if Updated:
-            self.__update_entry_in_dbm (iFolderID, EntryID)
+            self.after_transfer (
+                Name, self.__update_entry_in_dbm, iFolderID, EntryID)
 
         return Updated
 
@@ -983,7 +1354,8 @@ class pyFolder:
             Updated = self.policy.modify_file (iFolderID, EntryID, Name)
 
         if Updated:
-            self.__update_entry_in_dbm (iFolderID, EntryID)
+            self.after_transfer (
+                Name, self.__update_entry_in_dbm, iFolderID, EntryID)
 
         return Updated
 
@@ -1030,22 +1402,85 @@ class pyFolder:
     #  @return True if any change was successfully applied to the entry.
 
     def update_entry (self, iFolderID, EntryID, mtime):
-        Action = self.ifolderws.get_change_entry_action ()
         Change = self.__get_change (iFolderID, EntryID, mtime)
-        Updated = False
 
         if Change is not None:
+            return self.__apply_change (iFolderID, EntryID, Change)
+
+        return False
+
+
+
+    ## Apply a remote change to an entry already existing locally.
+    #
+    #  @param iFolderID The ID of the iFolder the entry belongs to.
+    #  @param EntryID The ID of the entry.
+    #  @param Change A ChangeEntry instance.
+    #
+    #  @return True if Change was successfully applied.
+    #
+    #  @sa The iFolder Web Service description.
+
+    def __apply_change (self, iFolderID, EntryID, Change):
+        Action = self.ifolderws.get_change_entry_action ()
+        Updated = False
+
+        if Change.Action == Action.Add:
+            Updated = self.__handle_add_action (iFolderID, EntryID, Change)
+
+        elif Change.Action == Action.Modify:
+            Updated = self.__handle_modify_action (
+                iFolderID, EntryID, Change)
+
+        elif Change.Action == Action.Delete:
+
+            # The deleted entry could be an ancestor of a file
+            # that is still being transferred.
+
+            self.transfers.join ()
+            Updated = self.__handle_delete_action (
+                iFolderID, EntryID, Change)
+
+        return Updated
+
+
+
+    ## Apply a list of remote changes to the local copy of an iFolder.
+    #
+    #  Only the entries reported by the change log are checked, so
+    #  no further requests are made for the unchanged ones.
+    #
+    #  @param iFolderID The ID of the iFolder the changes belong to.
+    #  @param ChangeList A list of ChangeEntry instances, sorted from the
+    #                    oldest to the newest one.
+    #
+    #  @return True if all of the changes were successfully applied.
+
+    def __apply_changes (self, iFolderID, ChangeList):
+        Action = self.ifolderws.get_change_entry_action ()
+        iFolderTuple = self.dbm.get_ifolder (iFolderID)
+        Updated = True
+
+        for Change in ChangeList:
+            EntryID = Change.ID
+
+            if EntryID in [iFolderID, iFolderTuple['entry_id']]:
+                continue
+
+            EntryTuple = self.dbm.get_entry (iFolderID, EntryID)
 
-            if Change.Action == Action.Add:
-                Updated = self.__handle_add_action (iFolderID, EntryID, Change)
+            if EntryTuple is not None:
 
-            elif Change.Action == Action.Modify:
-                Updated = self.__handle_modify_action (
-                    iFolderID, EntryID, Change)
+                if Change.Time > EntryTuple['mtime']:
+                    Updated = self.__apply_change (
+                        iFolderID, EntryID, Change) and Updated
 
-            elif Change.Action == Action.Delete:
-                Updated = self.__handle_delete_action (
-                    iFolderID, EntryID, Change)
+            elif Change.Action != Action.Delete:
+                ParentID = self.__find_remote_parent (iFolderID, Change)
+
+                if ParentID is not None:
+                    Updated = self.__add_entry_locally (
+                        iFolderID, ParentID, Change) and Updated
 
         return Updated
 
@@ -1054,13 +1489,40 @@ class pyFolder:
     ## Update the local copy of given iFolder, by applying eventual
     ## remote changes.
     #
+    #  The changes are read from the iFolder change log. If the log
+    #  does not reach back to mtime, every entry is checked instead.
+    #
+    #  @param iFolderID The ID of the iFolder to update.
+    #  @param mtime The timestamp of the last remote change already
+    #               applied locally.
+    #
+    #  @return True if all of the changes were successfully applied.
+
+    def __update_ifolder (self, iFolderID, mtime):
+        ChangeList = self.__get_changes_since (iFolderID, mtime)
+
+        if ChangeList is not None:
+            return self.__apply_changes (iFolderID, ChangeList)
+
+        self.logger.info ('Change log of iFolder with ID={0} is not ' \
+                              'complete, checking all the entries'.format (
+                iFolderID))
+
+        Updated = self.__update_entries (iFolderID)
+        return self.__add_new_entries (iFolderID) and Updated
+
+
+
+    ## Update every entry of the given iFolder, by applying eventual
+    ## remote changes.
+    #
     #  @param iFolderID The ID of the iFolder to update.
     #
     #  @return True if all of the changes were successfully applied.
 
-    def __update_ifolder (self, iFolderID):
+    def __update_entries (self, iFolderID):
         EntryTupleList = self.dbm.get_entries_by_ifolder (iFolderID)
-        Updated = False
+        Updated = True
 
         for EntryTuple in EntryTupleList:
             iFolderID = EntryTuple['ifolder']
@@ -1070,8 +1532,11 @@ class pyFolder:
             if self.dbm.get_entry (iFolderID, EntryID) is None:
                 continue
 
-            Updated = self.update_entry (iFolderID, EntryID, mtime) and \
-                Updated
+            Change = self.__get_change (iFolderID, EntryID, mtime)
+
+            if Change is not None:
+                Updated = self.__apply_change (iFolderID, EntryID, Change) \
+                    and Updated
 
         return Updated
 
@@ -1085,22 +1550,18 @@ class pyFolder:
     #          within the local copy.
 
     def __add_new_entries (self, iFolderID):
-        Updated = False
-
-        EntryList = self.__invoke (
-            self.ifolderws.get_children_by_ifolder, iFolderID)
+        Updated = True
 
-        if EntryList is not None:
-            for Entry in EntryList:
-                ParentID = Entry.ParentID
+        for Entry in self.__get_children (iFolderID):
+            ParentID = Entry.ParentID
 
-                if self.dbm.get_entry (iFolderID, Entry.ID) is None:
-                    Change = self.__invoke (
-                        self.ifolderws.get_latest_change, iFolderID, Entry.ID)
+            if self.dbm.get_entry (iFolderID, Entry.ID) is None:
+                Change = self.__invoke (
+                    self.ifolderws.get_latest_change, iFolderID, Entry.ID)
 
-                    if Change is not None:
-                        Updated = self.__add_entry_locally (\
-                            iFolderID, ParentID, Change) and Updated
+                if Change is not None:
+                    Updated = self.__add_entry_locally (\
+                        iFolderID, ParentID, Change) and Updated
 
         return Updated
 
@@ -1114,8 +1575,11 @@ class pyFolder:
         if iFolderList is not None:
             for iFolder in iFolderList:
                 if self.dbm.get_ifolder (iFolder.ID) is None:
-                    self.__add_ifolder (iFolder.ID)
-                    self.__add_entries (iFolder.ID)
+
+                    with self.dbm.transaction ():
+                        self.__add_ifolder (iFolder.ID)
+                        self.__add_entries (iFolder.ID)
+                        self.transfers.join ()
 
 
 
@@ -1150,12 +1614,16 @@ class pyFolder:
                 ParentID = Entry.ParentID
                 Path = Entry.Path
 
+        Stat = self.get_stat (Path)
         Hash = self.md5_hash (Path)
         LocalPath = os.path.normpath (Path)
 
         self.dbm.add_entry (iFolderID, EntryID, Time, Hash, ParentID, \
                                 Path, LocalPath)
 
+        if Stat is not None:
+            self.dbm.update_stat_by_entry (iFolderID, EntryID, *Stat)
+
 
 
     ## Add the pyFolder prefix (if any) to the given Path.
@@ -1277,7 +1745,12 @@ class pyFolder:
     #  @return True whether the prefixed version of path is a file.
 
     def path_isfile (self, Path):
-        return os.path.isfile (self.add_prefix (Path))
+        if not self.__is_scanned (Path):
+            return os.path.isfile (self.add_prefix (Path))
+
+        Entry = self.__get_snapshot (Path).get (self.add_prefix (Path))
+
+        return Entry is not None and Entry.IsFile
 
 
 
@@ -1289,7 +1762,75 @@ class pyFolder:
     #  @return True whether the prefixed version of path is a directory.
 
     def path_isdir (self, Path):
-        return os.path.isdir (self.add_prefix (Path))
+        if not self.__is_scanned (Path):
+            return os.path.isdir (self.add_prefix (Path))
+
+        Entry = self.__get_snapshot (Path).get (self.add_prefix (Path))
+
+        return Entry is not None and Entry.IsDir
+
+
+
+    ## Walk a local directory tree, top-down, as os.walk does.
+    #
+    #  During a synchronization run, the tree is served from the snapshot
+    #  of its iFolder, which is read from disk at the first access.
+    #
+    #  @param Path The directory to walk, without the pyFolder prefix.
+    #
+    #  @return A generator of (Root, Dirs, Files) tuples, where Root has
+    #          the pyFolder prefix added.
+
+    def walk (self, Path):
+        return self.__get_snapshot (Path).walk (self.add_prefix (Path))
+
+
+
+    ## Check whether the given path is served from the snapshot of its
+    ## iFolder.
+
+    def __is_scanned (self, Path):
+        return self.snapshot is not None and Path.split (os.sep)[0] != ''
+
+
+
+    ## Get a core.scanner.Snapshot containing the given local path.
+    #
+    #  Outside of a synchronization run, a new snapshot of just Path
+    #  is returned.
+    #
+    #  @param Path A local path, without the pyFolder prefix.
+
+    def __get_snapshot (self, Path):
+        if not self.__is_scanned (Path):
+            Entries = Snapshot ()
+            Entries.scan (self.add_prefix (Path))
+            return Entries
+
+        if not self.snapshot.covers (self.add_prefix (Path)):
+            self.snapshot.scan (self.add_prefix (Path.split (os.sep)[0]))
+
+        return self.snapshot
+
+
+
+    ## Report to the current snapshot that the given local path has
+    ## been created, modified or removed, and forget the local changes
+    ## found on the iFolder containing it.
+    #
+    #  @param Path A local path, with the pyFolder prefix added.
+
+    def __rescan (self, Path):
+        if self.snapshot is not None:
+            self.snapshot.update (Path)
+            Path = self.remove_prefix (Path)
+
+            for iFolderID in self.local_changes.keys ():
+                iFolderTuple = self.dbm.get_ifolder (iFolderID)
+
+                if iFolderTuple is None or \
+                        self.__is_below (Path, [iFolderTuple['name']]):
+                    del self.local_changes[iFolderID]
 
 
 
@@ -1307,6 +1848,8 @@ class pyFolder:
         try:
 
             os.rename (Src, Dst)
+            self.__rescan (Src)
+            self.__rescan (Dst)
             self.logger.info (
                 'Renamed `{0}\' to `{1}\''.format (
                     Src.encode ('utf-8'),
@@ -1330,6 +1873,7 @@ class pyFolder:
         try:
 
             os.remove (Path)
+            self.__rescan (Path)
             self.logger.info ('Deleted local file `{0}\''.format (
                     Path.encode ('utf-8')))
 
@@ -1351,6 +1895,7 @@ class pyFolder:
         try:
 
             shutil.rmtree (Path)
+            self.__rescan (Path)
             self.logger.info ('Deleted local directory `{0}\''.format (
                     Path.encode ('utf-8')))
 
@@ -1373,6 +1918,7 @@ class pyFolder:
         try:
 
             os.makedirs (Path)
+            self.__rescan (Path)
             self.logger.info ('Added local directory `{0}\''.format (
                     Path.encode ('utf-8')))
 
@@ -1411,7 +1957,9 @@ class pyFolder:
     ## Calculate the MD5 digest for the given entry.
     #
     #  This method will return the string 'DIRECTORY' if Path
-    #  points to a directory.
+    #  points to a directory. Files are read in chunks of at most
+    #  `--hashbuflen' bytes, into a buffer which is reused across
+    #  the calls, so memory usage does not depend on the file size.
     # 
     #  @param Path The path to the given entry, without the pyFolder prefix.
     #
@@ -1419,23 +1967,209 @@ class pyFolder:
 
     def md5_hash (self, Path):
         Path = self.add_prefix (Path)
-        Hash = 'DIRECTORY'
 
         if os.path.isfile (Path):
-            m = hashlib.md5 ()
+            return self.__md5_hash_file (Path)
+
+        return 'DIRECTORY'
+
+
+
+    ## Helper method, calculate the MD5 digest of a file.
+    #
+    #  @param Path The path to the file, with the pyFolder prefix added.
+
+    def __md5_hash_file (self, Path):
+        Buffer = self.__get_hash_buffer ()
+        View = memoryview (Buffer)
+        Size = 0
+        Start = time.time ()
+        m = hashlib.md5 ()
+
+        with io.open (Path, 'rb', buffering=0) as File:
+
+            while True:
+                Count = File.readinto (Buffer)
+
+                if not Count:
+                    break
+
+                m.update (View[:Count])
+                Size = Size + Count
 
-            with open (Path, 'rb') as File:
+        if self.logger.isEnabledFor (logging.DEBUG):
+            Elapsed = max (time.time () - Start, 0.000001)
 
-                while True:
-                    Data = File.read ()
-                    m.update (Data)
+            self.logger.debug (
+                'Hashed `{0}\', {1} bytes at {2:.2f} MB/s'.format (
+                    Path.encode ('utf-8'), Size, Size / Elapsed / 1048576))
 
-                    if len (Data) == 0:
-                        break
+        return m.hexdigest ()
+
+
+
+    ## Helper method, get the buffer used by pyFolder.md5_hash.
+    #
+    #  Each thread gets its own buffer.
+    #
+    #  @return A bytearray of `--hashbuflen' bytes.
+
+    def __get_hash_buffer (self):
+        Length = self.cm.get_hashbuflen ()
+        Buffer = getattr (self.hashbuffer, 'Buffer', None)
+
+        if Buffer is None or len (Buffer) != Length:
+            Buffer = bytearray (Length)
+            self.hashbuffer.Buffer = Buffer
+
+        return Buffer
+
+
+
+    ## Calculate the MD5 digests of several files, on `--hashers'
+    ## concurrent threads.
+    #
+    #  @param PathList A list of paths to files, without the pyFolder
+    #                  prefix.
+    #
+    #  @return A list with the digest of each file, in the same order
+    #          as PathList. The digest is None if the file could not
+    #          be read.
+
+    def md5_hash_many (self, PathList):
+        Workers = self.cm.get_hashers ()
+
+        if Workers <= 1 or len (PathList) <= 1:
+            return map (self.__safe_md5_hash, PathList)
+
+        from multiprocessing.pool import ThreadPool
+
+        Pool = ThreadPool (min (Workers, len (PathList)))
+
+        try:
+            return Pool.map (self.__safe_md5_hash, PathList)
+
+        finally:
+            Pool.close ()
+            Pool.join ()
+
+
+
+    ## Helper method, calculate the MD5 digest of a file that could
+    ## disappear in the meantime.
+    #
+    #  The caller already knows that Path is a regular file, so it is
+    #  opened without being stat'ed again.
+
+    def __safe_md5_hash (self, Path):
+        try:
+            return self.__md5_hash_file (self.add_prefix (Path))
+
+        except (IOError, OSError):
+            return None
+
+
+
+    ## Calculate in bulk the digests that are going to be needed to
+    ## detect local changes on the given entries.
+    #
+    #  Only the files whose stat differs from the recorded one are
+    #  hashed. The results are consulted by
+    #  pyFolder.file_has_local_changes until pyFolder.clear_digests
+    #  is called.
+    #
+    #  @param CandidateList A list of (EntryTuple, Stat) tuples, where
+    #                       EntryTuple is an entry from the local database
+    #                       and Stat the current stat of its file, as
+    #                       returned by pyFolder.get_stat.
+
+    def precompute_digests (self, CandidateList):
+        Candidates = []
+
+        for EntryTuple, Stat in CandidateList:
+
+            if EntryTuple['digest'] == 'DIRECTORY':
+                continue
+
+            if Stat is None or Stat == (
+                EntryTuple['size'],
+                EntryTuple['mtime_ns'],
+                EntryTuple['inode']):
+                continue
 
-                Hash = m.hexdigest ()
+            Candidates.append ((EntryTuple['localpath'], Stat))
 
-        return Hash
+        Digests = self.md5_hash_many ([Path for Path, Stat in Candidates])
+
+        for (Path, Stat), Digest in zip (Candidates, Digests):
+
+            if Digest is not None:
+                self.digests[os.path.normpath (Path)] = (Stat, Digest)
+
+
+
+    ## Forget the digests computed by pyFolder.precompute_digests.
+
+    def clear_digests (self):
+        self.digests = {}
+
+
+
+    ## Helper method, get the digest of a file, using the precomputed
+    ## one if the file did not change since then.
+    #
+    #  @param Path The path to the file, without the pyFolder prefix.
+    #  @param Stat The current stat of the file, as returned by
+    #              pyFolder.get_stat.
+
+    def __get_digest (self, Path, Stat):
+        Precomputed = self.digests.get (os.path.normpath (Path))
+
+        if Stat is not None and Precomputed is not None and \
+                Precomputed[0] == Stat:
+            return Precomputed[1]
+
+        return self.md5_hash (Path)
+
+
+
+    ## Get the attributes used to detect whether a file has changed,
+    ## without reading it.
+    #
+    #  @param Path The path to the file, without the pyFolder prefix.
+    #
+    #  @return A tuple (Size, Mtime, Inode), with Mtime expressed in
+    #          nanoseconds, or None if Path is not a regular file.
+
+    def get_stat (self, Path):
+        try:
+            Stat = os.stat (self.add_prefix (Path))
+
+        except OSError:
+            return None
+
+        if not stat.S_ISREG (Stat.st_mode):
+            return None
+
+        Mtime = getattr (Stat, 'st_mtime_ns', None)
+
+        if Mtime is None:
+            Mtime = int (Stat.st_mtime * 1000000000)
+
+        return Stat.st_size, Mtime, Stat.st_ino
+
+
+
+    ## Get the attributes returned by pyFolder.get_stat from an entry
+    ## of a snapshot, without reading the file system again.
+    #
+    #  @param ScanEntry A core.scanner.ScanEntry instance.
+
+    def __get_scan_stat (self, ScanEntry):
+        if not ScanEntry.IsFile:
+            return None
+
+        return ScanEntry.Size, ScanEntry.Mtime, ScanEntry.Inode
 
 
 
@@ -1455,27 +2189,9 @@ class pyFolder:
                 not self.path_isdir (ParentEntryTuple['path']):
             return False
 
-        Changed = False
-
-        EntryTupleList = self.dbm.get_entries_by_parent (EntryID)
-
-        for EntryTuple in EntryTupleList:
-            ChildEntryID = EntryTuple['id']
-            ChildLocalPath = EntryTuple['localpath']
-            Digest = EntryTuple['digest']
-
-            if Digest == 'DIRECTORY':
-                Changed = self.directory_has_local_changes (
-                    iFolderID, ChildEntryID) or Changed
-
-            else:
-                Changed = self.file_has_local_changes (
-                    iFolderID, ChildEntryID, ChildLocalPath) or Changed
-
-                if Changed:
-                    return Changed
+        NewParents, Dirty = self.__get_local_changes (iFolderID)
 
-        return Changed
+        return EntryID in Dirty
 
 
 
@@ -1490,8 +2206,6 @@ class pyFolder:
 
     def file_has_local_changes (self, iFolderID, EntryID, Path):
 
-        EntryTuple = self.dbm.get_entry (iFolderID, EntryID)
-
         if not self.path_exists (Path):
 
                 # BUG #0002 - Closed.
@@ -1503,18 +2217,47 @@ class pyFolder:
                 return False
 
         else:
-            if EntryTuple is None:
-                return True
+            return self.__file_has_local_changes (
+                iFolderID, EntryID, Path, self.get_stat (Path))
 
-            else:
-                OldDigest = EntryTuple['digest']
-                NewDigest = self.md5_hash (Path)
 
-                if OldDigest != NewDigest:
-                    return True
 
-                else:
-                    return False
+    ## Helper method, detect local changes on an existing file-entry.
+    #
+    #  @param iFolderID The ID of the iFolder the file-entry belongs to.
+    #  @param EntryID The ID of the file-entry.
+    #  @param Path The path to the file to check.
+    #  @param Stat The current stat of the file, as returned by
+    #              pyFolder.get_stat.
+    #
+    #  @return True whether the file has been locally modified.
+
+    def __file_has_local_changes (self, iFolderID, EntryID, Path, Stat):
+        EntryTuple = self.dbm.get_entry (iFolderID, EntryID)
+
+        if EntryTuple is None:
+            return True
+
+        # The digest is recomputed only if the file attributes
+        # differ from the ones recorded along with it.
+
+        if Stat is not None and Stat == (
+            EntryTuple['size'],
+            EntryTuple['mtime_ns'],
+            EntryTuple['inode']):
+            return False
+
+        OldDigest = EntryTuple['digest']
+        NewDigest = self.__get_digest (Path, Stat)
+
+        if OldDigest != NewDigest:
+            return True
+
+        else:
+            if Stat is not None:
+                self.dbm.update_stat_by_entry (iFolderID, EntryID, *Stat)
+
+            return False
 
 
 
@@ -1540,10 +2283,14 @@ class pyFolder:
             time.sleep (SyncInterval)
 
         if Change is not None:
+            Stat = self.get_stat (Change.Name)
             Hash = self.md5_hash (Change.Name)
             self.dbm.update_mtime_and_digest_by_entry (\
                 iFolderID, EntryID, Change.Time, Hash)
 
+            if Stat is not None:
+                self.dbm.update_stat_by_entry (iFolderID, EntryID, *Stat)
+
 
 
     ## Delete the given entry from the local database.
@@ -1559,6 +2306,7 @@ class pyFolder:
     ## Synchronize the local copy of the repository with the remote one,
     ## by applying remote changes locally.
 
+    @scanning
     def update (self):
 
         iFolderTupleList = None
@@ -1582,16 +2330,27 @@ class pyFolder:
             mtime = iFolderTuple['mtime']
             Name = iFolderTuple['name']
 
-            Updated = True
-
             try:
 
-                if self.__ifolder_has_changes (iFolderID, mtime):
-                    Updated = self.__update_ifolder (iFolderID) and Updated
-                    Updated = self.__add_new_entries (iFolderID) and Updated
+                # The remote mtime is read before the change log, so that
+                # the changes made in the meantime are not lost.
+
+                RemoteMtime = self.__get_remote_mtime (iFolderID)
+
+                if RemoteMtime is None or RemoteMtime > mtime:
 
-                    if Updated:
-                        self.__update_ifolder_in_dbm (iFolderID)
+                    with self.dbm.transaction (), \
+                            self.dbm.indexed (iFolderID):
+                        Failures = self.transfers.Failures
+                        Updated = self.__update_ifolder (iFolderID, mtime)
+
+                        self.transfers.join ()
+                        Updated = Updated and \
+                            self.transfers.Failures == Failures
+
+                        if Updated and RemoteMtime is not None:
+                            self.dbm.update_mtime_by_ifolder (
+                                iFolderID, RemoteMtime)
 
             except WebFault, wf:
                 ex = self.get_original_exception (wf)
@@ -1665,7 +2424,8 @@ class pyFolder:
         Path = os.path.normpath (Path)
 
         if self.is_conflicted_entry (Path) or \
-                self.has_conflicted_ancestors (Path):
+                self.has_conflicted_ancestors (Path) or \
+                self.is_partial_download (Path):
             return False
 
         EntryTuple = self.get_entry_by_ifolder_and_localpath (iFolderID, Path)
@@ -1783,58 +2543,54 @@ class pyFolder:
 
 
 
-    ## Commit eventual new locally-added directories.
+    ## Commit a new locally-added directory.
     #
-    #  @param Root The root path where to check for new directories.
-    #  @param Dirs A list of directory names, whose parent is Root.
-    #  @param iFolderID The ID of the iFolder to which Root belongs.
+    #  @param iFolderID The ID of the iFolder to which Path belongs.
+    #  @param Path The local path to the directory, without the pyFolder
+    #              prefix added.
     #
-    #  @return True whether at least a new directory was committed.
+    #  @return True whether the directory was committed.
 
-    def __commit_added_directories (self, Root, Dirs, iFolderID):
+    def __commit_added_directory (self, iFolderID, Path):
         Updated = False
 
-        for Dir in Dirs:
-            Path = os.path.join (self.remove_prefix (Root), Dir)
+        if self.is_new_local_directory (iFolderID, Path):
+            ParentID = self.__find_parent (iFolderID, Path)
 
-            if self.is_new_local_directory (iFolderID, Path):
-                ParentID = self.__find_parent (iFolderID, Path)
-
-                if ParentID is not None:
-                    Entry = self.policy.add_remote_directory (
-                        iFolderID, ParentID, Path)
+            if ParentID is not None:
+                Entry = self.policy.add_remote_directory (
+                    iFolderID, ParentID, Path)
 
-                    if Entry is not None:
-                        Updated = True
+                if Entry is not None:
+                    Updated = True
 
         return Updated
 
 
 
-    ## Commit eventual new locally-added files.
+    ## Commit a new locally-added file.
     #
-    #  @param Root The root path where to check for new files.
-    #  @param Files A list of file-names, whose parent is Root.
-    #  @param iFolderID The ID of the iFolder to which Root belongs.
+    #  @param iFolderID The ID of the iFolder to which Path belongs.
+    #  @param Path The local path to the file, without the pyFolder
+    #              prefix added.
     #
-    #  @return True if at least one new file was committed.
+    #  @return True if the file was committed.
 
-    def __commit_added_files (self, Root, Files, iFolderID):
+    def __commit_added_file (self, iFolderID, Path):
         Updated = False
 
-        for File in Files:
-            Path = os.path.join (self.remove_prefix (Root), File)
-            if self.__is_new_local_file (iFolderID, Path):
-                ParentID = self.__find_parent (iFolderID, Path)
-                if ParentID is not None:
-                    Entry = self.policy.add_remote_file \
-                        (iFolderID, ParentID, Path)
-                    if Entry is not None:
-                        Updated = True
-                        if self.policy.modify_remote_file (\
-                            iFolderID, Entry.ID, Entry.Path):
-                            self.__update_entry_in_dbm (\
-                                Entry.iFolderID, Entry.ID)
+        if self.__is_new_local_file (iFolderID, Path):
+            ParentID = self.__find_parent (iFolderID, Path)
+            if ParentID is not None:
+                Entry = self.policy.add_remote_file \
+                    (iFolderID, ParentID, Path)
+                if Entry is not None:
+                    Updated = True
+                    if self.policy.modify_remote_file (\
+                        iFolderID, Entry.ID, Entry.Path):
+                        self.after_transfer (
+                            Entry.Path, self.__update_entry_in_dbm,
+                            Entry.iFolderID, Entry.ID)
 
         return Updated
 
@@ -1844,20 +2600,24 @@ class pyFolder:
     #
     #  @param iFolderID The ID of the iFolder the new entries will be 
     #                   merged with.
-    #  @param Name The name of the iFolder that needs to be checked for
-    #              new locally-added entries.
+    #  @param AddedList The list of the new local entries, as returned
+    #                   by pyFolder.__diff_ifolder.
     #
     #  @return True whether at least one new entry (of any kind) was
     #               committed.
 
-    def __commit_added_entries (self, iFolderID, Name):
+    def __commit_added_entries (self, iFolderID, AddedList):
         Updated = False
 
-        for Root, Dirs, Files in os.walk (self.add_prefix (Name)):
-            Updated = self.__commit_added_directories (\
-                Root, Dirs, iFolderID) or Updated
-            Updated = self.__commit_added_files (\
-                Root, Files, iFolderID) or Updated
+        for Path, ScanEntry in AddedList:
+
+            if ScanEntry.IsDir:
+                Updated = self.__commit_added_directory (\
+                    iFolderID, Path) or Updated
+
+            else:
+                Updated = self.__commit_added_file (\
+                    iFolderID, Path) or Updated
 
         return Updated
 
@@ -1889,7 +2649,8 @@ class pyFolder:
                 iFolderID, EntryID, LocalPath)
 
         if Updated:
-            self.__update_entry_in_dbm (iFolderID, EntryID)
+            self.after_transfer (
+                LocalPath, self.__update_entry_in_dbm, iFolderID, EntryID)
 
         return Updated
 
@@ -1929,19 +2690,37 @@ class pyFolder:
     #  @param EntryID The ID of the ancestor entry.
 
     def __delete_hierarchy_from_dbm (self, iFolderID, EntryID):
+        self.dbm.delete_entries (
+            iFolderID, self.__get_hierarchy_from_dbm (iFolderID, EntryID))
+
+
+
+    ## Collect the IDs of a whole hierarchy stored in the local database.
+    #
+    #  @param iFolderID The ID of the iFolder the ancestor
+    #                   entry of the hierarchy belongs to.
+    #  @param EntryID The ID of the ancestor entry.
+    #
+    #  @return A list with the IDs of the entries to delete.
+
+    def __get_hierarchy_from_dbm (self, iFolderID, EntryID):
         EntryTupleList = self.dbm.get_entries_by_parent (EntryID)
 
         if len (EntryTupleList) == 0:
-            self.dbm.delete_entry (iFolderID, EntryID)
-            return
+            return [EntryID]
+
+        EntryIDList = []
 
         for EntryTuple in EntryTupleList:
             ChildrenID = EntryTuple['id']
 
             if EntryTuple['digest'] == 'DIRECTORY':
-                self.__delete_hierarchy_from_dbm (iFolderID, ChildrenID)
+                EntryIDList.extend (
+                    self.__get_hierarchy_from_dbm (iFolderID, ChildrenID))
 
-            self.dbm.delete_entry (iFolderID, ChildrenID)
+            EntryIDList.append (ChildrenID)
+
+        return EntryIDList
 
 
 
@@ -1980,15 +2759,119 @@ class pyFolder:
 
 
 
+    ## Compare the entries of an iFolder recorded in the local database
+    ## with the current snapshot of its local directory.
+    #
+    #  Both sides are sorted by local path and merged in a single pass.
+    #  Only the files whose size, mtime or inode differ from the recorded
+    #  ones are hashed. A directory is modified if any file below it is.
+    #
+    #  @param iFolderID The ID of the iFolder.
+    #  @param Name The name of the iFolder.
+    #  @param PathList If not None, compare only the entries below the
+    #                  local paths of this list.
+    #
+    #  @return A tuple (AddedList, Deleted, Modified). AddedList is a list
+    #          of (Path, core.scanner.ScanEntry) tuples for the new local
+    #          entries, sorted so that directories precede their contents.
+    #          Deleted and Modified are sets with the IDs of the entries
+    #          removed and changed locally.
+
+    def __diff_ifolder (self, iFolderID, Name, PathList=None):
+        Old = []
+        New = []
+
+        if PathList is None:
+            PathList = [Name]
+
+        for EntryTuple in self.dbm.get_entries_by_ifolder (iFolderID):
+            LocalPath = os.path.normpath (EntryTuple['localpath'])
+
+            if self.__is_below (LocalPath, PathList):
+                Old.append ((LocalPath, EntryTuple))
+
+        for Top in PathList:
+            Entries = self.__get_snapshot (Top)
+            ScanEntry = Entries.get (self.add_prefix (Top))
+
+            if ScanEntry is not None and \
+                    os.path.normpath (Top) != os.path.normpath (Name):
+                New.append ((os.path.normpath (Top), ScanEntry))
+
+            for Root, Dirs, Files in Entries.walk (self.add_prefix (Top)):
+                for Child in Dirs + Files:
+                    FullPath = os.path.join (Root, Child)
+                    Path = os.path.normpath (self.remove_prefix (FullPath))
+                    New.append ((Path, Entries.get (FullPath)))
+
+        Old.sort (key=lambda x: x[0])
+        New.sort (key=lambda x: x[0])
+
+        AddedList, DeletedList, KeptList = diff (Old, New)
+
+        Deleted = set ([EntryTuple['id'] for Path, EntryTuple in DeletedList])
+        Modified = set ()
+        Candidates = []
+
+        # The files are stat'ed once, by the snapshot, and the same
+        # attributes are used to pick, hash and check the candidates.
+
+        for Path, EntryTuple, ScanEntry in KeptList:
+
+            if EntryTuple['digest'] != 'DIRECTORY' and \
+                    (ScanEntry.Size, ScanEntry.Mtime, ScanEntry.Inode) != \
+                    (EntryTuple['size'], EntryTuple['mtime_ns'], \
+                         EntryTuple['inode']):
+                Candidates.append (
+                    (EntryTuple, self.__get_scan_stat (ScanEntry)))
+
+        self.precompute_digests (Candidates)
+
+        for EntryTuple, Stat in Candidates:
+
+            if self.__file_has_local_changes (
+                iFolderID, EntryTuple['id'], EntryTuple['localpath'], Stat):
+                Modified.add (EntryTuple['id'])
+                ParentTuple = self.dbm.get_entry (
+                    iFolderID, EntryTuple['parent'])
+
+                while ParentTuple is not None and \
+                        ParentTuple['id'] not in Modified:
+                    Modified.add (ParentTuple['id'])
+                    ParentTuple = self.dbm.get_entry (
+                        iFolderID, ParentTuple['parent'])
+
+        self.clear_digests ()
+
+        return AddedList, Deleted, Modified
+
+
+
+    ## Check whether the given path is one of, or lies below one of,
+    ## the paths of the given list.
+
+    def __is_below (self, Path, PathList):
+        for Top in PathList:
+
+            if Path == Top or Path.startswith (os.path.join (Top, '')):
+                return True
+
+        return False
+
+
+
     ## Commit any local change made on existing entries.
     #
     #  @param iFolderID The ID of the iFolder the entries
     #                   belong to.
+    #  @param Deleted The set of the IDs of the locally deleted entries.
+    #  @param Modified The set of the IDs of the locally modified entries.
     #
     #  @return True if at least one entry has been successfully committed.
+    #
+    #  @sa pyFolder.__diff_ifolder
 
-    def __commit_existing_entries (self, iFolderID):
-        Action = self.ifolderws.get_change_entry_action ()
+    def __commit_existing_entries (self, iFolderID, Deleted, Modified):
         Type = self.ifolderws.get_ifolder_entry_type ()
         Updated = False
 
@@ -1997,26 +2880,24 @@ class pyFolder:
         for EntryTuple in EntryTupleList:
             EntryID = EntryTuple['id']
             Path = EntryTuple['path']
-            LocalPath = EntryTuple['localpath']
-            Digest = EntryTuple['digest']
+            EntryType = Type.File
 
-            if self.dbm.get_entry (iFolderID, EntryID) is None:
+            if EntryID not in Deleted and EntryID not in Modified:
                 continue
 
-            self.logger.debug ('Checking entry `{0}\''.format (\
-                    LocalPath.encode ('utf-8')))
+            if self.dbm.get_entry (iFolderID, EntryID) is None:
+                continue
 
-            ChangeType, EntryType = self.get_local_changes_on_entry (\
-                iFolderID, EntryID, LocalPath, Digest)
+            if EntryTuple['digest'] == 'DIRECTORY':
+                EntryType = Type.Directory
 
-            if ChangeType is not None:
-                if ChangeType == Action.Modify:
-                    Updated = self.__commit_modified_entry (\
-                        iFolderID, EntryID, Path, EntryType) or Updated
+            if EntryID in Modified:
+                Updated = self.__commit_modified_entry (\
+                    iFolderID, EntryID, Path, EntryType) or Updated
 
-                elif ChangeType == Action.Delete:
-                    Updated = self.__commit_deleted_entry (\
-                        iFolderID, EntryID, Path, EntryType) or Updated
+            else:
+                Updated = self.__commit_deleted_entry (\
+                    iFolderID, EntryID, Path, EntryType) or Updated
 
         return Updated
 
@@ -2024,6 +2905,7 @@ class pyFolder:
 
     ## Synchronize the remote repository with the local one.
 
+    @scanning
     def commit (self):
 
         iFolderTupleList = None
@@ -2047,18 +2929,78 @@ class pyFolder:
         # We assume that the pyFolder user isn't allowed to add/delete
         # iFolders, so we are going to check just the entries
 
+        JournalTupleList = self.dbm.get_journal_entries ()
+
         for iFolderTuple in iFolderTupleList:
-            iFolderID = iFolderTuple['id']
             Name = iFolderTuple['name']
 
-            Updated = False
+            self.__commit_ifolder (
+                iFolderTuple['id'], Name, None,
+                self.__get_journal_ids (JournalTupleList, [Name]))
+
+        self.__complete_stray_journal_entries (
+            JournalTupleList, iFolderTupleList)
+
+
+
+    ## Commit the local changes made below the given paths only.
+    #
+    #  @param PathList A list of local paths, without the pyFolder prefix.
+    #                  Paths outside of the iFolders are ignored.
+    #  @param JournalTupleList The journal entries the paths come from,
+    #                          which are marked as committed along with
+    #                          the changes of their iFolder.
+
+    @scanning
+    def commit_paths (self, PathList, JournalTupleList=[]):
+        PathList = prune (PathList)
+        iFolderTupleList = self.dbm.get_ifolders ()
+
+        for iFolderTuple in iFolderTupleList:
+            Name = iFolderTuple['name']
+            iFolderPathList = [x for x in PathList \
+                                   if self.__is_below (x, [Name])]
+
+            if len (iFolderPathList) == 0:
+                continue
+
+            for Path in iFolderPathList:
+                self.snapshot.scan (self.add_prefix (Path))
+
+            self.__commit_ifolder (
+                iFolderTuple['id'], Name, iFolderPathList,
+                self.__get_journal_ids (JournalTupleList, [Name]))
+
+        self.__complete_stray_journal_entries (
+            JournalTupleList, iFolderTupleList)
+
+
+
+    ## Commit the local changes made on an iFolder.
+    #
+    #  The given journal entries are marked as committed within the same
+    #  transaction as the changes, once all of them have been committed.
+    #
+    #  @param iFolderID The ID of the iFolder.
+    #  @param Name The name of the iFolder.
+    #  @param PathList If not None, commit only the changes below the
+    #                  local paths of this list.
+    #  @param JournalIDList The IDs of the journal entries recording the
+    #                       changes.
+
+    def __commit_ifolder (self, iFolderID, Name, PathList=None,
+                          JournalIDList=[]):
+        with self.dbm.transaction (), self.dbm.indexed (iFolderID):
 
             try:
 
-                Updated = self.__commit_existing_entries (iFolderID) \
-                    or Updated
-                Updated = self.__commit_added_entries (iFolderID, Name) \
-                    or Updated
+                AddedList, Deleted, Modified = \
+                    self.__diff_ifolder (iFolderID, Name, PathList)
+
+                self.__commit_existing_entries (
+                    iFolderID, Deleted, Modified)
+                self.__commit_added_entries (iFolderID, AddedList)
+                self.transfers.join ()
 
             except WebFault, wf:
                 ex = self.get_original_exception (wf)
@@ -2072,8 +3014,174 @@ class pyFolder:
                 else:
                     raise
 
-            if Updated:
-                self.__update_ifolder_in_dbm (iFolderID)
+            self.dbm.complete_journal_entries (JournalIDList)
+
+
+
+    ## Get the IDs of the journal entries recorded below the given paths.
+
+    def __get_journal_ids (self, JournalTupleList, PathList):
+        return [x['id'] for x in JournalTupleList \
+                    if self.__is_below (x['path'], PathList)]
+
+
+
+    ## Mark as committed the journal entries that don't belong to any
+    ## iFolder, since there is nothing to commit for them.
+
+    def __complete_stray_journal_entries (self, JournalTupleList,
+                                          iFolderTupleList):
+        Names = [x['name'] for x in iFolderTupleList]
+
+        self.dbm.complete_journal_entries (
+            [x['id'] for x in JournalTupleList \
+                 if not self.__is_below (x['path'], Names)])
+
+
+
+    ## Commit the local changes recorded in the journal, and mark them
+    ## as committed.
+    #
+    #  If the commit of an iFolder is interrupted, its changes are
+    #  committed again on the next call.
+
+    def replay_journal (self):
+        JournalTupleList = self.dbm.get_journal_entries ()
+
+        if len (JournalTupleList) == 0:
+            return
+
+        self.logger.info ('Committing {0} changed paths'.format (
+                len (JournalTupleList)))
+
+        self.commit_paths (
+            [x['path'] for x in JournalTupleList], JournalTupleList)
+
+
+
+    ## Keep the local repository synchronized until interrupted.
+    #
+    #  Local changes are detected through core.watch.Watcher, recorded
+    #  in the journal, and committed once no more changes are seen for
+    #  the debounce time.
+    #  Remote changes are looked for periodically, and the changes left
+    #  in the journal by a failed commit are committed again. Where the
+    #  watcher is not available, the whole repository is committed
+    #  periodically instead. Connection errors, web service faults and
+    #  local I/O errors, such as a file removed between the scan and
+    #  the upload, are logged, and the synchronization is tried again
+    #  on the next interval.
+    #
+    #  The journal doesn't spare a full commit on startup. The changes
+    #  made while pyFolder was not running are not recorded anywhere, so
+    #  that each iFolder is committed whole once it starts being
+    #  watched, which also covers the journal entries left pending by a
+    #  crash.
+
+    def watch (self):
+        LocalWatcher = None
+        Deadline = None
+        NextUpdate = time.time ()
+
+        try:
+
+            self.dbm.get_ifolders ()
+
+        except sqlite3.OperationalError:
+
+            print >> sys.stderr, 'Could not open the local database. ' \
+                'Please, ' \
+                'run the `checkout\' action first or ' \
+                'provide a valid path to the local ' \
+                'database using the `--pathtodb\' ' \
+                'command line switch.'
+            sys.exit ()
+
+        self.dbm.purge_journal ()
+
+        from core.watch import Watcher
+
+        try:
+
+            LocalWatcher = Watcher ()
+
+        except OSError, ose:
+
+            self.logger.warning (
+                'Cannot watch the local repository ({0}), falling ' \
+                    'back to periodic commits'.format (ose))
+
+        try:
+
+            while True:
+                Now = time.time ()
+
+                if Now >= NextUpdate:
+                    NextUpdate = Now + self.cm.get_interval ()
+                    Deadline = None
+
+                    self.__try_sync (self.replay_journal)
+                    self.__try_sync (self.update)
+
+                    if LocalWatcher is None:
+                        self.__try_sync (self.commit)
+
+                    else:
+                        for iFolderTuple in self.dbm.get_ifolders ():
+                            Root = self.add_prefix (iFolderTuple['name'])
+
+                            if Root not in LocalWatcher.Roots:
+                                LocalWatcher.add (Root)
+                                self.dbm.add_journal_entries (
+                                    [iFolderTuple['name']])
+                                Deadline = Now
+
+                    continue
+
+                Timeout = NextUpdate - Now
+
+                if Deadline is not None:
+                    Timeout = max (min (Timeout, Deadline - Now), 0)
+
+                if LocalWatcher is None:
+                    time.sleep (Timeout)
+                    continue
+
+                ChangedPaths = LocalWatcher.read (Timeout)
+
+                if len (ChangedPaths) > 0:
+                    self.dbm.add_journal_entries (
+                        [self.remove_prefix (x) for x in ChangedPaths])
+                    Deadline = time.time () + self.cm.get_debounce ()
+
+                elif Deadline is not None and time.time () >= Deadline:
+                    Deadline = None
+                    self.__try_sync (self.replay_journal)
+
+        finally:
+
+            if LocalWatcher is not None:
+                LocalWatcher.close ()
+
+
+
+    ## Run a synchronization action while watching, logging rather than
+    ## raising the connection errors, the web service faults and the
+    ## local I/O errors. The changes not committed yet are left in the
+    ## journal, and the action is tried again on the next interval.
+    #
+    #  @param Action The callable to invoke.
+
+    def __try_sync (self, Action):
+        try:
+
+            Action ()
+
+        except (WebFault, IOError, OSError) + TRANSIENT_ERRORS, e:
+            self.logger.warning (
+                'Could not {0} ({1}), retrying in {2} seconds'.format (
+                    Action.__name__.replace ('_', ' '), e,
+                    self.cm.get_interval ()))
 
 
 
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+
+from setup import *
+
+
+
+# The number of entries in the synthetic listing, and the memory budget
+# of the lean mode, as a fraction of the memory the default mode takes.
+# A benchmark run fails whether the lean mode exceeds it.
+
+ENTRIES = 20000
+LEAN_BUDGET = 0.5
+
+MODES = [ 'suds', 'fast', 'lean' ]
+
+TEST_CONFIG = Setup ()
+
+
+
+# Runs in a fresh interpreter. Builds a GetEntriesByName reply listing
+# the given number of entries, filled in with sample values according
+# to the iFolder schema, then measures the memory held by the entries
+# once unmarshalled, either by suds, by the FastUnmarshaller, or by the
+# FastUnmarshaller in lean mode. The resident set size is read from
+# /proc, so that this only runs on Linux.
+
+PROBE = '''
+import gc
+import json
+import resource
+import sys
+
+sys.path.insert (0, sys.argv[1])
+
+from core.config import ConfigManager
+from core.ifolderws import iFolderWS
+
+SAMPLE_VALUES = {
+    'boolean' : 'false',
+    'dateTime' : '2012-01-01T00:00:00',
+    'string' : '0123456789abcdef0123456789abcdef'
+    }
+
+def sample (Type, Count):
+    Real = Type.resolve ()
+
+    if Real.enum ():
+        Content = Real.children ()[0][0].name
+
+    elif Real.builtin ():
+        Content = SAMPLE_VALUES.get (Real.name, '0')
+
+    else:
+        Content = ''.join (
+            [sample (Child, Count) for Child, Ancestry in Real.children ()])
+
+    Element = '<{0}>{1}</{0}>'.format (Type.name, Content)
+
+    if Type.unbounded ():
+        return Element * Count
+
+    return Element
+
+def rss ():
+    with open ('/proc/self/statm', 'r') as File:
+        return int (File.read ().split ()[1]) * resource.getpagesize ()
+
+Mode = sys.argv[2]
+Options = json.loads (sys.argv[3])
+
+ifolderws = iFolderWS (
+    ConfigManager (runfromtest=True, lean=Mode == 'lean', **Options))
+
+method = ifolderws.client.service.GetEntriesByName.method
+Wrapper = method.binding.output.bodypart_types (method, input=False)[0]
+
+Body = sample (Wrapper, int (sys.argv[4])).replace (
+    '<{0}>'.format (Wrapper.name),
+    '<{0} xmlns="{1}">'.format (Wrapper.name, Wrapper.namespace ()[1]), 1)
+
+Reply = '<?xml version="1.0" encoding="utf-8"?>' \\
+    '<soap:Envelope ' \\
+    'xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">' \\
+    '<soap:Body>{0}</soap:Body></soap:Envelope>'.format (Body)
+
+gc.collect ()
+Before = rss ()
+
+if Mode == 'suds':
+    Root, Result = method.binding.output.get_reply (method, Reply)
+
+else:
+    Result = ifolderws.unmarshaller.unmarshal (method, Reply)
+
+gc.collect ()
+
+print json.dumps ({
+        'retained' : rss () - Before,
+        'peak' : resource.getrusage (
+            resource.RUSAGE_SELF).ru_maxrss * 1024 - Before
+        })
+'''
+
+
+
+def probe (Mode, Options):
+    Source = os.path.dirname (os.path.dirname (os.path.abspath (__file__)))
+
+    Output = subprocess.check_output ([
+            sys.executable, '-c', PROBE, Source, Mode, json.dumps (Options),
+            str (ENTRIES)])
+
+    return json.loads (Output)
+
+
+
+def benchmark ():
+    CacheDir = tempfile.mkdtemp ()
+
+    Options = dict (TEST_CONFIG.USERDATA[PRIMARY_USER])
+    Options['cachedir'] = CacheDir
+
+    try:
+
+        Results = dict ([(Mode, probe (Mode, Options)) for Mode in MODES])
+
+    finally:
+        shutil.rmtree (CacheDir, True)
+
+    for Mode in MODES:
+        print '{0}: {1} bytes per entry, peak {2:.1f}MB'.format (
+            Mode, Results[Mode]['retained'] / ENTRIES,
+            Results[Mode]['peak'] / 1048576.0)
+
+    Ratio = float (Results['lean']['retained']) / Results['fast']['retained']
+
+    print 'lean: {0:.2f} of the default mode (budget {1:.2f})'.format (
+        Ratio, LEAN_BUDGET)
+
+    return Ratio <= LEAN_BUDGET
+
+
+
+if __name__ == '__main__':
+    if not benchmark ():
+        print 'Memory budget exceeded.'
+        sys.exit (1)
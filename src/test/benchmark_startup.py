@@ -0,0 +1,201 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+
+
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+
+from setup import *
+
+
+
+# The startup budget, in seconds. A benchmark run fails whether the
+# best of its measurements exceeds any of these.
+
+IMPORT_BUDGET = 0.15
+FIRST_CALL_BUDGET = 1.0
+
+ACTIONS = [ 'checkout', 'update', 'commit', 'watch' ]
+RUNS = 5
+
+SOURCE = os.path.dirname (os.path.dirname (os.path.abspath (__file__)))
+
+# The iFolder recorded in the local database before timing the actions
+# other than checkout.
+
+SEED_IFOLDER_ID = 'benchmark'
+SEED_IFOLDER_NAME = 'Benchmark'
+SEED_ENTRY_ID = 'benchmark-entry'
+SEED_MTIME = datetime.datetime (2012, 1, 1)
+
+
+
+sys.path.append (SOURCE)
+
+
+
+# Runs in a fresh interpreter. Measures the time spent importing the
+# pyFolder module, then the time until the given action issues its
+# first SOAP call, which is stopped at the transport before anything
+# is sent, or completes without issuing any.
+
+PROBE = '''
+import time
+Start = time.time ()
+
+import json
+import sys
+
+sys.path.insert (0, sys.argv[1])
+
+import pyFolder
+Imported = time.time ()
+
+from core.config import ConfigManager
+from core.transport import KeepAliveTransport
+from suds.transport.http import HttpTransport
+
+class FirstCall (BaseException):
+    pass
+
+def send (self, *args):
+    raise FirstCall ()
+
+HttpTransport.send = send
+KeepAliveTransport.send = send
+KeepAliveTransport.stream = send
+
+Options = json.loads (sys.argv[2])
+Result = {
+    'import' : Imported - Start,
+    'modules' : len (sys.modules)
+    }
+
+if len (Options) > 0:
+    cm = ConfigManager (runfromtest=True, **Options)
+
+    Result['called'] = False
+
+    try:
+
+        pyFolder.pyFolder (cm, pyFolder.RUN_AS_COMMAND)
+
+    except FirstCall:
+        Result['called'] = True
+
+    Result['first call'] = time.time () - Start
+
+print json.dumps (Result)
+'''
+
+
+
+def probe (Options):
+    Output = subprocess.check_output ([
+            sys.executable, '-c', PROBE, SOURCE, json.dumps (Options)])
+
+    return json.loads (Output)
+
+
+
+## Record a checked out iFolder in the local database, along with a new
+## local file, so that update, commit and watch find a repository to
+## synchronize, and have to call the server.
+#
+#  @param Options The pyFolder options of the benchmark run.
+
+def seed (Options):
+    from core.config import ConfigManager
+    from core.dbm import DBM
+
+    dbm = DBM (ConfigManager (runfromtest=True, **Options))
+    dbm.create_schema ()
+    dbm.add_ifolder (
+        SEED_IFOLDER_ID, SEED_MTIME, SEED_IFOLDER_NAME, SEED_ENTRY_ID)
+
+    Path = os.path.join (Options['prefix'], SEED_IFOLDER_NAME)
+    os.makedirs (Path)
+
+    with open (os.path.join (Path, 'file'), 'wb') as File:
+        File.write ('data')
+
+
+
+## Measure the startup of an action, on a new local repository and WSDL
+## cache.
+#
+#  @param Action The pyFolder action.
+#  @param Options The options identifying the iFolder server and user.
+#  @param Runs The number of measurements with a warm WSDL cache.
+#
+#  @return A tuple (Cold, WarmList), with the result of the probe run
+#          with a cold WSDL cache, and the ones of the following runs.
+
+def measure (Action, Options, Runs=RUNS):
+    Prefix = tempfile.mkdtemp ()
+    CacheDir = tempfile.mkdtemp ()
+
+    Options = dict (Options)
+    Options['action'] = Action
+    Options['prefix'] = Prefix
+    Options['pathtodb'] = os.path.join (Prefix, '.ifolderdb')
+    Options['cachedir'] = CacheDir
+
+    try:
+
+        if Action != 'checkout':
+            seed (Options)
+
+        Cold = probe (Options)
+        Warm = [probe (Options) for i in range (Runs)]
+
+    finally:
+        shutil.rmtree (Prefix, True)
+        shutil.rmtree (CacheDir, True)
+
+    return Cold, Warm
+
+
+
+def benchmark_import ():
+    Results = [probe ({}) for i in range (RUNS)]
+    Best = min ([x['import'] for x in Results])
+
+    print 'import: {0:.3f}s, {1} modules (budget {2:.3f}s)'.format (
+        Best, Results[0]['modules'], IMPORT_BUDGET)
+
+    return Best <= IMPORT_BUDGET
+
+
+
+def benchmark_action (Action, Options):
+    Cold, Warm = measure (Action, Options)
+    Best = min ([x['first call'] for x in Warm])
+
+    print '{0}: first call {1:.3f}s, {2:.3f}s with a cold WSDL ' \
+        'cache (budget {3:.3f}s)'.format (
+        Action, Best, Cold['first call'], FIRST_CALL_BUDGET)
+
+    return Best <= FIRST_CALL_BUDGET
+
+
+
+if __name__ == '__main__':
+    TEST_CONFIG = Setup ()
+    Passed = benchmark_import ()
+
+    for Action in ACTIONS:
+        Passed = benchmark_action (
+            Action, TEST_CONFIG.USERDATA[PRIMARY_USER]) and Passed
+
+    if not Passed:
+        print 'Startup budget exceeded.'
+        sys.exit (1)
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+
+
+
+import BaseHTTPServer
+import SocketServer
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+
+
+
+sys.path.append ('../')
+
+
+
+from core.config import ConfigManager
+
+
+
+# A minimal WSDL, modeled after the iFolder web service. GetChanges
+# returns a set of entries, some of whose elements are nillable, and
+# ReadFile returns an optional base64 encoded chunk. GetiFolders,
+# GetiFolder and CreateEntry are the first calls of the pyFolder
+# actions, and only their requests are modeled.
+
+WSDL = '''<?xml version="1.0" encoding="utf-8"?>
+<definitions xmlns="http://schemas.xmlsoap.org/wsdl/"
+  xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"
+  xmlns:s="http://www.w3.org/2001/XMLSchema"
+  xmlns:tns="urn:fake" targetNamespace="urn:fake">
+<types>
+<s:schema targetNamespace="urn:fake" elementFormDefault="qualified">
+<s:element name="GetChanges"><s:complexType><s:sequence>
+<s:element name="iFolderID" type="s:string" minOccurs="0"/>
+<s:element name="Count" type="s:int"/>
+</s:sequence></s:complexType></s:element>
+<s:element name="GetChangesResponse"><s:complexType><s:sequence>
+<s:element name="GetChangesResult" type="tns:ChangeEntrySet"
+  minOccurs="0"/>
+</s:sequence></s:complexType></s:element>
+<s:complexType name="ChangeEntrySet"><s:sequence>
+<s:element name="Items" type="tns:ArrayOfChangeEntry" minOccurs="0"/>
+<s:element name="Total" type="s:int"/>
+</s:sequence></s:complexType>
+<s:complexType name="ArrayOfChangeEntry"><s:sequence>
+<s:element name="ChangeEntry" type="tns:ChangeEntry" minOccurs="0"
+  maxOccurs="unbounded" nillable="true"/>
+</s:sequence></s:complexType>
+<s:complexType name="ChangeEntry"><s:sequence>
+<s:element name="Time" type="s:dateTime"/>
+<s:element name="Type" type="tns:iFolderEntryType"/>
+<s:element name="Action" type="tns:ChangeEntryAction"/>
+<s:element name="ID" type="s:string" minOccurs="0"/>
+<s:element name="Name" type="s:string" minOccurs="0"/>
+<s:element name="Size" type="s:long"/>
+<s:element name="IsDirectory" type="s:boolean"/>
+<s:element name="Note" type="s:string" minOccurs="0" nillable="true"/>
+</s:sequence></s:complexType>
+<s:simpleType name="iFolderEntryType"><s:restriction base="s:string">
+<s:enumeration value="File"/><s:enumeration value="Directory"/>
+</s:restriction></s:simpleType>
+<s:simpleType name="ChangeEntryAction"><s:restriction base="s:string">
+<s:enumeration value="Add"/><s:enumeration value="Modify"/>
+<s:enumeration value="Delete"/>
+</s:restriction></s:simpleType>
+<s:element name="ReadFile"><s:complexType><s:sequence>
+<s:element name="file" type="s:string" minOccurs="0"/>
+<s:element name="size" type="s:int"/>
+</s:sequence></s:complexType></s:element>
+<s:element name="ReadFileResponse"><s:complexType><s:sequence>
+<s:element name="ReadFileResult" type="s:base64Binary" minOccurs="0"/>
+</s:sequence></s:complexType></s:element>
+<s:element name="GetiFolders"><s:complexType><s:sequence>
+<s:element name="index" type="s:int"/>
+<s:element name="max" type="s:int"/>
+</s:sequence></s:complexType></s:element>
+<s:element name="GetiFolder"><s:complexType><s:sequence>
+<s:element name="ifolderID" type="s:string" minOccurs="0"/>
+</s:sequence></s:complexType></s:element>
+<s:element name="CreateEntry"><s:complexType><s:sequence>
+<s:element name="ifolderID" type="s:string" minOccurs="0"/>
+<s:element name="parentID" type="s:string" minOccurs="0"/>
+<s:element name="type" type="tns:iFolderEntryType"/>
+<s:element name="entryName" type="s:string" minOccurs="0"/>
+</s:sequence></s:complexType></s:element>
+<s:element name="Response"><s:complexType/></s:element>
+</s:schema>
+</types>
+<message name="GetChangesIn">
+<part name="parameters" element="tns:GetChanges"/></message>
+<message name="GetChangesOut">
+<part name="parameters" element="tns:GetChangesResponse"/></message>
+<message name="ReadFileIn">
+<part name="parameters" element="tns:ReadFile"/></message>
+<message name="ReadFileOut">
+<part name="parameters" element="tns:ReadFileResponse"/></message>
+<message name="GetiFoldersIn">
+<part name="parameters" element="tns:GetiFolders"/></message>
+<message name="GetiFolderIn">
+<part name="parameters" element="tns:GetiFolder"/></message>
+<message name="CreateEntryIn">
+<part name="parameters" element="tns:CreateEntry"/></message>
+<message name="Out">
+<part name="parameters" element="tns:Response"/></message>
+<portType name="iFolderWebPort">
+<operation name="GetChanges">
+<input message="tns:GetChangesIn"/><output message="tns:GetChangesOut"/>
+</operation>
+<operation name="ReadFile">
+<input message="tns:ReadFileIn"/><output message="tns:ReadFileOut"/>
+</operation>
+<operation name="GetiFolders">
+<input message="tns:GetiFoldersIn"/><output message="tns:Out"/>
+</operation>
+<operation name="GetiFolder">
+<input message="tns:GetiFolderIn"/><output message="tns:Out"/>
+</operation>
+<operation name="CreateEntry">
+<input message="tns:CreateEntryIn"/><output message="tns:Out"/>
+</operation>
+</portType>
+<binding name="iFolderWebBinding" type="tns:iFolderWebPort">
+<soap:binding transport="http://schemas.xmlsoap.org/soap/http"/>
+<operation name="GetChanges">
+<soap:operation soapAction="urn:fake/GetChanges"/>
+<input><soap:body use="literal"/></input>
+<output><soap:body use="literal"/></output>
+</operation>
+<operation name="ReadFile">
+<soap:operation soapAction="urn:fake/ReadFile"/>
+<input><soap:body use="literal"/></input>
+<output><soap:body use="literal"/></output>
+</operation>
+<operation name="GetiFolders">
+<soap:operation soapAction="urn:fake/GetiFolders"/>
+<input><soap:body use="literal"/></input>
+<output><soap:body use="literal"/></output>
+</operation>
+<operation name="GetiFolder">
+<soap:operation soapAction="urn:fake/GetiFolder"/>
+<input><soap:body use="literal"/></input>
+<output><soap:body use="literal"/></output>
+</operation>
+<operation name="CreateEntry">
+<soap:operation soapAction="urn:fake/CreateEntry"/>
+<input><soap:body use="literal"/></input>
+<output><soap:body use="literal"/></output>
+</operation>
+</binding>
+<service name="iFolderWeb">
+<port name="iFolderWebPort" binding="tns:iFolderWebBinding">
+<soap:address location="{0}"/>
+</port>
+</service>
+</definitions>
+'''
+
+ENVELOPE = '<?xml version="1.0" encoding="utf-8"?>' \
+    '<soap:Envelope ' \
+    'xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" ' \
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">' \
+    '<soap:Body>{0}</soap:Body></soap:Envelope>'
+
+FAULT = '<soap:Fault><faultcode>soap:Server</faultcode>' \
+    '<faultstring>{0}</faultstring><detail/></soap:Fault>'
+
+
+
+## Wrap the given body into a SOAP envelope.
+
+def envelope (Body):
+    return ENVELOPE.format (Body)
+
+
+
+## Get a SOAP fault reply, carrying the given message.
+
+def fault (Message):
+    return envelope (FAULT.format (Message))
+
+
+
+class FakeHandler (BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+
+
+    def setup (self):
+        self.timeout = self.server.idle
+        BaseHTTPServer.BaseHTTPRequestHandler.setup (self)
+
+        with self.server.lock:
+            self.server.connections.add (self.connection)
+
+
+
+    def finish (self):
+        with self.server.lock:
+            self.server.connections.discard (self.connection)
+
+        BaseHTTPServer.BaseHTTPRequestHandler.finish (self)
+
+
+
+    def do_GET (self):
+        self.__reply (200, WSDL.format (self.server.get_location ()))
+
+
+
+    def do_HEAD (self):
+        self.send_response (200)
+        self.send_header ('Content-Type', 'text/xml')
+        self.send_header ('ETag', '"fake"')
+        self.end_headers ()
+
+
+
+    def do_POST (self):
+        Request = self.rfile.read (
+            int (self.headers.getheader ('content-length')))
+
+        with self.server.lock:
+            self.server.requests.append (Request)
+
+        Reply = self.server.reply (Request)
+
+        if Reply is None:
+            self.close_connection = 1
+            return
+
+        self.__reply (*Reply)
+
+
+
+    def log_message (self, *args):
+        pass
+
+
+
+    def __reply (self, Status, Body):
+        self.send_response (Status)
+        self.send_header ('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header ('Content-Length', str (len (Body)))
+        self.end_headers ()
+        self.wfile.write (Body)
+
+
+
+## A fake iFolder web service, running in a thread of its own, so that
+## the client side can be tested without an iFolder server.
+#
+#  The POST requests are recorded, and handed over to the reply
+#  callable, which returns a tuple (Status, Body), or None to close the
+#  connection without replying.
+
+class FakeServer (SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+
+    ## The constructor.
+    #
+    #  @param reply The callable building the reply to each request.
+    #  @param idle The number of seconds after which an idle connection
+    #              is closed, or None to keep it open.
+
+    def __init__ (self, reply=None, idle=None):
+        BaseHTTPServer.HTTPServer.__init__ (
+            self, ('127.0.0.1', 0), FakeHandler)
+
+        self.reply = reply or (lambda Request : (200, envelope ('')))
+        self.idle = idle
+        self.requests = []
+        self.connections = set ()
+        self.lock = threading.Lock ()
+        self.cachedir = tempfile.mkdtemp ()
+
+        self.thread = threading.Thread (target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start ()
+
+
+
+    def get_location (self):
+        return 'http://127.0.0.1:{0}/ws'.format (self.server_port)
+
+
+
+    def get_wsdl (self):
+        return '{0}?wsdl'.format (self.get_location ())
+
+
+
+    ## Get a ConfigManager pointing to this server.
+    #
+    #  @param kwargs The options to override.
+
+    def get_config (self, **kwargs):
+        Options = {
+            'username' : 'user',
+            'password' : 'password',
+            'ifolderws' : self.get_wsdl (),
+            'cachedir' : self.cachedir
+            }
+
+        Options.update (kwargs)
+
+        return ConfigManager (runfromtest=True, **Options)
+
+
+
+    ## The clients may drop the connection before the reply is sent.
+
+    def handle_error (self, request, client_address):
+        pass
+
+
+
+    ## Stop serving, and close the connections still open.
+
+    def stop (self):
+        self.shutdown ()
+        self.server_close ()
+
+        with self.lock:
+            for Connection in self.connections:
+
+                try:
+
+                    Connection.shutdown (socket.SHUT_RDWR)
+
+                except socket.error:
+                    pass
+
+        shutil.rmtree (self.cachedir, True)
@@ -0,0 +1,66 @@
+#-*- coding: utf-8 -*-
+
+
+
+import sys
+import unittest
+
+
+
+sys.path.append ('../')
+
+
+
+from benchmark_startup import ACTIONS, measure, probe
+from fakeserver import *
+
+
+
+## Run the probes of the startup benchmark against the fake server,
+## without checking the budget.
+
+class TestStartupBenchmark (unittest.TestCase):
+
+
+
+    def setUp (self):
+        self.server = FakeServer ()
+        self.Options = {
+            'username' : 'user',
+            'password' : 'password',
+            'ifolderws' : self.server.get_location ()
+            }
+
+
+
+    def tearDown (self):
+        self.server.stop ()
+
+
+
+    def test_import (self):
+        Result = probe ({})
+
+        self.assertTrue (Result['import'] > 0)
+        self.assertTrue (Result['modules'] > 0)
+        self.assertFalse ('first call' in Result)
+
+
+
+    ## Each action is stopped at its first SOAP call, before anything
+    ## is sent to the server.
+
+    def test_actions (self):
+        for Action in ACTIONS:
+            Cold, Warm = measure (Action, self.Options, 1)
+
+            for Result in [Cold] + Warm:
+                self.assertTrue (Result['called'], Action)
+                self.assertTrue (Result['first call'] >= Result['import'])
+
+        self.assertEquals (self.server.requests, [])
+
+
+
+if __name__ == '__main__':
+    unittest.main ()
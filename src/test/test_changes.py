@@ -0,0 +1,116 @@
+#-*- coding: utf-8 -*-
+
+
+
+import datetime
+import logging
+import new
+import sys
+import unittest
+
+
+
+sys.path.append ('../')
+
+
+
+from pyFolder import *
+
+
+
+IFOLDER_ID = 'iFolder'
+MTIME = datetime.datetime (2012, 1, 1)
+
+
+
+class ChangeEntry:
+
+
+
+    def __init__ (self, ID, Name, Action, Minutes):
+        self.ID = ID
+        self.Name = Name
+        self.Action = Action
+        self.Time = MTIME + datetime.timedelta (minutes=Minutes)
+
+
+
+## Serves the change log of an iFolder, from the newest change
+## backwards, as the iFolder Web Service does.
+
+class ChangeLog:
+
+
+
+    def __init__ (self, ChangeList):
+        self.ChangeList = sorted (
+            ChangeList, key=lambda Change : Change.Time, reverse=True)
+
+
+
+    def get_changes (self, iFolderID, EntryID, Index, Max):
+        return self.ChangeList[Index:Index + Max] or None
+
+
+
+class TestChanges (unittest.TestCase):
+
+
+
+    def setUp (self):
+        self.pyFolder = new.instance (pyFolder)
+        self.pyFolder.logger = logging.getLogger ('TestChanges')
+
+
+
+    def get_changes_since (self, ChangeList):
+        self.pyFolder.ifolderws = ChangeLog (
+            ChangeList + [ChangeEntry ('Old', 'F/Old', 'Add', -1)])
+
+        return [(Change.ID, Change.Action) for Change in \
+                    self.pyFolder._pyFolder__get_changes_since (
+                IFOLDER_ID, MTIME)]
+
+
+
+    def test_latest_change_only (self):
+        self.assertEquals (
+            self.get_changes_since ([
+                    ChangeEntry ('A', 'F/A', 'Add', 1),
+                    ChangeEntry ('B', 'F/B', 'Add', 2),
+                    ChangeEntry ('A', 'F/A', 'Modify', 3)]),
+            [('A', 'Modify'), ('B', 'Add')])
+
+
+
+    def test_parent_modified_after_children (self):
+        self.assertEquals (
+            self.get_changes_since ([
+                    ChangeEntry ('Child', 'F/Dir/Child', 'Add', 2),
+                    ChangeEntry ('Dir', 'F/Dir', 'Add', 1),
+                    ChangeEntry ('Dir', 'F/Dir', 'Modify', 3)]),
+            [('Dir', 'Modify'), ('Child', 'Add')])
+
+
+
+    def test_same_time_parent_first (self):
+        self.assertEquals (
+            self.get_changes_since ([
+                    ChangeEntry ('Child', 'F/Dir/Child', 'Add', 1),
+                    ChangeEntry ('Dir', 'F/Dir', 'Add', 1)]),
+            [('Dir', 'Add'), ('Child', 'Add')])
+
+
+
+    def test_change_log_too_short (self):
+        self.pyFolder.ifolderws = ChangeLog ([
+                ChangeEntry ('A', 'F/A', 'Add', 1)])
+
+        self.assertEquals (
+            self.pyFolder._pyFolder__get_changes_since (IFOLDER_ID, MTIME),
+            None)
+
+
+
+if __name__ == '__main__':
+    unittest.main ()
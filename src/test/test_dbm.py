@@ -0,0 +1,272 @@
+#-*- coding: utf-8 -*-
+
+
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+
+
+sys.path.append ('../')
+
+
+
+from core.config import ConfigManager
+from core.dbm import DBM
+
+
+
+IFOLDER_ID = 'iFolder'
+IFOLDER_ENTRY_ID = 'iFolderEntry'
+IFOLDER_NAME = 'TestDBM'
+
+
+
+class TestDBM (unittest.TestCase):
+
+
+
+    def setUp (self):
+        self.Root = tempfile.mkdtemp ()
+        self.dbm = self.open ()
+        self.dbm.create_schema ()
+        self.dbm.add_ifolder (IFOLDER_ID, None, IFOLDER_NAME, IFOLDER_ENTRY_ID)
+
+
+
+    def tearDown (self):
+        self.dbm = None
+        shutil.rmtree (self.Root, True)
+
+
+
+    def open (self, Name='pyFolder.db'):
+        return DBM (ConfigManager (
+                runfromtest=True, username='user',
+                pathtodb=os.path.join (self.Root, Name)))
+
+
+
+    def add_entries (self, Count):
+        for i in range (Count):
+            Path = os.path.join (IFOLDER_NAME, str (i))
+
+            self.dbm.add_entry (
+                IFOLDER_ID, str (i), None, 'DIRECTORY', IFOLDER_ENTRY_ID,
+                Path, Path)
+
+
+
+    def test_transaction (self):
+        with self.dbm.transaction ():
+            self.add_entries (10)
+
+            with self.dbm.transaction ():
+                self.dbm.delete_entries (
+                    IFOLDER_ID, [str (i) for i in range (5)])
+
+        dbm = self.open ()
+
+        for i in range (10):
+            EntryTuple = dbm.get_entry (IFOLDER_ID, str (i))
+
+            if i < 5:
+                self.assertEqual (EntryTuple, None)
+
+            else:
+                self.assertEqual (EntryTuple['digest'], 'DIRECTORY')
+
+
+
+    def test_transaction_error (self):
+        try:
+
+            with self.dbm.transaction ():
+                with self.dbm.transaction ():
+                    self.add_entries (2)
+
+                raise ValueError ('Sync failed')
+
+        except ValueError:
+            pass
+
+        self.assertEqual (self.dbm.depth, 0)
+        self.assertEqual (
+            len (self.open ().get_entries_by_ifolder (IFOLDER_ID)), 2)
+
+
+
+    def test_index (self):
+        self.add_entries (2)
+
+        with self.dbm.indexed (IFOLDER_ID) as Index:
+            self.assertEqual (len (Index.ById), 2)
+
+            self.dbm.add_entry (
+                IFOLDER_ID, 'indexed', None, 'DIGEST', '0',
+                'indexed', 'indexed')
+            self.dbm.update_mtime_and_digest_by_entry (
+                IFOLDER_ID, 'indexed', None, 'NEWDIGEST')
+            self.dbm.update_stat_by_entry (IFOLDER_ID, 'indexed', 4, 1, 2)
+
+            EntryTuple = self.dbm.get_entry_by_ifolder_and_localpath (
+                IFOLDER_ID, 'indexed')
+
+            self.assertEqual (EntryTuple['digest'], 'NEWDIGEST')
+            self.assertEqual (EntryTuple['size'], 4)
+            self.assertEqual (
+                self.dbm.get_entry_by_ifolder_and_path (
+                    IFOLDER_ID, 'indexed'), EntryTuple)
+            self.assertEqual (
+                [x['id'] for x in self.dbm.get_entries_by_parent ('0')],
+                ['indexed'])
+            self.assertEqual (
+                [x['id'] for x in self.dbm.get_entries_by_parent (
+                        IFOLDER_ENTRY_ID)], ['0', '1'])
+
+            self.dbm.delete_entry (IFOLDER_ID, 'indexed')
+
+            self.assertEqual (self.dbm.get_entry (IFOLDER_ID, 'indexed'), None)
+            self.assertEqual (self.dbm.get_entries_by_parent ('0'), [])
+
+            self.dbm.delete_entries_by_parent (IFOLDER_ENTRY_ID)
+
+            self.assertEqual (self.dbm.get_entries_by_ifolder (IFOLDER_ID), [])
+
+        self.assertEqual (self.dbm.index, None)
+        self.assertEqual (self.dbm.get_entries_by_ifolder (IFOLDER_ID), [])
+
+
+
+    ## The entries handed out by the index keep their values when the
+    ## index is updated.
+
+    def test_index_snapshot (self):
+        self.add_entries (1)
+
+        with self.dbm.indexed (IFOLDER_ID):
+            EntryTuple = self.dbm.get_entry (IFOLDER_ID, '0')
+            self.dbm.update_mtime_and_digest_by_entry (
+                IFOLDER_ID, '0', None, 'NEWDIGEST')
+
+            self.assertEqual (EntryTuple['digest'], 'DIRECTORY')
+            self.assertEqual (
+                self.dbm.get_entry (IFOLDER_ID, '0')['digest'], 'NEWDIGEST')
+
+        self.assertEqual (
+            self.dbm.get_entry (IFOLDER_ID, '0')['digest'], 'NEWDIGEST')
+
+
+
+    ## Only the indexed iFolder is served from memory.
+
+    def test_index_other_ifolder (self):
+        self.dbm.add_ifolder ('Other', None, 'Other', 'OtherEntry')
+        self.dbm.add_entry (
+            'Other', 'o', None, 'DIGEST', 'OtherEntry', 'o', 'o')
+
+        with self.dbm.indexed (IFOLDER_ID) as Index:
+            self.assertEqual (self.dbm.get_entry ('Other', 'o')['path'], 'o')
+            self.assertEqual (
+                [x['id'] for x in self.dbm.get_entries_by_parent (
+                        'OtherEntry')], ['o'])
+            self.assertFalse ('o' in Index.ById)
+
+
+
+    def test_journal (self):
+        self.dbm.add_journal_entries (['a', 'b'])
+        JournalTupleList = self.dbm.get_journal_entries ()
+
+        self.assertEqual ([x['path'] for x in JournalTupleList], ['a', 'b'])
+
+        self.dbm.add_journal_entries (['c'])
+        self.dbm.complete_journal_entries ([JournalTupleList[0]['id']])
+        JournalTupleList = self.dbm.get_journal_entries ()
+
+        self.assertEqual ([x['path'] for x in JournalTupleList], ['b', 'c'])
+
+        self.dbm.complete_journal_entries (
+            [x['id'] for x in JournalTupleList])
+
+        self.assertEqual (self.dbm.get_journal_entries (), [])
+
+
+
+    def test_purge_journal (self):
+        self.dbm.add_journal_entries (['a', 'b'])
+        self.dbm.complete_journal_entries (
+            [self.dbm.get_journal_entries ()[0]['id']])
+        self.dbm.purge_journal ()
+
+        cu = self.dbm.cx.cursor ()
+        cu.execute ('SELECT path FROM journal')
+
+        self.assertEqual ([x['path'] for x in cu.fetchall ()], ['b'])
+
+
+
+    ## Databases created before the schema versioning have the tables
+    ## of the first version, and user_version 0.
+
+    def test_upgrade (self):
+        cx = sqlite3.connect (os.path.join (self.Root, 'old.db'))
+
+        for Query in DBM.SCHEMA_UPGRADES[0]:
+            cx.execute (Query)
+
+        cx.execute (DBM.Q_ADD_IFOLDER, (IFOLDER_ID, None, IFOLDER_NAME,
+                                        IFOLDER_ENTRY_ID))
+        cx.execute (DBM.Q_ADD_ENTRY, (IFOLDER_ID, 'f', None, 'DIGEST',
+                                      IFOLDER_ENTRY_ID, 'f', 'f'))
+        cx.commit ()
+        cx.close ()
+
+        dbm = self.open ('old.db')
+        cu = dbm.cx.cursor ()
+
+        cu.execute (DBM.Q_GET_SCHEMA_VERSION)
+        self.assertEqual (cu.fetchone ()[0], DBM.SCHEMA_VERSION)
+
+        cu.execute ('SELECT name FROM sqlite_master WHERE type=\'index\'')
+        self.assertTrue (set (['entry_by_parent', 'entry_by_path',
+                               'entry_by_localpath']) <= \
+                             set ([x['name'] for x in cu.fetchall ()]))
+
+        self.assertEqual (dbm.get_ifolder (IFOLDER_ID)['name'], IFOLDER_NAME)
+
+        EntryTuple = dbm.get_entry (IFOLDER_ID, 'f')
+
+        self.assertEqual (EntryTuple['digest'], 'DIGEST')
+        self.assertEqual (EntryTuple['size'], None)
+
+        dbm.add_journal_entries (['f'])
+        self.assertEqual (
+            [x['path'] for x in dbm.get_journal_entries ()], ['f'])
+
+        dbm.update_stat_by_entry (IFOLDER_ID, 'f', 4, 1, 2)
+        self.assertEqual (
+            self.open ('old.db').get_entry (IFOLDER_ID, 'f')['size'], 4)
+
+
+
+    def test_empty (self):
+        dbm = self.open ('empty.db')
+        cu = dbm.cx.cursor ()
+
+        cu.execute (DBM.Q_GET_SCHEMA_VERSION)
+        self.assertEqual (cu.fetchone ()[0], 0)
+
+        dbm.create_schema ()
+
+        cu.execute (DBM.Q_GET_SCHEMA_VERSION)
+        self.assertEqual (cu.fetchone ()[0], DBM.SCHEMA_VERSION)
+
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,58 @@
+#-*- coding: utf-8 -*-
+
+
+
+import logging
+import sys
+import unittest
+
+
+
+sys.path.append ('../')
+
+
+
+from core.ifolderws import iFolderWS
+
+
+
+from fakeserver import *
+
+
+
+class TestiFolderWS (unittest.TestCase):
+
+
+
+    def setUp (self):
+        self.server = FakeServer ()
+        self.cm = self.server.get_config ()
+
+
+
+    def tearDown (self):
+        self.server.stop ()
+
+
+
+    def test_clone_with_handler (self):
+        Logger = logging.getLogger ('user.pyFolder')
+        Handler = logging.StreamHandler ()
+        Logger.addHandler (Handler)
+
+        try:
+
+            ifolderws = iFolderWS (self.cm)
+            Clone = ifolderws.clone ()
+
+        finally:
+            Logger.removeHandler (Handler)
+
+        self.assertFalse (Clone.client is ifolderws.client)
+        self.assertTrue (
+            Clone.client.options.cache is ifolderws.client.options.cache)
+
+
+
+if __name__ == '__main__':
+    unittest.main ()
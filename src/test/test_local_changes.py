@@ -0,0 +1,171 @@
+#-*- coding: utf-8 -*-
+
+
+
+import logging
+import new
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+
+
+sys.path.append ('../')
+
+
+
+from pyFolder import *
+from core.dbm import DBM
+
+
+
+IFOLDER_ID = 'iFolder'
+IFOLDER_ENTRY_ID = 'iFolderEntry'
+IFOLDER_NAME = 'TestLocalChanges'
+
+
+
+class TestLocalChanges (unittest.TestCase):
+
+
+
+    def setUp (self):
+        self.Root = tempfile.mkdtemp ()
+        self.cm = ConfigManager (
+            runfromtest=True, username='user', prefix=self.Root,
+            pathtodb=os.path.join (self.Root, 'pyFolder.db'))
+
+        self.pyFolder = new.instance (pyFolder)
+        self.pyFolder.cm = self.cm
+        self.pyFolder.logger = logging.getLogger ('TestLocalChanges')
+        self.pyFolder.hashbuffer = threading.local ()
+        self.pyFolder.digests = {}
+        self.pyFolder.local_changes = {}
+        self.pyFolder.snapshot = Snapshot ()
+        self.pyFolder.dbm = DBM (self.cm)
+        self.pyFolder.dbm.create_schema ()
+        self.pyFolder.dbm.add_ifolder (
+            IFOLDER_ID, None, IFOLDER_NAME, IFOLDER_ENTRY_ID)
+
+        self.add ('d', None, IFOLDER_ENTRY_ID)
+        self.add ('f', 'data', IFOLDER_ENTRY_ID)
+        self.add (os.path.join ('d', 'g'), 'data', 'd')
+
+
+
+    def tearDown (self):
+        self.pyFolder.dbm = None
+        shutil.rmtree (self.Root, True)
+
+
+
+    ## Create a local entry of the iFolder, and record it in the local
+    ## database along with its current digest and stat.
+    #
+    #  @param Name The path of the entry within the iFolder, which is
+    #              also used as its ID.
+    #  @param Data The content of the file, or None for a directory.
+    #  @param ParentID The ID of the parent entry.
+
+    def add (self, Name, Data, ParentID):
+        Path = os.path.join (IFOLDER_NAME, Name)
+
+        if Data is None:
+            os.makedirs (self.pyFolder.add_prefix (Path))
+
+        else:
+            self.write (Name, Data)
+
+        self.pyFolder.dbm.add_entry (
+            IFOLDER_ID, Name, None, self.pyFolder.md5_hash (Path),
+            ParentID, Path, Path)
+
+        Stat = self.pyFolder.get_stat (Path)
+
+        if Stat is not None:
+            self.pyFolder.dbm.update_stat_by_entry (IFOLDER_ID, Name, *Stat)
+
+
+
+    def write (self, Name, Data):
+        with open (self.pyFolder.add_prefix (
+                os.path.join (IFOLDER_NAME, Name)), 'wb') as File:
+            File.write (Data)
+
+
+
+    def diff (self):
+        return self.pyFolder._pyFolder__diff_ifolder (IFOLDER_ID, IFOLDER_NAME)
+
+
+
+    def test_unchanged (self):
+        self.assertEquals (self.diff (), ([], set (), set ()))
+
+
+
+    def test_modified (self):
+        self.write (os.path.join ('d', 'g'), 'more data')
+
+        self.assertEquals (
+            self.diff (), ([], set (), set (['d', os.path.join ('d', 'g')])))
+
+
+
+    ## A file whose stat changed but whose content did not is reported
+    ## as unchanged, and its new stat is recorded.
+
+    def test_touched (self):
+        os.remove (self.pyFolder.add_prefix (
+                os.path.join (IFOLDER_NAME, 'f')))
+        self.write ('f', 'data')
+
+        Stat = self.pyFolder.get_stat (os.path.join (IFOLDER_NAME, 'f'))
+
+        self.assertEquals (self.diff (), ([], set (), set ()))
+        self.assertEquals (
+            self.pyFolder.dbm.get_entry (IFOLDER_ID, 'f')['inode'], Stat[2])
+
+
+
+    ## The changed files are stat'ed only once, by the snapshot.
+
+    def test_single_stat (self):
+        self.write ('f', 'new data')
+        self.pyFolder.snapshot.scan (self.pyFolder.add_prefix (IFOLDER_NAME))
+
+        Calls = []
+        Stat = os.stat
+        Exists = os.path.exists
+        IsFile = os.path.isfile
+
+        def stat (Path):
+            Calls.append (Path)
+            return Stat (Path)
+
+        def exists (Path):
+            Calls.append (Path)
+            return Exists (Path)
+
+        def isfile (Path):
+            Calls.append (Path)
+            return IsFile (Path)
+
+        os.stat, os.path.exists, os.path.isfile = stat, exists, isfile
+
+        try:
+
+            self.assertEquals (self.diff (), ([], set (), set (['f'])))
+
+        finally:
+            os.stat, os.path.exists, os.path.isfile = Stat, Exists, IsFile
+
+        self.assertEquals (Calls, [])
+
+
+
+if __name__ == '__main__':
+    unittest.main ()
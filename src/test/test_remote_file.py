@@ -0,0 +1,138 @@
+#-*- coding: utf-8 -*-
+
+
+
+import logging
+import new
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import unittest
+
+
+
+sys.path.append ('../')
+
+
+
+from pyFolder import *
+from core.config import ConfigManager
+
+
+
+IFOLDER_ID = 'iFolder'
+ENTRY_ID = 'Entry'
+FILE_NAME = 'File'
+
+
+
+## A remote file, whose transfers fail after the first chunk.
+
+class RemoteFile:
+
+
+
+    def __init__ (self, CloseFails=False):
+        self.CloseFails = CloseFails
+        self.Handles = 0
+
+
+
+    def open_file_read (self, iFolderID, EntryID):
+        self.Handles = self.Handles + 1
+        return 'Handle'
+
+
+
+    def open_file_write (self, iFolderID, EntryID, Size):
+        self.Handles = self.Handles + 1
+        return 'Handle'
+
+
+
+    def read_file_into (self, Handle, File, Size):
+        File.write ('Data')
+        raise IOError ('Transfer failed')
+
+
+
+    def write_file (self, Handle, Data):
+        raise IOError ('Transfer failed')
+
+
+
+    def close_file (self, Handle):
+        self.Handles = self.Handles - 1
+
+        if self.CloseFails:
+            raise socket.error ('Close failed')
+
+
+
+class TestRemoteFile (unittest.TestCase):
+
+
+
+    def setUp (self):
+        self.Prefix = tempfile.mkdtemp ()
+
+        self.pyFolder = new.instance (pyFolder)
+        self.pyFolder.cm = ConfigManager (
+            runfromtest=True, prefix=self.Prefix, soapbuflen=4)
+        self.pyFolder.logger = logging.getLogger ('TestRemoteFile')
+
+        with open (os.path.join (self.Prefix, FILE_NAME), 'wb') as File:
+            File.write ('Local')
+
+
+
+    def tearDown (self):
+        shutil.rmtree (self.Prefix, True)
+
+
+
+    def fetch (self, ifolderws):
+        self.pyFolder._pyFolder__fetch (
+            ifolderws, IFOLDER_ID, ENTRY_ID, FILE_NAME)
+
+
+
+    def write (self, ifolderws):
+        self.pyFolder._pyFolder__remote_file_write (
+            ifolderws, IFOLDER_ID, ENTRY_ID, FILE_NAME)
+
+
+
+    def test_fetch_failed (self):
+        ifolderws = RemoteFile ()
+
+        self.assertRaises (IOError, self.fetch, ifolderws)
+        self.assertEquals (ifolderws.Handles, 0)
+        self.assertEquals (os.listdir (self.Prefix), [FILE_NAME])
+
+        with open (os.path.join (self.Prefix, FILE_NAME), 'rb') as File:
+            self.assertEquals (File.read (), 'Local')
+
+
+
+    def test_write_failed (self):
+        ifolderws = RemoteFile ()
+
+        self.assertRaises (IOError, self.write, ifolderws)
+        self.assertEquals (ifolderws.Handles, 0)
+
+
+
+    def test_close_failed (self):
+        ifolderws = RemoteFile (CloseFails=True)
+
+        self.assertRaises (IOError, self.fetch, ifolderws)
+        self.assertRaises (IOError, self.write, ifolderws)
+        self.assertEquals (ifolderws.Handles, 0)
+
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,225 @@
+#-*- coding: utf-8 -*-
+
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+
+
+sys.path.append ('../')
+
+
+
+from core.scanner import Snapshot, diff, prune
+
+
+
+class TestSnapshot (unittest.TestCase):
+
+
+
+    def setUp (self):
+        self.Root = tempfile.mkdtemp ()
+
+        os.makedirs (self.path ('a', 'b'))
+        self.touch ('a', 'f')
+        self.touch ('a', 'b', 'g')
+        self.touch ('h')
+
+        self.snapshot = Snapshot ()
+        self.snapshot.scan (self.Root)
+
+
+
+    def tearDown (self):
+        shutil.rmtree (self.Root, True)
+
+
+
+    def path (self, *args):
+        return os.path.join (self.Root, *args)
+
+
+
+    def touch (self, *args):
+        with open (self.path (*args), 'wb') as File:
+            File.write ('data')
+
+
+
+    def test_scan (self):
+        Entry = self.snapshot.get (self.path ('a', 'f'))
+
+        self.assertTrue (Entry.IsFile)
+        self.assertFalse (Entry.IsDir)
+        self.assertEquals (Entry.Size, 4)
+        self.assertEquals (
+            Entry.Inode, os.stat (self.path ('a', 'f')).st_ino)
+
+        self.assertTrue (self.snapshot.get (self.path ('a', 'b')).IsDir)
+        self.assertEquals (self.snapshot.get (self.path ('missing')), None)
+
+
+
+    def test_scan_once (self):
+        self.touch ('new')
+        self.snapshot.scan (self.path ('a'))
+
+        self.assertEquals (self.snapshot.get (self.path ('new')), None)
+        self.assertEquals (self.snapshot.Roots, set ([self.Root]))
+
+
+
+    def test_walk (self):
+        self.assertEquals (list (self.snapshot.walk (self.Root)), [
+                (self.Root, ['a'], ['h']),
+                (self.path ('a'), ['b'], ['f']),
+                (self.path ('a', 'b'), [], ['g'])])
+
+        self.assertEquals (list (self.snapshot.walk (self.path ('h'))), [])
+
+
+
+    def test_walk_link (self):
+        os.symlink (self.path ('a'), self.path ('link'))
+        self.snapshot.update (self.path ('link'))
+
+        Entry = self.snapshot.get (self.path ('link'))
+
+        self.assertTrue (Entry.IsLink)
+        self.assertTrue (Entry.IsDir)
+        self.assertEquals (
+            list (self.snapshot.walk (self.Root))[0],
+            (self.Root, ['a', 'link'], ['h']))
+        self.assertEquals (list (self.snapshot.walk (self.path ('link'))), [])
+
+
+
+    def test_update_added (self):
+        os.makedirs (self.path ('a', 'c', 'd'))
+        self.touch ('a', 'c', 'd', 'i')
+        self.snapshot.update (self.path ('a', 'c'))
+
+        self.assertTrue (self.snapshot.get (self.path ('a', 'c', 'd', 'i')))
+        self.assertEquals (
+            list (self.snapshot.walk (self.path ('a')))[0],
+            (self.path ('a'), ['b', 'c'], ['f']))
+
+
+
+    def test_update_removed (self):
+        shutil.rmtree (self.path ('a', 'b'))
+        self.snapshot.update (self.path ('a', 'b'))
+
+        self.assertEquals (self.snapshot.get (self.path ('a', 'b')), None)
+        self.assertEquals (self.snapshot.get (self.path ('a', 'b', 'g')), None)
+        self.assertEquals (
+            list (self.snapshot.walk (self.path ('a'))),
+            [(self.path ('a'), [], ['f'])])
+
+
+
+    def test_update_modified (self):
+        with open (self.path ('h'), 'ab') as File:
+            File.write ('more')
+
+        self.snapshot.update (self.path ('h'))
+
+        self.assertEquals (self.snapshot.get (self.path ('h')).Size, 8)
+
+
+
+    def test_update_missing_parent (self):
+        os.makedirs (self.path ('x', 'y'))
+        self.touch ('x', 'y', 'z')
+        self.snapshot.update (self.path ('x', 'y', 'z'))
+
+        self.assertTrue (self.snapshot.get (self.path ('x', 'y', 'z')))
+
+
+
+    def test_update_outside (self):
+        Outside = tempfile.mkdtemp ()
+
+        try:
+
+            self.snapshot.update (Outside)
+            self.assertEquals (self.snapshot.get (Outside), None)
+
+        finally:
+            shutil.rmtree (Outside, True)
+
+
+
+    def test_covers (self):
+        self.assertTrue (self.snapshot.covers (self.Root))
+        self.assertTrue (self.snapshot.covers (self.path ('a', 'missing')))
+        self.assertFalse (self.snapshot.covers (self.Root + 'x'))
+        self.assertFalse (
+            self.snapshot.covers (os.path.dirname (self.Root)))
+
+
+
+class TestDiff (unittest.TestCase):
+
+
+
+    def test_diff (self):
+        Old = [('a', 1), ('b', 2), ('d', 4)]
+        New = [('b', 20), ('c', 30), ('d', 4), ('e', 50)]
+
+        self.assertEquals (diff (Old, New), (
+                [('c', 30), ('e', 50)],
+                [('a', 1)],
+                [('b', 2, 20), ('d', 4, 4)]))
+
+
+
+    def test_diff_empty (self):
+        Items = [('a', 1), ('b', 2)]
+
+        self.assertEquals (diff ([], Items), (Items, [], []))
+        self.assertEquals (diff (Items, []), ([], Items, []))
+        self.assertEquals (diff ([], []), ([], [], []))
+
+
+
+    def test_diff_nested (self):
+        Old = [('a', 1), ('a.b', 3), (os.path.join ('a', 'b'), 2)]
+        New = [('a', 1), ('a.b', 3)]
+
+        self.assertEquals (diff (Old, New), (
+                [],
+                [(os.path.join ('a', 'b'), 2)],
+                [('a', 1, 1), ('a.b', 3, 3)]))
+
+
+
+class TestPrune (unittest.TestCase):
+
+
+
+    def test_prune (self):
+        self.assertEquals (
+            prune ([os.path.join ('a', 'b', 'c'), 'a', 'a.b',
+                    os.path.join ('d', 'e'), os.path.join ('d', 'f', ''),
+                    os.path.join ('d', 'e', 'g'), 'a']),
+            ['a', 'a.b', os.path.join ('d', 'e'), os.path.join ('d', 'f')])
+
+
+
+    def test_prune_absolute (self):
+        Root = os.path.abspath (os.sep)
+
+        self.assertEquals (
+            prune ([os.path.join (Root, 'a', 'b'), Root]), [Root])
+        self.assertEquals (prune ([]), [])
+
+
+
+if __name__ == '__main__':
+    unittest.main ()
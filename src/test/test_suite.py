@@ -14,6 +14,18 @@ from test_commit_basic import *
 from test_commit_conflicts import *
 from test_commit_rights import *
 from test_helpers import *
+from test_ifolderws import *
+from test_transport import *
+from test_changes import *
+from test_remote_file import *
+from test_scanner import *
+from test_transfer import *
+from test_unmarshal import *
+from test_template import *
+from test_dbm import *
+from test_local_changes import *
+from test_watch import *
+from test_benchmark_startup import *
 
 
 
@@ -38,4 +50,62 @@ if __name__ == '__main__':
     suite.addTest (
         unittest.TestLoader ().loadTestsFromTestCase (TestHelpers))
 
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestiFolderWS))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestTransport))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestChanges))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestRemoteFile))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestSnapshot))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestDiff))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestPrune))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestChunkSizer))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestPipelined))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestTransferPool))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestFastUnmarshaller))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestBase64Stream))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestTemplate))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestDBM))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestLocalChanges))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestWatcher))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestReplayJournal))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (TestWatch))
+
+    suite.addTest (
+        unittest.TestLoader ().loadTestsFromTestCase (
+            TestStartupBenchmark))
+
     unittest.TextTestRunner (verbosity=2).run (suite)
@@ -0,0 +1,117 @@
+#-*- coding: utf-8 -*-
+
+
+
+import sys
+import unittest
+
+
+
+sys.path.append ('../')
+
+
+
+from core.ifolderws import iFolderWS
+from core.template import Template, TemplateCache
+from suds.plugin import MessagePlugin
+
+
+
+from fakeserver import *
+
+
+
+class TestTemplate (unittest.TestCase):
+
+
+
+    def setUp (self):
+        self.server = FakeServer ()
+        self.ifolderws = iFolderWS (self.server.get_config ())
+        self.client = self.ifolderws.client
+        self.method = self.client.service.GetChanges.method
+
+
+
+    def tearDown (self):
+        self.server.stop ()
+
+
+
+    def expected (self, args):
+        return self.method.binding.input.get_message (
+            self.method, args, {}).plain ().encode ('utf-8')
+
+
+
+    def test_fill (self):
+        Filled = Template (self.method)
+
+        for args in [('iFolder', 5), (u'\xe8 <&> "\'', -1), ('', 0),
+                     ('0', 1L << 40), (u'\ue000', 1)]:
+            self.assertEquals (Filled.fill (args), self.expected (args))
+
+
+
+    def test_fill_unsupported (self):
+        Filled = Template (self.method)
+
+        self.assertEquals (Filled.fill (('iFolder', )), None)
+        self.assertEquals (Filled.fill (('iFolder', 5, 6)), None)
+        self.assertEquals (Filled.fill ((None, 5)), None)
+        self.assertEquals (Filled.fill ((['iFolder'], 5)), None)
+
+
+
+    def test_render (self):
+        Cache = TemplateCache (self.client)
+
+        for args in [('iFolder', 5), ('Other', 6)]:
+            self.assertEquals (
+                Cache.render (self.method, args), self.expected (args))
+            self.assertTrue (Cache.Templates['GetChanges'].Verified)
+
+        self.assertEquals (
+            Cache.render (self.method, (None, 5)), self.expected ((None, 5)))
+        self.assertTrue (Cache.Templates['GetChanges'] is not None)
+
+
+
+    def test_render_mismatch (self):
+        Cache = TemplateCache (self.client)
+        Cache.Templates['GetChanges'] = Template (self.method)
+        Cache.Templates['GetChanges'].Parts[0] = '<Wrong>'
+
+        self.assertEquals (
+            Cache.render (self.method, ('iFolder', 5)),
+            self.expected (('iFolder', 5)))
+        self.assertEquals (Cache.Templates['GetChanges'], None)
+        self.assertEquals (
+            Cache.render (self.method, ('iFolder', 6)),
+            self.expected (('iFolder', 6)))
+
+
+
+    def test_render_plugins (self):
+        self.client.set_options (plugins=[MessagePlugin ()])
+        Cache = TemplateCache (self.client)
+
+        self.assertEquals (
+            Cache.render (self.method, ('iFolder', 5)),
+            self.expected (('iFolder', 5)))
+        self.assertEquals (Cache.Templates['GetChanges'], None)
+
+
+
+    def test_invoke (self):
+        for Count in [1, 2]:
+            self.ifolderws.unmarshaller.invoke ('GetChanges', 'iFolder', Count)
+
+        self.assertEquals (
+            self.server.requests,
+            [self.expected (('iFolder', 1)), self.expected (('iFolder', 2))])
+
+
+
+if __name__ == '__main__':
+    unittest.main ()
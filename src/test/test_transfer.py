@@ -0,0 +1,294 @@
+#-*- coding: utf-8 -*-
+
+
+
+import sys
+import threading
+import time
+import unittest
+
+
+
+sys.path.append ('../')
+
+
+
+from core.config import ConfigManager
+from core.transfer import ChunkSizer, TransferPool, pipelined
+
+
+
+class TestChunkSizer (unittest.TestCase):
+
+
+
+    def sizer (self, Size, Adaptive=True, Minimum=1024, Maximum=65536):
+        return ChunkSizer (ConfigManager (
+                runfromtest=True, soapbuflen=Size, adaptive=Adaptive,
+                minsoapbuflen=Minimum, maxsoapbuflen=Maximum))
+
+
+
+    def test_fixed (self):
+        Sizer = self.sizer (100, Adaptive=False)
+
+        Sizer.record (100, 10.0)
+        Sizer.record (100, 0.001)
+
+        self.assertEquals (Sizer.Size, 100)
+
+
+
+    def test_initial_bounds (self):
+        self.assertEquals (self.sizer (100).Size, 1024)
+        self.assertEquals (self.sizer (1 << 20).Size, 65536)
+
+
+
+    def test_target_time (self):
+        Sizer = self.sizer (4096)
+        Sizer.record (4096, 0.8)
+
+        self.assertEquals (Sizer.Size, 5120)
+
+
+
+    def test_at_most_double_or_half (self):
+        Sizer = self.sizer (4096)
+
+        Sizer.record (4096, 0.01)
+        self.assertEquals (Sizer.Size, 8192)
+
+        Sizer.record (8192, 100.0)
+        self.assertEquals (Sizer.Size, 4096)
+
+        Sizer.record (4096, 0)
+        self.assertEquals (Sizer.Size, 8192)
+
+
+
+    def test_bounds (self):
+        Sizer = self.sizer (2048)
+
+        Sizer.record (2048, 100.0)
+        self.assertEquals (Sizer.Size, 1024)
+
+        for i in range (10):
+            Sizer.record (Sizer.Size, 0.001)
+
+        self.assertEquals (Sizer.Size, 65536)
+
+
+
+    def test_short_chunk_ignored (self):
+        Sizer = self.sizer (4096)
+        Sizer.record (100, 100.0)
+
+        self.assertEquals (Sizer.Size, 4096)
+
+
+
+## An iterable counting up to Limit, or endlessly, recording the
+## threads that consume it.
+
+class Counter:
+
+
+
+    def __init__ (self, Limit=None):
+        self.Limit = Limit
+        self.Count = 0
+        self.Threads = set ()
+
+
+
+    def __iter__ (self):
+        return self
+
+
+
+    def next (self):
+        self.Threads.add (threading.current_thread ())
+
+        if self.Count == self.Limit:
+            raise StopIteration
+
+        self.Count = self.Count + 1
+        return self.Count
+
+
+
+class TestPipelined (unittest.TestCase):
+
+
+
+    def test_order (self):
+        for Depth in range (4):
+            self.assertEquals (
+                list (pipelined (Counter (10), Depth)), range (1, 11))
+
+
+
+    def test_depth_zero (self):
+        Items = Counter (3)
+        list (pipelined (Items, 0))
+
+        self.assertEquals (Items.Threads, set ([threading.current_thread ()]))
+
+
+
+    def test_read_ahead (self):
+        Items = Counter ()
+        Pipeline = pipelined (Items, 2)
+
+        self.assertEquals (Pipeline.next (), 1)
+        time.sleep (0.2)
+
+        self.assertFalse (threading.current_thread () in Items.Threads)
+        self.assertTrue (3 <= Items.Count <= 4)
+
+        Pipeline.close ()
+
+
+
+    def test_close (self):
+        Items = Counter ()
+        Pipeline = pipelined (Items, 2)
+
+        Pipeline.next ()
+        Pipeline.close ()
+
+        Count = Items.Count
+        time.sleep (0.2)
+
+        self.assertEquals (Items.Count, Count)
+
+
+
+    def test_error (self):
+
+        def fail ():
+            yield 1
+            raise ValueError ('Producer failed')
+
+        Pipeline = pipelined (fail (), 2)
+
+        self.assertEquals (Pipeline.next (), 1)
+
+        try:
+
+            Pipeline.next ()
+            self.fail ()
+
+        except ValueError:
+            Traceback = sys.exc_info ()[2]
+
+            while Traceback.tb_next is not None:
+                Traceback = Traceback.tb_next
+
+            self.assertEquals (Traceback.tb_frame.f_code.co_name, 'fail')
+
+
+
+## A stand-in for the core.ifolderws.iFolderWS instance the
+## TransferPool hands to each transfer.
+
+class Session:
+
+
+
+    def clone (self):
+        return Session ()
+
+
+
+## The innermost function of the traceback of the exception being
+## handled.
+
+def innermost ():
+    Traceback = sys.exc_info ()[2]
+
+    while Traceback.tb_next is not None:
+        Traceback = Traceback.tb_next
+
+    return Traceback.tb_frame.f_code.co_name
+
+
+
+def transfer (ifolderws, Key):
+    if Key == 'fail':
+        raise ValueError ('Transfer failed')
+
+    return Key
+
+
+
+class TestTransferPool (unittest.TestCase):
+
+
+
+    def pool (self, Workers):
+        return TransferPool (
+            ConfigManager (runfromtest=True), Session (), Workers)
+
+
+
+    def test_error_traceback (self):
+        for Workers in [1, 2]:
+            Pool = self.pool (Workers)
+
+            try:
+
+                Pool.submit ('fail', transfer, ['fail'])
+                Pool.join ()
+                self.fail ()
+
+            except ValueError:
+                self.assertEquals (innermost (), 'transfer')
+
+            Pool.stop ()
+
+
+
+    def test_handler_reraise (self):
+
+        def handle (Error):
+            raise
+
+        for Workers in [1, 2]:
+            Pool = self.pool (Workers)
+
+            try:
+
+                Pool.submit ('fail', transfer, ['fail'], handle)
+                Pool.submit ('ok', transfer, ['ok'], handle)
+                Pool.join ()
+                self.fail ()
+
+            except ValueError:
+                self.assertEquals (innermost (), 'transfer')
+
+            self.assertEquals (Pool.Failures, 1)
+            Pool.stop ()
+
+
+
+    def test_handler (self):
+        Handled = []
+        Pool = self.pool (2)
+
+        Pool.submit ('fail', transfer, ['fail'], Handled.append)
+        Pool.submit ('ok', transfer, ['ok'], Handled.append)
+        Pool.then ('ok', Handled.append, 'done')
+        Pool.join ()
+        Pool.stop ()
+
+        self.assertEquals (len (Handled), 2)
+        self.assertTrue ('done' in Handled)
+        self.assertTrue (
+            any (isinstance (Error, ValueError) for Error in Handled))
+
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,96 @@
+#-*- coding: utf-8 -*-
+
+
+
+import socket
+import sys
+import time
+import unittest
+
+
+
+sys.path.append ('../')
+
+
+
+from core.transport import ConnectionPool, KeepAliveTransport
+from suds.transport import Request
+
+
+
+from fakeserver import *
+
+
+
+IDLE_TIMEOUT = 0.2
+CLIENT_TIMEOUT = 0.5
+
+
+
+class TestTransport (unittest.TestCase):
+
+
+
+    def setUp (self):
+        self.pool = ConnectionPool (2, 60)
+        self.transport = KeepAliveTransport (
+            pool=self.pool, username='user', password='password')
+        self.transport.options.timeout = CLIENT_TIMEOUT
+        self.server = None
+
+
+
+    def tearDown (self):
+        self.pool.close ()
+
+        if self.server is not None:
+            self.server.stop ()
+
+
+
+    def send (self):
+        return self.transport.send (
+            Request (self.server.get_location (), envelope ('')))
+
+
+
+    def test_idle_connection_closed (self):
+        self.server = FakeServer (idle=IDLE_TIMEOUT)
+
+        self.send ()
+        time.sleep (IDLE_TIMEOUT * 3)
+        Reply = self.send ()
+
+        self.assertEquals (Reply.message, envelope (''))
+        self.assertEquals (len (self.server.requests), 2)
+
+
+
+    def test_timeout_not_retried (self):
+
+        def reply (Request):
+            if len (self.server.requests) > 1:
+                time.sleep (CLIENT_TIMEOUT * 2)
+
+            return 200, envelope ('')
+
+        self.server = FakeServer (reply=reply)
+
+        self.send ()
+        self.assertRaises (socket.timeout, self.send)
+
+        time.sleep (CLIENT_TIMEOUT * 3)
+        self.assertEquals (len (self.server.requests), 2)
+
+
+
+    def test_no_reply_on_new_connection (self):
+        self.server = FakeServer (reply=lambda Request : None)
+
+        self.assertRaises (Exception, self.send)
+        self.assertEquals (len (self.server.requests), 1)
+
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,380 @@
+#-*- coding: utf-8 -*-
+
+
+
+import StringIO
+import base64
+import binascii
+import datetime
+import os
+import sys
+import unittest
+
+
+
+sys.path.append ('../')
+
+
+
+from core.ifolderws import iFolderWS
+from core.unmarshal import Base64Stream, FastUnmarshaller, Record
+from core.unmarshal import Unsupported
+from suds import WebFault
+from suds.sax.text import Text
+from suds.sudsobject import Object
+
+
+
+from fakeserver import *
+
+
+
+CHANGE_ENTRY = \
+    '<ChangeEntry>' \
+    '<Time>2012-01-0{0}T10:00:00</Time>' \
+    '<Type>{1}</Type>' \
+    '<Action>Add</Action>' \
+    '<ID>{0}</ID>' \
+    '<Name>{2}</Name>' \
+    '<Size>{3}</Size>' \
+    '<IsDirectory>{4}</IsDirectory>' \
+    '{5}' \
+    '</ChangeEntry>'
+
+CHANGES = \
+    '<GetChangesResponse xmlns="urn:fake"><GetChangesResult>' \
+    '<Items>{0}</Items><Total>{1}</Total>' \
+    '</GetChangesResult></GetChangesResponse>'
+
+READ_FILE = \
+    '<ReadFileResponse xmlns="urn:fake">{0}</ReadFileResponse>'
+
+READ_FILE_RESULT = '<ReadFileResult{0}>{1}</ReadFileResult>'
+
+NIL = ' xsi:nil="true"'
+
+
+
+## Build a GetChanges reply listing the given ChangeEntry elements.
+
+def changes (*EntryList):
+    return envelope (CHANGES.format (''.join (EntryList), len (EntryList)))
+
+
+
+## Build a ReadFile reply returning the given base64 encoded data.
+
+def read_file (Base64Data, Attributes=''):
+    return envelope (READ_FILE.format (
+            READ_FILE_RESULT.format (Attributes, Base64Data)))
+
+
+
+## Turn an unmarshalled reply into plain lists and tuples, so that the
+## results of suds and of the FastUnmarshaller can be compared.
+
+def dump (Value):
+    if isinstance (Value, list):
+        return [dump (x) for x in Value]
+
+    if isinstance (Value, (Object, Record)):
+        return sorted ([(Name, dump (Child)) for Name, Child in Value])
+
+    return Value
+
+
+
+class TestFastUnmarshaller (unittest.TestCase):
+
+
+
+    def setUp (self):
+        self.server = FakeServer (reply=self.reply)
+        self.Reply = (200, envelope (''))
+        self.ifolderws = iFolderWS (self.server.get_config ())
+        self.client = self.ifolderws.client
+        self.method = self.client.service.GetChanges.method
+
+
+
+    def tearDown (self):
+        self.server.stop ()
+
+
+
+    def reply (self, Request):
+        return self.Reply
+
+
+
+    def get_reply (self, Reply, Lean=False):
+        Root, Expected = self.method.binding.output.get_reply (
+            self.method, Reply)
+        Result = FastUnmarshaller (self.client, Lean).unmarshal (
+            self.method, Reply)
+
+        self.assertEquals (dump (Result), dump (Expected))
+
+        return Result
+
+
+
+    def test_parity (self):
+        Result = self.get_reply (changes (
+                CHANGE_ENTRY.format (
+                    1, 'Directory', 'F/D', 0, 'true', '<Note>n</Note>'),
+                CHANGE_ENTRY.format (
+                    2, 'File', u'F/D/\xe8 &amp; &lt;'.encode ('utf-8'),
+                    12345678901, 'false', '')))
+
+        Entry = Result.Items.ChangeEntry[1]
+
+        self.assertTrue (isinstance (Entry.Name, Text))
+        self.assertEquals (Entry.Name, u'F/D/\xe8 & <')
+        self.assertEquals (Entry.Size, 12345678901)
+        self.assertEquals (Entry.IsDirectory, False)
+        self.assertEquals (Entry.Time, datetime.datetime (2012, 1, 2, 10))
+        self.assertFalse ('Note' in Entry)
+
+
+
+    def test_single_item (self):
+        Result = self.get_reply (changes (
+                CHANGE_ENTRY.format (1, 'File', 'F/f', 1, 'false', '')))
+
+        self.assertEquals (len (Result.Items.ChangeEntry), 1)
+
+
+
+    def test_nil (self):
+        Result = self.get_reply (changes (
+                CHANGE_ENTRY.format (
+                    1, 'File', '', 1, 'false', '<Note{0}/>'.format (NIL)),
+                '<ChangeEntry{0}/>'.format (NIL),
+                CHANGE_ENTRY.format (
+                    3, 'File', 'F/f', 1, 'false', '<Note/>')))
+
+        self.assertEquals (Result.Items.ChangeEntry[0].Note, None)
+        self.assertEquals (Result.Items.ChangeEntry[1], None)
+        self.assertEquals (Result.Items.ChangeEntry[2].Note, None)
+
+
+
+    def test_empty (self):
+        self.get_reply (changes ())
+        self.get_reply (envelope (
+                '<GetChangesResponse xmlns="urn:fake"/>'))
+
+
+
+    def test_lean (self):
+        Result = self.get_reply (changes (
+                CHANGE_ENTRY.format (
+                    1, 'Directory', 'F/D', 0, 'true', '<Note>n</Note>'),
+                '<ChangeEntry{0}/>'.format (NIL),
+                CHANGE_ENTRY.format (
+                    3, 'File', 'F/D/f', 1, 'false', '')), Lean=True)
+
+        Entry = Result.Items.ChangeEntry[2]
+
+        self.assertTrue (isinstance (Result, Record))
+        self.assertFalse (hasattr (Entry, '__dict__'))
+        self.assertTrue (type (Entry.Name) is unicode)
+        self.assertEquals (Entry.Name, u'F/D/f')
+        self.assertEquals (Entry.Size, 1)
+        self.assertFalse ('Note' in Entry)
+        self.assertRaises (AttributeError, getattr, Entry, 'Note')
+        self.assertEquals (Result.Items.ChangeEntry[0].Note, u'n')
+        self.assertEquals (Result.Items.ChangeEntry[1], None)
+        self.assertTrue (repr (Entry).startswith ('(ChangeEntry){ '))
+
+
+
+    def test_lean_invoke (self):
+        self.Reply = (200, changes (
+                CHANGE_ENTRY.format (1, 'File', 'F/f', 1, 'false', '')))
+
+        Unmarshaller = FastUnmarshaller (self.client, Lean=True)
+
+        self.assertEquals (
+            dump (Unmarshaller.invoke ('GetChanges', 'iFolder', 1)),
+            dump (self.client.service.GetChanges ('iFolder', 1)))
+
+
+
+    def test_unsupported (self):
+        Unmarshaller = FastUnmarshaller (self.client)
+
+        self.assertRaises (
+            Unsupported, Unmarshaller.unmarshal, self.method,
+            fault ('Failed'))
+        self.assertRaises (
+            Unsupported, Unmarshaller.unmarshal, self.method,
+            changes ('<Unknown/>'))
+        self.assertRaises (
+            Unsupported, Unmarshaller.unmarshal, self.method,
+            changes ('<ChangeEntry xsi:type="Other"/>'))
+        self.assertRaises (
+            Unsupported, Unmarshaller.unmarshal, self.method,
+            '<soap:Envelope')
+
+
+
+    def test_invoke (self):
+        self.Reply = (200, changes (
+                CHANGE_ENTRY.format (1, 'File', 'F/f', 1, 'false', '')))
+
+        self.assertEquals (
+            dump (self.ifolderws.unmarshaller.invoke (
+                    'GetChanges', 'iFolder', 1)),
+            dump (self.client.service.GetChanges ('iFolder', 1)))
+
+
+
+    def test_invoke_fallback (self):
+        self.Reply = (200, changes (
+                '<ChangeEntry xsi:type="ChangeEntry"><ID>1</ID>' \
+                    '</ChangeEntry>'))
+
+        self.assertEquals (
+            dump (self.ifolderws.unmarshaller.invoke (
+                    'GetChanges', 'iFolder', 1)),
+            dump (self.client.service.GetChanges ('iFolder', 1)))
+
+
+
+    def test_invoke_fault (self):
+        self.Reply = (500, fault ('Failed'))
+
+        self.assertRaises (
+            WebFault, self.ifolderws.unmarshaller.invoke,
+            'GetChanges', 'iFolder', 1)
+
+
+
+class TestBase64Stream (unittest.TestCase):
+
+
+
+    def setUp (self):
+        self.Reply = (200, read_file (''))
+        self.server = FakeServer (reply=lambda Request : self.Reply)
+        self.ifolderws = iFolderWS (self.server.get_config ())
+
+
+
+    def tearDown (self):
+        self.server.stop ()
+
+
+
+    ## Feed the given reply to a Base64Stream, in blocks of the given
+    ## size.
+    #
+    #  @return A tuple (Stream, Reply, Data), where Reply is what
+    #          Base64Stream.close returned, and Data the decoded data.
+
+    def stream (self, Reply, BlockSize):
+        File = StringIO.StringIO ()
+        Stream = Base64Stream (File, 4)
+
+        for i in range (0, len (Reply), BlockSize):
+            Stream.feed (Reply[i:i + BlockSize])
+
+        return Stream, Stream.close (), File.getvalue ()
+
+
+
+    def test_blocks (self):
+        Data = os.urandom (5000)
+        Reply = read_file (base64.encodestring (Data))
+
+        for BlockSize in [1, 2, 3, 5, 7, 4096, len (Reply)]:
+            Stream, Rest, Decoded = self.stream (Reply, BlockSize)
+
+            self.assertEquals (Rest, None)
+            self.assertEquals (Decoded, Data)
+            self.assertEquals (Stream.Length, len (Data))
+            self.assertFalse (Stream.Nil)
+
+
+
+    def test_malformed (self):
+        for Base64Data in ['QUJD RA==', 'QU!JD\tRA==', 'QQ==QUJD', 'QUJ=QUJD',
+                           '=QUJD', 'QQ=A=QUJD', '\xc3\xa8QUJD', '']:
+            Expected = binascii.a2b_base64 (Base64Data)
+
+            for BlockSize in [1, 2, 3, 100]:
+                Stream, Rest, Decoded = self.stream (
+                    read_file (Base64Data), BlockSize)
+
+                self.assertEquals (Decoded, Expected)
+
+
+
+    def test_short (self):
+        for Base64Data in ['QUJDR', 'QUJDRA', 'QQ=', 'Q===']:
+            self.assertRaises (
+                binascii.Error, binascii.a2b_base64, Base64Data)
+
+            for BlockSize in [1, 2, 3, 100]:
+                self.assertRaises (
+                    binascii.Error, self.stream, read_file (Base64Data),
+                    BlockSize)
+
+
+
+    def test_nil (self):
+        Stream, Rest, Decoded = self.stream (read_file ('', NIL), 3)
+
+        self.assertEquals (Rest, None)
+        self.assertTrue (Stream.Nil)
+
+
+
+    def test_not_found (self):
+        for Reply in [envelope (READ_FILE.format ('')), fault ('Failed')]:
+            Stream, Rest, Decoded = self.stream (Reply, 3)
+
+            self.assertEquals (Rest, Reply)
+            self.assertEquals (Decoded, '')
+
+        self.assertEquals (Base64Stream (StringIO.StringIO (), 4).close (), '')
+
+
+
+    def decode_into (self):
+        File = StringIO.StringIO ()
+        Length = self.ifolderws.unmarshaller.decode_into (
+            'ReadFile', File, 'Handle', 4096)
+
+        return Length, File.getvalue ()
+
+
+
+    def test_decode_into (self):
+        Data = os.urandom (200000)
+
+        self.Reply = (200, read_file (base64.encodestring (Data)))
+        self.assertEquals (self.decode_into (), (len (Data), Data))
+
+        for Reply in [read_file (''), read_file ('', NIL),
+                      envelope (READ_FILE.format (''))]:
+            self.Reply = (200, Reply)
+
+            self.assertEquals (
+                self.ifolderws.client.service.ReadFile ('Handle', 4096),
+                None)
+            self.assertEquals (self.decode_into (), (None, ''))
+
+
+
+    def test_decode_into_fault (self):
+        self.Reply = (500, fault ('Failed'))
+
+        self.assertRaises (WebFault, self.decode_into)
+
+
+
+if __name__ == '__main__':
+    unittest.main ()
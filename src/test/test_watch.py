@@ -0,0 +1,389 @@
+#-*- coding: utf-8 -*-
+
+
+
+import logging
+import new
+import os
+import StringIO
+import shutil
+import sys
+import tempfile
+import unittest
+
+
+
+sys.path.append ('../')
+
+
+
+from pyFolder import *
+from core.dbm import DBM
+from core.watch import Watcher
+
+
+
+## Raised by the fake synchronization actions to leave the watch loop.
+
+class Stop (Exception):
+    pass
+
+
+
+## The file descriptors currently open by the process.
+
+def open_fds ():
+    return set (os.listdir ('/proc/self/fd'))
+
+
+
+@unittest.skipUnless (sys.platform.startswith ('linux'), 'needs inotify')
+class TestWatcher (unittest.TestCase):
+
+
+
+    def setUp (self):
+        self.Root = tempfile.mkdtemp ()
+        self.watcher = Watcher ()
+        self.watcher.add (self.Root)
+
+
+
+    def tearDown (self):
+        self.watcher.close ()
+        shutil.rmtree (self.Root, True)
+
+
+
+    def path (self, *args):
+        return os.path.join (self.Root, *args)
+
+
+
+    def touch (self, *args):
+        with open (self.path (*args), 'wb') as File:
+            File.write ('data')
+
+
+
+    def test_timeout (self):
+        self.assertEquals (self.watcher.read (0.1), set ())
+
+
+
+    def test_file (self):
+        self.touch ('f')
+
+        self.assertEquals (self.watcher.read (1), set ([self.path ('f')]))
+
+        os.remove (self.path ('f'))
+
+        self.assertEquals (self.watcher.read (1), set ([self.path ('f')]))
+
+
+
+    def test_new_directory (self):
+        os.mkdir (self.path ('d'))
+
+        self.assertEquals (self.watcher.read (1), set ([self.path ('d')]))
+
+        self.touch ('d', 'f')
+
+        self.assertEquals (
+            self.watcher.read (1), set ([self.path ('d', 'f')]))
+
+
+
+    def test_moved_directory (self):
+        os.mkdir (self.path ('d'))
+        self.watcher.read (1)
+
+        Outside = tempfile.mkdtemp ()
+
+        try:
+
+            os.rename (self.path ('d'), os.path.join (Outside, 'd'))
+
+            self.assertEquals (self.watcher.read (1), set ([self.path ('d')]))
+            self.assertFalse (self.path ('d') in self.watcher.Paths.values ())
+
+            with open (os.path.join (Outside, 'd', 'f'), 'wb') as File:
+                File.write ('data')
+
+            self.assertEquals (self.watcher.read (0.1), set ())
+
+        finally:
+            shutil.rmtree (Outside, True)
+
+
+
+    def test_close (self):
+        Watched = Watcher ()
+        Fds = open_fds ()
+        Watched.close ()
+
+        self.assertEquals (len (Fds - open_fds ()), 1)
+
+
+
+## A pyFolder instance with a local database, and no connection to an
+## iFolder server.
+
+class pyFolderTestCase (unittest.TestCase):
+
+
+
+    def setUp (self):
+        self.Root = tempfile.mkdtemp ()
+        self.cm = ConfigManager (
+            runfromtest=True, username='user', prefix=self.Root,
+            pathtodb=os.path.join (self.Root, 'pyFolder.db'), interval=60,
+            debounce=0.1)
+
+        self.pyFolder = new.instance (pyFolder)
+        self.pyFolder.cm = self.cm
+        self.pyFolder.logger = logging.getLogger (self.__class__.__name__)
+        self.pyFolder.logger.setLevel (logging.ERROR)
+        self.pyFolder.snapshot = None
+        self.pyFolder.local_changes = {}
+        self.pyFolder.dbm = DBM (self.cm)
+        self.pyFolder.dbm.create_schema ()
+
+        for Name in ['A', 'B']:
+            os.mkdir (os.path.join (self.Root, Name))
+            self.pyFolder.dbm.add_ifolder (Name, None, Name, Name + 'Entry')
+
+        self.Commits = []
+        self.Failing = set ()
+        self.pyFolder._pyFolder__commit_ifolder = self.commit_ifolder
+
+
+
+    def tearDown (self):
+        self.pyFolder.dbm = None
+        shutil.rmtree (self.Root, True)
+
+
+
+    ## Record the commit of an iFolder, as pyFolder.__commit_ifolder
+    ## would, unless the iFolder is listed in self.Failing.
+
+    def commit_ifolder (self, iFolderID, Name, PathList=None,
+                        JournalIDList=[]):
+        if iFolderID in self.Failing:
+            raise IOError ('Could not upload')
+
+        self.Commits.append ((iFolderID, sorted (PathList)))
+        self.pyFolder.dbm.complete_journal_entries (JournalIDList)
+
+
+
+    def journal (self):
+        return sorted (
+            [x['path'] for x in self.pyFolder.dbm.get_journal_entries ()])
+
+
+
+class TestReplayJournal (pyFolderTestCase):
+
+
+
+    def test_replay (self):
+        self.pyFolder.dbm.add_journal_entries (
+            ['A/x', 'A', 'B/y', 'B/z/w', 'C/z'])
+        self.pyFolder.replay_journal ()
+
+        self.assertEquals (
+            self.Commits, [('A', ['A']), ('B', ['B/y', 'B/z/w'])])
+        self.assertEquals (self.journal (), [])
+
+
+
+    def test_empty (self):
+        self.pyFolder.replay_journal ()
+
+        self.assertEquals (self.Commits, [])
+
+
+
+    def test_failed (self):
+        self.pyFolder.dbm.add_journal_entries (['A/x', 'B/y'])
+        self.Failing.add ('B')
+
+        self.assertRaises (IOError, self.pyFolder.replay_journal)
+        self.assertEquals (self.Commits, [('A', ['A/x'])])
+        self.assertEquals (self.journal (), ['B/y'])
+
+        self.Failing.clear ()
+        self.pyFolder.replay_journal ()
+
+        self.assertEquals (self.Commits, [('A', ['A/x']), ('B', ['B/y'])])
+        self.assertEquals (self.journal (), [])
+
+
+
+@unittest.skipUnless (sys.platform.startswith ('linux'), 'needs inotify')
+class TestWatch (pyFolderTestCase):
+
+
+
+    def setUp (self):
+        pyFolderTestCase.setUp (self)
+
+        self.Updates = 0
+        self.Actions = []
+        self.pyFolder.update = self.update
+        self.pyFolder.commit = self.commit
+
+
+
+    def update (self):
+        self.Updates = self.Updates + 1
+
+        if len (self.Actions) > 0:
+            self.Actions.pop (0) ()
+
+
+
+    def commit (self):
+        raise Stop ()
+
+
+
+    ## Run the watch loop, invoking each of the given callables after a
+    ## replay of the journal, and stopping after the last one.
+
+    def watch (self, *args):
+        Replay = self.pyFolder.replay_journal
+        Actions = list (args)
+
+        def replay_journal ():
+            try:
+
+                Replay ()
+
+            finally:
+
+                if len (Actions) == 0:
+                    raise Stop ()
+
+                Actions.pop (0) ()
+
+        self.pyFolder.replay_journal = replay_journal
+
+        Fds = open_fds ()
+
+        self.assertRaises (Stop, self.pyFolder.watch)
+        self.assertEquals (open_fds (), Fds)
+
+
+
+    def touch (self, *args):
+        with open (os.path.join (self.Root, *args), 'wb') as File:
+            File.write ('data')
+
+
+
+    ## Each iFolder is committed whole once it starts being watched,
+    ## then only the paths changed within it.
+
+    def test_debounce (self):
+        self.watch (
+            lambda : None,
+            lambda : (self.touch ('A', 'f'), self.touch ('A', 'g')))
+
+        self.assertEquals (self.Commits, [
+                ('A', ['A']), ('B', ['B']), ('A', ['A/f', 'A/g'])])
+        self.assertEquals (self.journal (), [])
+        self.assertEquals (self.Updates, 1)
+
+
+
+    ## A local error raised by a commit is logged, the changes are left
+    ## in the journal and committed on the next attempt.
+
+    def test_commit_error (self):
+        self.Failing.add ('B')
+
+        self.watch (
+            lambda : None,
+            lambda : (self.Failing.clear (), self.touch ('A', 'f')))
+
+        self.assertEquals (self.Commits, [
+                ('A', ['A']), ('A', ['A/f']), ('B', ['B'])])
+        self.assertEquals (self.journal (), [])
+
+
+
+    ## An error raised by an update doesn't stop the watch loop.
+
+    def test_update_error (self):
+
+        def fail ():
+            raise OSError ('Could not stat')
+
+        self.Actions.append (fail)
+        self.watch (lambda : None)
+
+        self.assertEquals (self.Commits, [('A', ['A']), ('B', ['B'])])
+
+
+
+    ## The watcher is closed when the loop is left.
+
+    def test_close (self):
+        self.Actions.append (self.commit)
+        self.watch ()
+
+        self.assertEquals (self.Commits, [])
+
+
+
+    ## Watching without a local database exits with an explanation,
+    ## as the other actions do.
+
+    def test_no_database (self):
+        self.pyFolder.dbm = DBM (ConfigManager (
+                runfromtest=True, username='user',
+                pathtodb=os.path.join (self.Root, 'empty.db')))
+
+        Stderr = sys.stderr
+        sys.stderr = StringIO.StringIO ()
+
+        try:
+
+            self.assertRaises (SystemExit, self.pyFolder.watch)
+            Message = sys.stderr.getvalue ()
+
+        finally:
+            sys.stderr = Stderr
+
+        self.assertTrue (Message.startswith ('Could not open'))
+
+
+
+    ## Without the watcher, the whole repository is committed on each
+    ## interval.
+
+    def test_no_watcher (self):
+        Watch = sys.modules['core.watch']
+        Constructor = Watch.Watcher
+
+        def unavailable ():
+            raise OSError ('inotify is not available')
+
+        Watch.Watcher = unavailable
+
+        try:
+
+            self.assertRaises (Stop, self.pyFolder.watch)
+
+        finally:
+            Watch.Watcher = Constructor
+
+        self.assertEquals (self.Updates, 1)
+
+
+
+if __name__ == '__main__':
+    unittest.main ()